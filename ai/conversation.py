@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Memoria della conversazione di una chiamata, entro un budget di token
+"""
+import logging
+from collections import deque
+from typing import Deque, List, Tuple
+
+from config import CONVERSATION_TOKEN_BUDGET, CONVERSATION_SUMMARY_TOKENS
+from ai.providers import Messages
+
+# Token aggiuntivi per ogni messaggio (ruolo e separatori del formato chat)
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_PREFIX = "Riassunto di quanto detto in precedenza dal cliente:"
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima dei token di un testo: circa 4 caratteri per token in italiano e inglese"""
+    return (len(text) + 3) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+
+class ConversationMemory:
+    """
+    Cronologia dei turni di una chiamata. Ogni richiesta all'LLM resta entro
+    token_budget: i turni più vecchi escono per primi dalla cronologia e le frasi
+    del cliente confluiscono in un riassunto, anch'esso limitato, dove a loro
+    volta le più vecchie vengono scartate per prime.
+    """
+
+    def __init__(self, token_budget: int = CONVERSATION_TOKEN_BUDGET,
+                 summary_tokens: int = CONVERSATION_SUMMARY_TOKENS):
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self._turns: Deque[Tuple[str, str]] = deque()  # (cliente, assistente)
+        self._summary: Deque[str] = deque()
+        self.compacted_turns = 0
+
+    def add_turn(self, user_text: str, assistant_text: str):
+        """Registra un turno concluso"""
+        if user_text and assistant_text:
+            self._turns.append((user_text, assistant_text))
+
+    def build_messages(self, system_prompt: str, user_text: str) -> Messages:
+        """Messaggi per l'LLM: prompt, riassunto, turni recenti e nuova frase del cliente"""
+        available = self.token_budget - estimate_tokens(system_prompt) - estimate_tokens(user_text)
+        history_tokens = sum(self._turn_tokens(turn) for turn in self._turns)
+        while self._turns and history_tokens + self._summary_cost() > available:
+            turn = self._turns.popleft()
+            history_tokens -= self._turn_tokens(turn)
+            self._compact(turn)
+
+        messages = [{"role": "system", "content": system_prompt}]
+        if self._summary and self._summary_cost() <= available:
+            messages.append({"role": "system", "content": self.summary()})
+        for user, assistant in self._turns:
+            messages.append({"role": "user", "content": user})
+            messages.append({"role": "assistant", "content": assistant})
+        messages.append({"role": "user", "content": user_text})
+        return messages
+
+    def summary(self) -> str:
+        return " ".join([SUMMARY_PREFIX, *self._summary])
+
+    def _compact(self, turn: Tuple[str, str]):
+        """Sposta un turno nel riassunto, mantenendolo entro summary_tokens"""
+        self._summary.append(turn[0])
+        self.compacted_turns += 1
+        while self._summary and self._summary_cost() > self.summary_tokens:
+            self._summary.popleft()
+        logging.info(f"Memoria conversazione: {self.compacted_turns} turni compattati nel riassunto.")
+
+    def _summary_cost(self) -> int:
+        return estimate_tokens(self.summary()) if self._summary else 0
+
+    @staticmethod
+    def _turn_tokens(turn: Tuple[str, str]) -> int:
+        return estimate_tokens(turn[0]) + estimate_tokens(turn[1])
+
+    def turns(self) -> List[Tuple[str, str]]:
+        return list(self._turns)
+
+    def __len__(self) -> int:
+        return len(self._turns)
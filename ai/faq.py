@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Risposte rapide alle domande frequenti (orari, indirizzo) direttamente dai dati del ristorante,
+senza passare dall'LLM
+"""
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from config import FAQ_MIN_SCORE, FAQ_MAX_WORDS, FAQ_HOURS_TEMPLATE, FAQ_ADDRESS_TEMPLATE
+
+INTENT_HOURS = "orari"
+INTENT_ADDRESS = "indirizzo"
+
+# Parole (senza accenti) che indicano un intento, con il loro peso
+_INTENT_WORDS: Dict[str, Dict[str, float]] = {
+    INTENT_HOURS: {
+        "orari": 2, "orario": 2, "apertura": 2, "aperti": 2, "aperto": 2, "aprite": 2, "apre": 2,
+        "chiudete": 2, "chiude": 2, "chiusura": 2, "chiusi": 1.5, "chiuso": 1.5, "ora": 0.5, "quando": 0.5,
+    },
+    INTENT_ADDRESS: {
+        "indirizzo": 2, "dove": 1, "trovate": 1, "trova": 1, "siete": 0.5, "arrivare": 1, "arrivo": 1,
+        "raggiungervi": 2, "zona": 1, "via": 0.5,
+    },
+}
+
+# Frasi intere, più affidabili delle singole parole
+_INTENT_PHRASES: Dict[str, Dict[str, float]] = {
+    INTENT_HOURS: {"a che ora": 2, "che orari": 2, "fino a che ora": 2, "siete aperti": 2, "siete chiusi": 2},
+    INTENT_ADDRESS: {"dove siete": 2, "dove vi trovate": 2, "dove si trova": 2, "come si arriva": 2,
+                     "come arrivo": 2, "in che via": 2},
+}
+
+# Parole che indicano una richiesta che la risposta rapida non copre: si passa all'LLM
+_FALLBACK_WORDS = frozenset({
+    "prenotare", "prenotazione", "prenoto", "prenotarmi", "prenota", "tavolo", "tavoli", "persone",
+    "menu", "piatto", "piatti", "prezzo", "prezzi", "costa", "allergia", "allergie", "allergico",
+    "glutine", "celiaco", "vegano", "vegetariano", "asporto", "consegna", "domicilio", "disdire",
+    "cancellare", "annullare", "parlare", "operatore", "responsabile", "parcheggio", "cani",
+})
+
+_WORD = re.compile(r"[a-z]+")
+
+
+def normalize(text: str) -> str:
+    """Minuscole senza accenti né punteggiatura"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return " ".join(_WORD.findall("".join(c for c in text if not unicodedata.combining(c))))
+
+
+@dataclass(frozen=True)
+class FaqMatch:
+    """Risposta rapida trovata per una frase del cliente"""
+    intents: Tuple[str, ...]
+    answer: str
+    score: float
+
+
+class FaqIndex:
+    """Indice delle risposte rapide di un ristorante: solo gli intenti con dati disponibili"""
+
+    def __init__(self, answers: Dict[str, str]):
+        self.answers = answers
+        self.intents: FrozenSet[str] = frozenset(answers)
+        self._words = {
+            word: (intent, weight)
+            for intent in self.intents
+            for word, weight in _INTENT_WORDS[intent].items()
+        }
+        self._phrases = [
+            (f" {phrase} ", intent, weight)
+            for intent in self.intents
+            for phrase, weight in _INTENT_PHRASES[intent].items()
+        ]
+
+    @classmethod
+    def for_restaurant(cls, restaurant: Dict[str, Any]) -> "FaqIndex":
+        answers = {}
+        if restaurant.get('orari_apertura'):
+            answers[INTENT_HOURS] = FAQ_HOURS_TEMPLATE.format(orari_apertura=restaurant['orari_apertura'])
+        if restaurant.get('indirizzo'):
+            answers[INTENT_ADDRESS] = FAQ_ADDRESS_TEMPLATE.format(indirizzo=restaurant['indirizzo'])
+        return cls(answers)
+
+    def match(self, transcript: str) -> Optional[FaqMatch]:
+        """Risposta rapida se la frase riguarda solo orari e/o indirizzo, altrimenti None"""
+        if not self.intents:
+            return None
+        text = normalize(transcript)
+        words = text.split()
+        if not words or len(words) > FAQ_MAX_WORDS:
+            return None
+
+        scores: Dict[str, float] = {}
+        for word in words:
+            if word in _FALLBACK_WORDS:
+                return None
+            hit = self._words.get(word)
+            if hit is not None:
+                scores[hit[0]] = scores.get(hit[0], 0.0) + hit[1]
+        padded = f" {text} "
+        for phrase, intent, weight in self._phrases:
+            if phrase in padded:
+                scores[intent] = scores.get(intent, 0.0) + weight
+
+        matched = tuple(intent for intent in self.answers if scores.get(intent, 0.0) >= FAQ_MIN_SCORE)
+        if not matched:
+            return None
+        return FaqMatch(
+            intents=matched,
+            answer=" ".join(self.answers[intent] for intent in matched),
+            score=min(scores[intent] for intent in matched),
+        )
+
+
+class FaqMatcher:
+    """Indici delle risposte rapide per ristorante, ricostruiti quando i dati cambiano"""
+
+    def __init__(self):
+        self._indexes: Dict[str, Tuple[Tuple[Any, Any], FaqIndex]] = {}
+
+    def index_for(self, restaurant: Dict[str, Any]) -> FaqIndex:
+        numero = restaurant['numero_twilio']
+        version = (restaurant.get('orari_apertura'), restaurant.get('indirizzo'))
+        cached = self._indexes.get(numero)
+        if cached is None or cached[0] != version:
+            cached = self._indexes[numero] = (version, FaqIndex.for_restaurant(restaurant))
+        return cached[1]
+
+    def match(self, restaurant: Optional[Dict[str, Any]], transcript: str) -> Optional[FaqMatch]:
+        if not restaurant or not transcript:
+            return None
+        return self.index_for(restaurant).match(transcript)
+
+    def answers(self, restaurant: Dict[str, Any]) -> List[str]:
+        """Testi delle risposte rapide di un ristorante (per preparare l'audio in anticipo)"""
+        return list(self.index_for(restaurant).answers.values())
+
+    def forget(self, numeri: Optional[List[str]]):
+        if numeri is None:
+            self._indexes.clear()
+            return
+        for numero in numeri:
+            self._indexes.pop(numero, None)
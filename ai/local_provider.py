@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Provider AI locale e deterministico: trascrizioni e risposte predefinite, voce sintetica.
+Serve per misurare l'overhead della pipeline e per i test senza rete.
+"""
+import asyncio
+import itertools
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import AsyncIterator, List, Optional, Sequence
+
+import numpy as np
+
+from config import (
+    TTS_SAMPLE_RATE, TTS_STREAM_CHUNK_BYTES,
+    LOCAL_AI_STT_MS, LOCAL_AI_LLM_FIRST_TOKEN_MS, LOCAL_AI_LLM_TOKEN_MS, LOCAL_AI_TTS_FIRST_BYTE_MS,
+)
+from ai.providers import AIProviders, LanguageModel, Messages, SpeechToText, TextToSpeech
+
+TRASCRIZIONE = "Buonasera, vorrei sapere gli orari di apertura e dove vi trovate."
+RISPOSTA = ("Certo! Siamo aperti dal martedì alla domenica, dalle 19:00 alle 23:00, "
+            "mentre il lunedì siamo chiusi. Ci trovi in Via Roma 123, a Milano. "
+            "Vuoi che ti prenoti un tavolo?")
+
+
+@dataclass
+class LocalLatency:
+    """Latenze artificiali del provider locale, in millisecondi"""
+    stt_ms: float = LOCAL_AI_STT_MS
+    llm_first_token_ms: float = LOCAL_AI_LLM_FIRST_TOKEN_MS
+    llm_token_ms: float = LOCAL_AI_LLM_TOKEN_MS
+    tts_first_byte_ms: float = LOCAL_AI_TTS_FIRST_BYTE_MS
+    tts_realtime_factor: float = 0.0  # 0 = sintesi istantanea, 4 = 4 volte più veloce del parlato
+    tts_ms_per_char: float = 65       # durata del parlato sintetizzato
+
+
+@lru_cache(maxsize=64)
+def synthetic_pcm(durata_ms: float) -> bytes:
+    """Voce sintetica deterministica a 24kHz"""
+    campioni = int(TTS_SAMPLE_RATE // 1000 * durata_ms)
+    t = np.arange(campioni) / TTS_SAMPLE_RATE
+    segnale = np.sin(2 * np.pi * 180 * t) + 0.4 * np.sin(2 * np.pi * 540 * t)
+    segnale *= 0.6 + 0.4 * np.sin(2 * np.pi * 3 * t)
+    return (6000 * segnale).astype(np.int16).tobytes()
+
+
+def split_tokens(testo: str) -> List[str]:
+    """Divide il testo in token di circa 4 caratteri, come un LLM"""
+    return [testo[i:i + 4] for i in range(0, len(testo), 4)]
+
+
+class LocalSpeechToText(SpeechToText):
+    """Restituisce a rotazione le trascrizioni predefinite"""
+
+    def __init__(self, latency: LocalLatency, transcripts: Sequence[str] = (TRASCRIZIONE,)):
+        self.latency = latency
+        self._transcripts = itertools.cycle(transcripts)
+
+    async def transcribe(self, wav: bytes) -> str:
+        await asyncio.sleep(self.latency.stt_ms / 1000)
+        return next(self._transcripts)
+
+
+class LocalLanguageModel(LanguageModel):
+    """Risponde sempre con lo stesso testo, token per token"""
+
+    def __init__(self, latency: LocalLatency, reply: str = RISPOSTA):
+        self.latency = latency
+        self.reply = reply
+
+    async def complete(self, messages: Messages) -> str:
+        tokens = split_tokens(self.reply)
+        await asyncio.sleep((self.latency.llm_first_token_ms + self.latency.llm_token_ms * len(tokens)) / 1000)
+        return self.reply
+
+    async def stream(self, messages: Messages) -> AsyncIterator[str]:
+        await asyncio.sleep(self.latency.llm_first_token_ms / 1000)
+        for token in split_tokens(self.reply):
+            yield token
+            await asyncio.sleep(self.latency.llm_token_ms / 1000)
+
+
+class LocalTextToSpeech(TextToSpeech):
+    """Sintetizza un tono modulato di durata proporzionale al testo"""
+
+    def __init__(self, latency: LocalLatency, chunk_bytes: int = TTS_STREAM_CHUNK_BYTES):
+        self.latency = latency
+        self.chunk_bytes = chunk_bytes
+
+    @property
+    def cache_namespace(self) -> str:
+        return f"local:{self.latency.tts_ms_per_char}"
+
+    async def synthesize(self, text: str) -> AsyncIterator[bytes]:
+        pcm = synthetic_pcm(self.latency.tts_ms_per_char * len(text))
+        chunk_s = self.chunk_bytes / 2 / TTS_SAMPLE_RATE
+        pausa = chunk_s / self.latency.tts_realtime_factor if self.latency.tts_realtime_factor else 0
+        await asyncio.sleep(self.latency.tts_first_byte_ms / 1000)
+        for i in range(0, len(pcm), self.chunk_bytes):
+            yield pcm[i:i + self.chunk_bytes]
+            # Anche senza latenza si cede il controllo, come farebbe un vero stream di rete
+            await asyncio.sleep(pausa)
+
+
+def create_local_providers(latency: Optional[LocalLatency] = None,
+                           transcripts: Sequence[str] = (TRASCRIZIONE,),
+                           reply: str = RISPOSTA) -> AIProviders:
+    latency = latency or LocalLatency()
+    return AIProviders(
+        name="local",
+        stt=LocalSpeechToText(latency, transcripts),
+        llm=LocalLanguageModel(latency, reply),
+        tts=LocalTextToSpeech(latency),
+    )
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Provider AI basato sulle API OpenAI (Whisper, chat completions, TTS)
+"""
+import io
+import logging
+from typing import AsyncIterator, Optional
+
+from openai import AsyncOpenAI
+
+from config import (
+    OPENAI_API_KEY, OPENAI_BASE_URL, TTS_STREAM_CHUNK_BYTES,
+    STT_MODEL, LLM_MODEL, LLM_TEMPERATURE, TTS_MODEL, TTS_VOICE,
+)
+from ai.providers import AIProviders, LanguageModel, Messages, SpeechToText, TextToSpeech
+from database.tenant_settings import TenantSettings
+
+
+class OpenAISpeechToText(SpeechToText):
+    def __init__(self, client: AsyncOpenAI, model: str = STT_MODEL):
+        self.client = client
+        self.model = model
+
+    async def transcribe(self, wav: bytes) -> str:
+        wav_buffer = io.BytesIO(wav)
+        wav_buffer.name = "user_speech.wav" # Nome fittizio per l'API
+        return await self.client.audio.transcriptions.create(
+            model=self.model,
+            file=wav_buffer,
+            response_format="text"
+        )
+
+    def with_settings(self, settings: TenantSettings) -> SpeechToText:
+        if settings.stt_model == self.model:
+            return self
+        return OpenAISpeechToText(self.client, settings.stt_model)
+
+
+class OpenAILanguageModel(LanguageModel):
+    def __init__(self, client: AsyncOpenAI, model: str = LLM_MODEL, temperature: float = LLM_TEMPERATURE):
+        self.client = client
+        self.model = model
+        self.temperature = temperature
+
+    async def complete(self, messages: Messages) -> str:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature
+        )
+        return response.choices[0].message.content
+
+    def with_settings(self, settings: TenantSettings) -> LanguageModel:
+        if (settings.llm_model, settings.llm_temperature) == (self.model, self.temperature):
+            return self
+        return OpenAILanguageModel(self.client, settings.llm_model, settings.llm_temperature)
+
+    async def stream(self, messages: Messages) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature,
+            stream=True
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class OpenAITextToSpeech(TextToSpeech):
+    def __init__(self, client: AsyncOpenAI, model: str = TTS_MODEL, voice: str = TTS_VOICE):
+        self.client = client
+        self.model = model
+        self.voice = voice
+
+    @property
+    def cache_namespace(self) -> str:
+        return f"openai:{self.model}:{self.voice}"
+
+    def with_settings(self, settings: TenantSettings) -> TextToSpeech:
+        if (settings.tts_model, settings.tts_voice) == (self.model, self.voice):
+            return self
+        return OpenAITextToSpeech(self.client, settings.tts_model, settings.tts_voice)
+
+    async def synthesize(self, text: str) -> AsyncIterator[bytes]:
+        async with self.client.audio.speech.with_streaming_response.create(
+            model=self.model,
+            voice=self.voice,
+            input=text,
+            response_format="pcm" # Chiediamo PCM per una conversione più facile
+        ) as speech_response:
+            async for chunk in speech_response.iter_bytes(TTS_STREAM_CHUNK_BYTES):
+                yield chunk
+
+
+def create_openai_providers() -> Optional[AIProviders]:
+    """Inizializza il client OpenAI solo se la chiave API è disponibile"""
+    if not (OPENAI_API_KEY and OPENAI_API_KEY.startswith("sk-")):
+        logging.warning("OPENAI_API_KEY non configurata o non valida. Le funzionalità AI non saranno disponibili.")
+        return None
+
+    client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+    logging.info("Client OpenAI inizializzato.")
+    return AIProviders(
+        name="openai",
+        stt=OpenAISpeechToText(client),
+        llm=OpenAILanguageModel(client),
+        tts=OpenAITextToSpeech(client),
+    )
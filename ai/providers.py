@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Interfacce dei provider AI (STT, LLM, TTS) e selezione del backend
+"""
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional
+
+from config import AI_PROVIDER
+from database.tenant_settings import TenantSettings
+
+Messages = List[Dict[str, str]]
+
+# Combinazioni di impostazioni dei ristoranti con i provider già pronti
+MAX_SETTINGS_VARIANTS = 256
+
+
+class SpeechToText(ABC):
+    """Trascrizione dell'audio del chiamante"""
+
+    @abstractmethod
+    async def transcribe(self, wav: bytes) -> str:
+        """Trascrive un file WAV (PCM 16-bit mono) in testo"""
+
+    def with_settings(self, settings: TenantSettings) -> "SpeechToText":
+        """Istanza con il modello del ristorante; senza modelli configurabili è la stessa"""
+        return self
+
+
+class LanguageModel(ABC):
+    """Generazione della risposta testuale"""
+
+    @abstractmethod
+    async def complete(self, messages: Messages) -> str:
+        """Genera la risposta completa"""
+
+    @abstractmethod
+    def stream(self, messages: Messages) -> AsyncIterator[str]:
+        """Genera la risposta in streaming, un frammento di testo alla volta"""
+
+    def with_settings(self, settings: TenantSettings) -> "LanguageModel":
+        """Istanza con modello e temperatura del ristorante; senza modelli configurabili è la stessa"""
+        return self
+
+
+class TextToSpeech(ABC):
+    """Sintesi vocale della risposta"""
+
+    @property
+    def cache_namespace(self) -> str:
+        """Identifica voce e modello: audio con lo stesso namespace e testo è intercambiabile"""
+        return type(self).__name__
+
+    @abstractmethod
+    def synthesize(self, text: str) -> AsyncIterator[bytes]:
+        """Sintetizza il testo e restituisce PCM 16-bit a 24kHz man mano che arriva"""
+
+    def with_settings(self, settings: TenantSettings) -> "TextToSpeech":
+        """Istanza con modello e voce del ristorante; senza voci configurabili è la stessa"""
+        return self
+
+
+@dataclass
+class AIProviders:
+    """I tre stadi AI usati da un turno di conversazione"""
+    name: str
+    stt: SpeechToText
+    llm: LanguageModel
+    tts: TextToSpeech
+    _variants: Dict[TenantSettings, "AIProviders"] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def with_settings(self, settings: Optional[TenantSettings]) -> "AIProviders":
+        """Provider con modelli, voce e temperatura di un ristorante (None = quelli di default)"""
+        if settings is None:
+            return self
+        variant = self._variants.get(settings)
+        if variant is None:
+            if len(self._variants) >= MAX_SETTINGS_VARIANTS:
+                self._variants.clear()
+            variant = self._variants[settings] = AIProviders(
+                self.name, self.stt.with_settings(settings), self.llm.with_settings(settings),
+                self.tts.with_settings(settings))
+        return variant
+
+
+def create_providers(name: str = AI_PROVIDER) -> Optional[AIProviders]:
+    """Crea i provider configurati. Ritorna None se il backend non è utilizzabile"""
+    if name == "local":
+        from ai.local_provider import create_local_providers
+        logging.info("Provider AI locale attivo (risposte deterministiche, nessuna rete).")
+        return create_local_providers()
+
+    if name == "openai":
+        from ai.openai_provider import create_openai_providers
+        return create_openai_providers()
+
+    logging.error(f"Provider AI sconosciuto: '{name}'")
+    return None
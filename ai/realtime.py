@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Sessioni speech-to-speech realtime (protocollo OpenAI Realtime) con audio g711_ulaw nativo
+"""
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, Optional
+from urllib.parse import quote
+
+import websockets
+
+from config import (
+    AI_PROVIDER, OPENAI_API_KEY, OPENAI_BASE_URL, OPENAI_REALTIME_URL,
+    REALTIME_VOICE, REALTIME_VOICES, REALTIME_CONNECT_TIMEOUT, SPEECH_PREROLL_MS,
+)
+from database.tenant_settings import TenantSettings
+
+Event = Dict[str, Any]
+
+# Formato audio di Twilio Media Streams: µ-law a 8kHz, accettato e prodotto dalla sessione così com'è
+AUDIO_FORMAT = "g711_ulaw"
+
+
+def realtime_url(base_url: Optional[str] = OPENAI_BASE_URL) -> str:
+    """Endpoint WebSocket realtime: esplicito, derivato dall'endpoint compatibile o quello di OpenAI"""
+    if OPENAI_REALTIME_URL:
+        return OPENAI_REALTIME_URL
+    if not base_url:
+        return "wss://api.openai.com/v1/realtime"
+    base_url = base_url.rstrip("/")
+    if base_url.startswith("https://"):
+        return "wss://" + base_url[len("https://"):] + "/realtime"
+    return "ws://" + base_url[len("http://"):] + "/realtime"
+
+
+class RealtimeConnection:
+    """Una sessione realtime aperta: eventi JSON in entrambe le direzioni"""
+
+    def __init__(self, websocket):
+        self._websocket = websocket
+
+    async def send(self, event: Event):
+        await self._websocket.send(json.dumps(event))
+
+    async def append_audio(self, payload: str):
+        """Audio del chiamante: il payload base64 di Twilio passa senza decodifica"""
+        await self.send({"type": "input_audio_buffer.append", "audio": payload})
+
+    async def events(self) -> AsyncIterator[Event]:
+        """Eventi del server fino alla chiusura della sessione"""
+        async for message in self._websocket:
+            yield json.loads(message)
+
+    async def close(self):
+        await self._websocket.close()
+
+
+class RealtimeClient:
+    """Apre sessioni realtime verso OpenAI (o il sostituto locale in openai_standin.py)"""
+
+    def __init__(self, url: str, api_key: str, connect_timeout: float = REALTIME_CONNECT_TIMEOUT):
+        self.url = url
+        self.api_key = api_key
+        self.connect_timeout = connect_timeout
+
+    @staticmethod
+    def session_config(settings: TenantSettings, instructions: str) -> Event:
+        """Configurazione della sessione: prompt, voce, formato audio e fine del turno lato server"""
+        voice = settings.tts_voice if settings.tts_voice in REALTIME_VOICES else REALTIME_VOICE
+        return {
+            "modalities": ["audio", "text"],
+            "instructions": instructions,
+            "voice": voice,
+            "input_audio_format": AUDIO_FORMAT,
+            "output_audio_format": AUDIO_FORMAT,
+            "input_audio_transcription": {"model": settings.stt_model},
+            "turn_detection": {
+                "type": "server_vad",
+                "prefix_padding_ms": SPEECH_PREROLL_MS,
+                "silence_duration_ms": settings.endpoint_silence_ms,
+                "create_response": True,
+                # Il server annulla la risposta se il chiamante parla sopra l'assistente
+                "interrupt_response": True,
+            },
+        }
+
+    async def connect(self, settings: TenantSettings, instructions: str) -> RealtimeConnection:
+        """Apre e configura una sessione con modello, voce e soglie del ristorante"""
+        websocket = await websockets.connect(
+            f"{self.url}?model={quote(settings.realtime_model)}",
+            extra_headers={"Authorization": f"Bearer {self.api_key}", "OpenAI-Beta": "realtime=v1"},
+            open_timeout=self.connect_timeout,
+            max_size=None,
+            # L'audio base64 non si comprime: niente permessage-deflate sul percorso critico
+            compression=None,
+        )
+        connection = RealtimeConnection(websocket)
+        await connection.send({"type": "session.update", "session": self.session_config(settings, instructions)})
+        return connection
+
+
+def create_realtime_client(name: str = AI_PROVIDER) -> Optional[RealtimeClient]:
+    """Client realtime se il backend lo supporta e la chiave API è disponibile"""
+    if name != "openai" or not (OPENAI_API_KEY and OPENAI_API_KEY.startswith("sk-")):
+        return None
+    url = realtime_url()
+    logging.info(f"Sessioni realtime disponibili su {url}.")
+    return RealtimeClient(url, OPENAI_API_KEY)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Suddivisione in frasi del testo generato dall'LLM in streaming
+"""
+import logging
+import re
+from typing import AsyncIterator, List
+
+from config import TTS_SEGMENT_MIN_CHARS, TTS_SEGMENT_MAX_CHARS
+
+# Fine frase (. ! ? …) o di proposizione (; :) seguita da spazio: "19:00" o "12.30" non vengono spezzati
+_BOUNDARY = re.compile(r"(?:[.!?…]+|[;:])[\"'»)\]]*(?=\s)")
+# Punti di ripiego per segmenti troppo lunghi senza punteggiatura forte
+_SOFT_BOUNDARY = re.compile(r"[,—–-]\s")
+
+
+class SentenceSplitter:
+    """Accumula i token dell'LLM ed emette segmenti completi pronti per il TTS"""
+
+    def __init__(self, min_chars: int = TTS_SEGMENT_MIN_CHARS, max_chars: int = TTS_SEGMENT_MAX_CHARS):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._buffer = ""
+
+    def feed(self, delta: str) -> List[str]:
+        """Aggiunge un frammento di testo e ritorna i segmenti completati"""
+        self._buffer += delta
+        segments = []
+        while True:
+            segment = self._next_segment()
+            if segment is None:
+                return segments
+            if segment:
+                segments.append(segment)
+
+    def flush(self) -> List[str]:
+        """Ritorna il testo rimasto a fine stream"""
+        rest = self._buffer.strip()
+        self._buffer = ""
+        return [rest] if rest else []
+
+    def _next_segment(self):
+        for match in _BOUNDARY.finditer(self._buffer):
+            if len(self._buffer[:match.end()].strip()) >= self.min_chars:
+                return self._cut(match.end())
+
+        if len(self._buffer) > self.max_chars:
+            soft = [m.end() for m in _SOFT_BOUNDARY.finditer(self._buffer, 0, self.max_chars)]
+            if soft:
+                return self._cut(soft[-1])
+            space = self._buffer.rfind(" ", 0, self.max_chars)
+            return self._cut(space if space > 0 else self.max_chars)
+        return None
+
+    def _cut(self, end: int) -> str:
+        segment = self._buffer[:end].strip()
+        self._buffer = self._buffer[end:].lstrip()
+        return segment
+
+
+async def split_sentences(tokens: AsyncIterator[str], splitter: SentenceSplitter = None) -> AsyncIterator[str]:
+    """Trasforma uno stream di token in uno stream di frasi"""
+    splitter = splitter or SentenceSplitter()
+    async for delta in tokens:
+        for segment in splitter.feed(delta):
+            logging.info(f"Segmento AI: '{segment}'")
+            yield segment
+    for segment in splitter.flush():
+        logging.info(f"Segmento AI: '{segment}'")
+        yield segment
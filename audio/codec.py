@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Codec audio interno (sostituisce audioop): G.711 µ-law e ricampionamento 24kHz → 8kHz,
+vettorizzati con NumPy
+"""
+from typing import Optional
+
+import numpy as np
+
+from config import TTS_SAMPLE_RATE, TWILIO_SAMPLE_RATE
+
+ULAW_BIAS = 0x84
+ULAW_CLIP_14 = 8159  # Ampiezza massima sul campione a 14 bit
+ULAW_SEGMENT_END = np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF])
+
+# Filtro anti-aliasing del ricampionatore: passa-basso a 3.4kHz (banda telefonica)
+RESAMPLER_TAPS = 96
+RESAMPLER_CUTOFF_HZ = 3400
+
+
+def _build_ulaw_decode_table() -> np.ndarray:
+    """Tabella di decodifica µ-law → PCM 16-bit per tutti i 256 valori possibili"""
+    table = np.empty(256, dtype=np.int16)
+    for code in range(256):
+        u = ~code & 0xFF
+        exponent = (u >> 4) & 0x07
+        mantissa = u & 0x0F
+        sample = (((mantissa << 3) + ULAW_BIAS) << exponent) - ULAW_BIAS
+        table[code] = -sample if u & 0x80 else sample
+    return table
+
+
+def _build_ulaw_encode_table() -> np.ndarray:
+    """
+    Tabella di codifica PCM 16-bit → µ-law indicizzata dal campione visto come uint16.
+    Stesso algoritmo G.711 a 14 bit di audioop.lin2ulaw, quindi risultati identici.
+    """
+    samples = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32) >> 2
+    mask = np.where(samples < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(samples), ULAW_CLIP_14) + (ULAW_BIAS >> 2)
+    segment = np.searchsorted(ULAW_SEGMENT_END, magnitude)
+    code = np.where(
+        segment >= 8,
+        0x7F,
+        (np.minimum(segment, 7) << 4) | ((magnitude >> (np.minimum(segment, 7) + 1)) & 0x0F)
+    )
+    return (code ^ mask).astype(np.uint8)
+
+
+ULAW_DECODE_TABLE = _build_ulaw_decode_table()
+ULAW_ENCODE_TABLE = _build_ulaw_encode_table()
+
+
+def ulaw_decode(ulaw: bytes) -> np.ndarray:
+    """Decodifica µ-law in un nuovo array di campioni int16"""
+    return ULAW_DECODE_TABLE[np.frombuffer(ulaw, dtype=np.uint8)]
+
+
+def ulaw_decode_into(ulaw: bytes, out: np.ndarray) -> np.ndarray:
+    """Decodifica µ-law direttamente in un array int16 già allocato (nessuna allocazione)"""
+    # ndarray.take ha meno overhead di np.take sui chunk piccoli (160 campioni)
+    ULAW_DECODE_TABLE.take(np.frombuffer(ulaw, dtype=np.uint8), out=out)
+    return out
+
+
+def ulaw_encode(pcm: np.ndarray) -> bytes:
+    """Codifica campioni int16 in µ-law"""
+    return ULAW_ENCODE_TABLE.take(np.ascontiguousarray(pcm, dtype=np.int16).view(np.uint16)).tobytes()
+
+
+def _lowpass_taps(taps: int, cutoff_hz: float, sample_rate: int) -> np.ndarray:
+    """Filtro FIR passa-basso a fase lineare (sinc finestrato con Blackman), guadagno unitario"""
+    n = np.arange(taps) - (taps - 1) / 2
+    fc = cutoff_hz / sample_rate
+    h = 2 * fc * np.sinc(2 * fc * n) * np.blackman(taps)
+    return h / h.sum()
+
+
+class PolyphaseResampler:
+    """
+    Decimatore polifase per rapporti interi (24kHz → 8kHz), da usare in streaming:
+    i campioni di coda di ogni blocco vengono conservati per il blocco successivo,
+    quindi il risultato a blocchi è identico a quello sull'intero segnale.
+    """
+
+    def __init__(self, in_rate: int = TTS_SAMPLE_RATE, out_rate: int = TWILIO_SAMPLE_RATE,
+                 taps: int = RESAMPLER_TAPS, cutoff_hz: float = RESAMPLER_CUTOFF_HZ):
+        if in_rate % out_rate:
+            raise ValueError(f"Rapporto di ricampionamento non intero: {in_rate} → {out_rate}")
+        self.factor = in_rate // out_rate
+        # Lunghezza del filtro multipla del fattore: tutte le fasi hanno lo stesso numero di coefficienti
+        taps += -taps % self.factor
+        self.taps = taps
+        h = _lowpass_taps(taps, cutoff_hz, in_rate)
+        # Fasi del filtro (il filtro è simmetrico, quindi correlazione e convoluzione coincidono)
+        self._phases = [h[p::self.factor] for p in range(self.factor)]
+        self._history = np.zeros(taps - 1, dtype=np.float64)
+
+    def process(self, pcm: np.ndarray) -> np.ndarray:
+        """Ricampiona un blocco di campioni int16 e ritorna i campioni int16 in uscita"""
+        z = np.concatenate((self._history, pcm.astype(np.float64, copy=False)))
+        outputs = (len(z) - self.taps) // self.factor + 1
+        if outputs <= 0:
+            self._history = z
+            return np.empty(0, dtype=np.int16)
+
+        per_phase = outputs + self.taps // self.factor - 1
+        y = np.zeros(outputs, dtype=np.float64)
+        for p, phase in enumerate(self._phases):
+            y += np.correlate(z[p::self.factor][:per_phase], phase, mode='valid')
+
+        self._history = z[outputs * self.factor:]
+        return np.clip(np.rint(y), -32768, 32767).astype(np.int16)
+
+    def reset(self, history: Optional[np.ndarray] = None):
+        """Azzera lo stato del filtro"""
+        self._history = np.zeros(self.taps - 1, dtype=np.float64) if history is None else history
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Decodifica dell'audio in ingresso e suddivisione in frame per il VAD senza copie
+"""
+from typing import Iterator
+
+import numpy as np
+
+from config import VAD_BYTES_PER_FRAME, TWILIO_BYTES_PER_FRAME
+from audio.codec import ulaw_decode_into
+
+# Capacità del buffer in chunk Twilio da 20ms: più è grande, più rari sono i compattamenti
+FRAMER_CAPACITY_CHUNKS = 50
+
+
+class VadFramer:
+    """
+    Decodifica i chunk µ-law di una chiamata in un buffer int16 preallocato e
+    restituisce i frame per il VAD come memoryview sullo stesso buffer.
+
+    Le memoryview restituite da push() e frames() restano valide solo fino
+    alla push() successiva: chi deve conservarle ne copia il contenuto.
+    """
+
+    def __init__(self, frame_bytes: int = VAD_BYTES_PER_FRAME,
+                 capacity_samples: int = TWILIO_BYTES_PER_FRAME * FRAMER_CAPACITY_CHUNKS):
+        self.frame_samples = frame_bytes // 2
+        self._allocate(max(capacity_samples, self.frame_samples * 2))
+        self._start = 0  # primo campione non ancora consegnato come frame
+        self._end = 0    # fine dei campioni decodificati
+
+    def _allocate(self, samples: int):
+        self._samples = np.zeros(samples, dtype=np.int16)
+        self._bytes = memoryview(self._samples).cast('B')
+
+    def push(self, ulaw: bytes) -> memoryview:
+        """Decodifica un chunk µ-law e ritorna il PCM 16-bit corrispondente"""
+        needed = self._end + len(ulaw)
+        if needed > len(self._samples) and self._start:
+            # Buffer esaurito: si riporta all'inizio il frammento di frame non ancora consegnato.
+            # Con la capacità predefinita succede una volta ogni ~50 chunk.
+            pending = self._end - self._start
+            self._samples[:pending] = self._samples[self._start:self._end]
+            self._start, self._end = 0, pending
+            needed = self._end + len(ulaw)
+
+        if needed > len(self._samples):
+            # Chunk più grande del previsto: si rialloca una volta sola
+            old = self._samples[:self._end].copy()
+            self._allocate(needed)
+            self._samples[:self._end] = old
+
+        ulaw_decode_into(ulaw, self._samples[self._end:needed])
+        decoded = self._bytes[self._end * 2:needed * 2]
+        self._end = needed
+        return decoded
+
+    def frames(self) -> Iterator[memoryview]:
+        """Restituisce i frame VAD completi disponibili"""
+        while self._end - self._start >= self.frame_samples:
+            start = self._start
+            self._start += self.frame_samples
+            yield self._bytes[start * 2:self._start * 2]
+
+    def pending_samples(self) -> int:
+        """Campioni in attesa di completare un frame"""
+        return self._end - self._start
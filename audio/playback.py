@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Riproduzione in streaming della risposta TTS verso Twilio
+"""
+import asyncio
+import base64
+import logging
+from typing import AsyncIterator, Callable, List, Optional
+
+import numpy as np
+from fastapi import WebSocket
+
+from config import TTS_SAMPLE_RATE, TWILIO_SAMPLE_RATE, TWILIO_BYTES_PER_FRAME, TTS_MAX_PREFETCH
+from audio.codec import PolyphaseResampler, ulaw_encode
+from audio.tts_cache import TTSCache, cache_key
+from metrics.registry import STAGE_SEND, STAGE_TRANSCODE, TurnSpans
+
+ULAW_SILENCE = b"\xff"
+
+
+class StreamingTranscoder:
+    """
+    Converte PCM 16-bit a 24kHz in frame µ-law a 8kHz da 20ms, un blocco alla volta.
+    Lo stato del ricampionatore viene mantenuto tra i blocchi, così il ricampionamento è continuo.
+    """
+
+    def __init__(self, in_rate: int = TTS_SAMPLE_RATE, out_rate: int = TWILIO_SAMPLE_RATE,
+                 frame_bytes: int = TWILIO_BYTES_PER_FRAME):
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.frame_bytes = frame_bytes
+        self._resampler = PolyphaseResampler(in_rate, out_rate)
+        self._odd_byte = b""
+        self._pending = bytearray()
+
+    def feed(self, pcm: bytes) -> List[bytes]:
+        """Aggiunge un blocco di PCM e ritorna i frame µ-law completi pronti da inviare"""
+        pcm = self._odd_byte + pcm
+        # Un blocco può terminare a metà di un campione da 16 bit
+        if len(pcm) % 2:
+            self._odd_byte = pcm[-1:]
+            pcm = pcm[:-1]
+        else:
+            self._odd_byte = b""
+        if not pcm:
+            return []
+
+        pcm_8k = self._resampler.process(np.frombuffer(pcm, dtype=np.int16))
+        self._pending.extend(ulaw_encode(pcm_8k))
+        return self._take_frames()
+
+    def flush(self) -> List[bytes]:
+        """Ritorna l'ultimo frame incompleto, completato con silenzio"""
+        if not self._pending:
+            return []
+        padding = self.frame_bytes - len(self._pending) % self.frame_bytes
+        if padding != self.frame_bytes:
+            self._pending.extend(ULAW_SILENCE * padding)
+        return self._take_frames()
+
+    def _take_frames(self) -> List[bytes]:
+        complete = len(self._pending) - len(self._pending) % self.frame_bytes
+        frames = [bytes(self._pending[i:i + self.frame_bytes]) for i in range(0, complete, self.frame_bytes)]
+        del self._pending[:complete]
+        return frames
+
+
+async def send_ulaw_frame(websocket: WebSocket, stream_sid: Optional[str], frame: bytes):
+    """Invia un singolo frame µ-law a Twilio come messaggio 'media'"""
+    await websocket.send_json({
+        "event": "media",
+        "streamSid": stream_sid,
+        "media": {
+            "payload": base64.b64encode(frame).decode('utf-8')
+        }
+    })
+
+
+async def send_mark(websocket: WebSocket, stream_sid: Optional[str], name: str):
+    """Marker dopo l'audio inviato: Twilio lo rimanda quando l'audio precedente è stato riprodotto"""
+    await websocket.send_json({
+        "event": "mark",
+        "streamSid": stream_sid,
+        "mark": {"name": name}
+    })
+
+
+async def send_clear(websocket: WebSocket, stream_sid: Optional[str]):
+    """Chiede a Twilio di scartare l'audio ricevuto e non ancora riprodotto"""
+    await websocket.send_json({"event": "clear", "streamSid": stream_sid})
+
+
+async def _send_frames(websocket: WebSocket, stream_sid: Optional[str], frames: List[bytes],
+                       spans: TurnSpans, frames_sent: int) -> int:
+    """Invia i frame pronti e ritorna il totale aggiornato dei frame inviati"""
+    for frame in frames:
+        with spans.span(STAGE_SEND):
+            await send_ulaw_frame(websocket, stream_sid, frame)
+        frames_sent += 1
+        if frames_sent == 1:
+            spans.mark_first_audio()
+            logging.info("Primo frame audio inviato a Twilio.")
+    return frames_sent
+
+
+async def synthesize_ulaw(text: str, synthesize: Callable[[str], AsyncIterator[bytes]],
+                          spans: TurnSpans, cache: Optional[TTSCache] = None,
+                          cache_namespace: str = "") -> AsyncIterator[bytes]:
+    """
+    Frame µ-law da 20ms per un testo: dalla cache se presente, altrimenti sintetizzati,
+    transcodificati appena arrivano e salvati in cache a sintesi completata.
+    """
+    key = cache_key(cache_namespace, text) if cache is not None and cache.cacheable(text) else None
+    if key is not None:
+        audio = await cache.get(key)
+        if audio is not None:
+            for i in range(0, len(audio), TWILIO_BYTES_PER_FRAME):
+                yield audio[i:i + TWILIO_BYTES_PER_FRAME]
+            return
+
+    transcoder = StreamingTranscoder()
+    frames: List[bytes] = []
+    async for chunk in synthesize(text):
+        with spans.span(STAGE_TRANSCODE):
+            ready = transcoder.feed(chunk)
+        frames.extend(ready)
+        for frame in ready:
+            yield frame
+    with spans.span(STAGE_TRANSCODE):
+        ready = transcoder.flush()
+    frames.extend(ready)
+    for frame in ready:
+        yield frame
+
+    # Solo l'audio completo finisce in cache: una sintesi interrotta non arriva fin qui
+    if key is not None:
+        await cache.put(key, b"".join(frames))
+
+
+async def render_ulaw(text: str, synthesize: Callable[[str], AsyncIterator[bytes]],
+                      cache: Optional[TTSCache] = None, cache_namespace: str = "") -> bytes:
+    """Audio µ-law completo di un testo, passando dalla cache (es. per prepararlo in anticipo)"""
+    frames = [frame async for frame in synthesize_ulaw(text, synthesize, TurnSpans(None), cache, cache_namespace)]
+    return b"".join(frames)
+
+
+async def stream_segments_to_twilio(websocket: WebSocket, stream_sid: Optional[str],
+                                    segments: AsyncIterator[str],
+                                    synthesize: Callable[[str], AsyncIterator[bytes]],
+                                    max_prefetch: int = TTS_MAX_PREFETCH,
+                                    spans: Optional[TurnSpans] = None,
+                                    cache: Optional[TTSCache] = None,
+                                    cache_namespace: str = "") -> int:
+    """
+    Sintetizza i segmenti di testo man mano che arrivano e li riproduce nell'ordine originale.
+    Mentre un segmento è in riproduzione, fino a max_prefetch segmenti vengono sintetizzati
+    (e transcodificati) in parallelo; i segmenti già in cache non passano dal TTS.
+    Ritorna il numero di frame inviati.
+    """
+    spans = spans or TurnSpans(None)
+    semaphore = asyncio.Semaphore(max(1, max_prefetch))
+    # Una coda di frame µ-law per ogni segmento, nell'ordine in cui vanno riprodotti
+    ordered: asyncio.Queue = asyncio.Queue()
+    synth_tasks: List[asyncio.Task] = []
+
+    async def synthesize_into(text: str, chunks: asyncio.Queue):
+        async with semaphore:
+            try:
+                async for frame in synthesize_ulaw(text, synthesize, spans, cache, cache_namespace):
+                    await chunks.put(frame)
+            except Exception as e:
+                logging.error(f"Errore nella sintesi del segmento '{text[:40]}': {e}")
+            finally:
+                await chunks.put(None)
+
+    async def produce():
+        try:
+            async for text in segments:
+                chunks: asyncio.Queue = asyncio.Queue()
+                synth_tasks.append(asyncio.create_task(synthesize_into(text, chunks)))
+                await ordered.put(chunks)
+        finally:
+            await ordered.put(None)
+
+    async def drain(chunks: asyncio.Queue) -> AsyncIterator[bytes]:
+        while (chunk := await chunks.get()) is not None:
+            yield chunk
+
+    producer = asyncio.create_task(produce())
+    frames_sent = 0
+    try:
+        while (chunks := await ordered.get()) is not None:
+            async for frame in drain(chunks):
+                frames_sent = await _send_frames(websocket, stream_sid, [frame], spans, frames_sent)
+        # Propaga eventuali errori dello stream di testo (es. LLM)
+        await producer
+    finally:
+        for task in [producer, *synth_tasks]:
+            task.cancel()
+        await asyncio.gather(producer, *synth_tasks, return_exceptions=True)
+    return frames_sent
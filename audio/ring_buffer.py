@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Buffer circolare a capacità fissa per l'audio del chiamante
+"""
+from config import VAD_SAMPLE_RATE, TURN_MAX_SECONDS, SPEECH_PREROLL_MS, SPEECH_TRAILING_MS
+
+BYTES_PER_MS = VAD_SAMPLE_RATE * 2 // 1000  # PCM 16-bit mono
+
+
+class SpeechRingBuffer:
+    """
+    Conserva l'audio PCM di una chiamata in memoria fissa.
+
+    Prima che il VAD rilevi il parlato il buffer tiene solo gli ultimi
+    millisecondi (pre-roll); durante il parlato accumula fino alla durata
+    massima del turno. take_speech() restituisce solo l'intervallo di parlato,
+    con il pre-roll e un breve silenzio finale, scartando il resto.
+
+    Le posizioni sono assolute (byte scritti dall'inizio della chiamata).
+    """
+
+    def __init__(self, max_turn_ms: int = TURN_MAX_SECONDS * 1000,
+                 preroll_ms: int = SPEECH_PREROLL_MS, trailing_ms: int = SPEECH_TRAILING_MS):
+        self.max_turn_bytes = max_turn_ms * BYTES_PER_MS
+        self.preroll_bytes = preroll_ms * BYTES_PER_MS
+        self.trailing_bytes = trailing_ms * BYTES_PER_MS
+        # Margine oltre il turno massimo: pre-roll, silenzio finale e un secondo di chunk in arrivo
+        self.capacity = self.max_turn_bytes + self.preroll_bytes + self.trailing_bytes + 1000 * BYTES_PER_MS
+        self._buffer = bytearray(self.capacity)
+        self._view = memoryview(self._buffer)
+        self.written = 0
+        self.speech_start = None
+        self.speech_end = None
+
+    def write(self, pcm):
+        """Aggiunge PCM al buffer, sovrascrivendo l'audio più vecchio"""
+        size = len(pcm)
+        if size >= self.capacity:
+            pcm = memoryview(pcm)[size - self.capacity:]
+            self.written += size - self.capacity
+            size = self.capacity
+
+        offset = self.written % self.capacity
+        first = min(size, self.capacity - offset)
+        self._view[offset:offset + first] = pcm[:first]
+        if first < size:
+            self._view[:size - first] = pcm[first:]
+        self.written += size
+
+    def mark_speech(self, frame_end: int, frame_bytes: int):
+        """Segnala un frame di parlato che termina alla posizione assoluta frame_end"""
+        if self.speech_start is None:
+            oldest = max(0, self.written - self.capacity)
+            self.speech_start = max(oldest, frame_end - frame_bytes - self.preroll_bytes)
+        self.speech_end = frame_end
+
+    @property
+    def has_speech(self) -> bool:
+        return self.speech_start is not None
+
+    def speech_bytes(self) -> int:
+        """Byte di audio accumulati dall'inizio del parlato"""
+        if self.speech_start is None:
+            return 0
+        return self.written - self.speech_start
+
+    def is_full(self) -> bool:
+        """Il turno ha raggiunto la durata massima e va chiuso"""
+        return self.speech_bytes() >= self.max_turn_bytes
+
+    def peek_speech(self) -> bytes:
+        """Copia dell'intervallo di parlato (pre-roll incluso, silenzio finale limitato), senza consumarlo"""
+        if self.speech_start is None:
+            return b""
+        start = max(self.speech_start, self.written - self.capacity)
+        end = min(self.speech_end + self.trailing_bytes, self.written)
+        return self._read(start, end)
+
+    def take_speech(self) -> bytes:
+        """Estrae l'intervallo di parlato e prepara il buffer per il turno successivo"""
+        audio = self.peek_speech()
+        self.reset()
+        return audio
+
+    def reset(self):
+        """Dimentica il parlato corrente; l'audio recente resta disponibile come pre-roll"""
+        self.speech_start = None
+        self.speech_end = None
+
+    def _read(self, start: int, end: int) -> bytes:
+        size = end - start
+        if size <= 0:
+            return b""
+        offset = start % self.capacity
+        first = min(size, self.capacity - offset)
+        if first == size:
+            return bytes(self._view[offset:offset + size])
+        return bytes(self._view[offset:]) + bytes(self._view[:size - first])
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Cache dell'audio sintetizzato, indicizzata per contenuto (voce, modello, testo normalizzato).
+Conserva µ-law a 8kHz già pronto da inviare a Twilio: un hit salta sintesi e transcodifica.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from config import TTS_CACHE_MAX_BYTES, TTS_CACHE_DIR, TTS_CACHE_DISK_MAX_BYTES, TTS_CACHE_MAX_TEXT_CHARS
+
+_WHITESPACE = re.compile(r"\s+")
+ENTRY_SUFFIX = ".ulaw"
+
+
+def normalize_text(text: str) -> str:
+    """Forma canonica del testo: stessa pronuncia, stessa chiave"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(namespace: str, text: str) -> str:
+    """Chiave di contenuto: namespace del TTS (provider, modello, voce) e testo normalizzato"""
+    return hashlib.sha256(f"{namespace}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """
+    LRU in memoria con un budget in byte, sopra un archivio su disco che sopravvive ai riavvii.
+    Su disco ogni voce è un file µ-law grezzo, senza intestazione: si legge così com'è
+    e si invia a fette da 160 byte.
+    """
+
+    def __init__(self, max_bytes: int = TTS_CACHE_MAX_BYTES, directory: Optional[str] = TTS_CACHE_DIR,
+                 disk_max_bytes: int = TTS_CACHE_DISK_MAX_BYTES,
+                 max_text_chars: int = TTS_CACHE_MAX_TEXT_CHARS):
+        self.max_bytes = max_bytes
+        self.directory = directory or None
+        self.disk_max_bytes = disk_max_bytes
+        self.max_text_chars = max_text_chars
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self.bytes = 0
+        self._disk_bytes: Optional[int] = None  # calcolato alla prima scrittura
+        # Le scritture su disco girano in thread diversi: il totale e la pulizia sono protetti
+        self._disk_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_errors = 0
+
+    def cacheable(self, text: str) -> bool:
+        return 0 < len(text) <= self.max_text_chars
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Audio µ-law in cache, o None"""
+        audio = self._entries.get(key)
+        if audio is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return audio
+
+        if self.directory:
+            try:
+                audio = await asyncio.to_thread(self._read, key)
+            except OSError as e:
+                self.disk_errors += 1
+                logging.warning(f"Cache TTS: lettura da disco fallita: {e}")
+            if audio is not None:
+                self.disk_hits += 1
+                self._remember(key, audio)
+                return audio
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, audio: bytes):
+        """Salva l'audio µ-law di un testo in memoria e su disco"""
+        if not audio:
+            return
+        self._remember(key, audio)
+        if self.directory:
+            try:
+                await asyncio.to_thread(self._write, key, audio)
+            except OSError as e:
+                self.disk_errors += 1
+                logging.warning(f"Cache TTS: scrittura su disco fallita: {e}")
+
+    def _remember(self, key: str, audio: bytes):
+        if len(audio) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= len(previous)
+        self._entries[key] = audio
+        self.bytes += len(audio)
+        while self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= len(evicted)
+            self.evictions += 1
+
+    # --- Archivio su disco (eseguito in un thread) ---
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ENTRY_SUFFIX)
+
+    def _read(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+        except FileNotFoundError:
+            return None
+        if not audio:
+            return None
+        # La data di modifica fa da "ultimo utilizzo" per la pulizia del disco
+        os.utime(path)
+        return audio
+
+    def _write(self, key: str, audio: bytes):
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Scrittura atomica: un'altra istanza non legge mai un file a metà
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+        with self._disk_lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+            else:
+                self._disk_bytes += len(audio)
+            if self._disk_bytes > self.disk_max_bytes:
+                self._prune_disk()
+
+    def _disk_entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(ENTRY_SUFFIX):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def _prune_disk(self):
+        """Rimuove i file usati meno di recente fino a tornare al 90% del budget (con _disk_lock)"""
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.disk_max_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        self._disk_bytes = total
+
+    def stats(self) -> Dict[str, Any]:
+        """Contatori della cache"""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'disk_errors': self.disk_errors,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Cache globale dell'audio sintetizzato
+tts_cache = TTSCache()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Ricalcola le statistiche giornaliere delle chiamate (statistiche_chiamate_giornaliere)
+dallo storico di chiamate_log, ad esempio dopo il primo avvio con le statistiche
+incrementali o dopo aver cambiato STATS_TIMEZONE.
+
+Uso:
+    python3 backfill_call_stats.py                       # tutto lo storico
+    python3 backfill_call_stats.py --ristorante 1 --dal 2024-01-01
+"""
+import argparse
+import asyncio
+import logging
+from datetime import date
+
+from database.db_manager import db_manager
+
+logging.basicConfig(level=logging.INFO)
+
+
+async def backfill(ristorante_id, dal):
+    await db_manager.initialize()
+    try:
+        righe = await db_manager.backfill_call_stats(ristorante_id, dal)
+        print(f"✅ Statistiche ricalcolate: {righe} righe giornaliere scritte")
+    finally:
+        await db_manager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ricalcola le statistiche giornaliere delle chiamate")
+    parser.add_argument("--ristorante", type=int, help="id del ristorante (default: tutti)")
+    parser.add_argument("--dal", type=date.fromisoformat, help="primo giorno da ricalcolare, AAAA-MM-GG (default: tutto)")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.ristorante, args.dal))
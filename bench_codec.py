@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark del codec audio interno rispetto ad audioop:
+- decodifica in ingresso + framing VAD (per messaggio Twilio)
+- throughput di µ-law decode/encode e ricampionamento 24kHz → 8kHz (campioni/s per core)
+"""
+import audioop
+import base64
+import os
+import time
+
+import numpy as np
+
+from config import VAD_BYTES_PER_FRAME
+from audio.codec import PolyphaseResampler, ulaw_decode, ulaw_encode
+from audio.framing import VadFramer
+
+CHIAMATA_SECONDI = 60
+FRAME_PER_SECONDO = 50  # Twilio invia un messaggio 'media' ogni 20ms
+
+
+def genera_payload(n: int):
+    """Payload base64 da 160 byte µ-law come quelli di Twilio"""
+    return [base64.b64encode(os.urandom(160)).decode('utf-8') for _ in range(n)]
+
+
+def percorso_audioop(payloads):
+    """Percorso precedente: ulaw2lin + slicing dei frame in nuovi oggetti bytes"""
+    audio_buffer = bytearray()
+    pending = bytearray()
+    frames = 0
+    for payload in payloads:
+        pcm_chunk = audioop.ulaw2lin(base64.b64decode(payload), 2)
+        audio_buffer.extend(pcm_chunk)
+        pending.extend(pcm_chunk)
+        while len(pending) >= VAD_BYTES_PER_FRAME:
+            frame = bytes(pending[:VAD_BYTES_PER_FRAME])
+            del pending[:VAD_BYTES_PER_FRAME]
+            frames += len(frame) > 0
+    return frames
+
+
+def percorso_numpy(payloads):
+    """Nuovo percorso: tabella µ-law NumPy + frame come memoryview sul buffer della chiamata"""
+    audio_buffer = bytearray()
+    framer = VadFramer()
+    frames = 0
+    for payload in payloads:
+        pcm_chunk = framer.push(base64.b64decode(payload))
+        audio_buffer.extend(pcm_chunk)
+        for frame in framer.frames():
+            frames += len(frame) > 0
+    return frames
+
+
+def misura(nome, funzione, payloads, ripetizioni=5):
+    migliore = float("inf")
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        frames = funzione(payloads)
+        migliore = min(migliore, time.perf_counter() - inizio)
+    per_messaggio_us = migliore / len(payloads) * 1e6
+    chiamate_per_core = 1e6 / (per_messaggio_us * FRAME_PER_SECONDO)
+    print(f"{nome:<28} {per_messaggio_us:8.2f} µs/messaggio  "
+          f"{frames:6d} frame VAD  ~{chiamate_per_core:8.0f} chiamate/core (solo decodifica)")
+    return per_messaggio_us
+
+
+def bench_decodifica():
+    print("🔍 Decodifica µ-law in ingresso + framing VAD")
+    print("=" * 90)
+    payloads = genera_payload(CHIAMATA_SECONDI * FRAME_PER_SECONDO)
+    assert percorso_audioop(payloads) == percorso_numpy(payloads)
+    vecchio = misura("audioop + slicing bytes", percorso_audioop, payloads)
+    nuovo = misura("numpy + memoryview", percorso_numpy, payloads)
+    print(f"Rapporto: {vecchio / nuovo:.2f}x")
+
+
+def throughput(funzione, blocchi, campioni_per_blocco, ripetizioni=5) -> float:
+    """Campioni in ingresso elaborati al secondo (un solo core)"""
+    migliore = float("inf")
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        for blocco in blocchi:
+            funzione(blocco)
+        migliore = min(migliore, time.perf_counter() - inizio)
+    return len(blocchi) * campioni_per_blocco / migliore
+
+
+def confronta(nome, vecchio, nuovo, blocchi_vecchi, blocchi_nuovi, campioni):
+    v = throughput(vecchio, blocchi_vecchi, campioni)
+    n = throughput(nuovo, blocchi_nuovi, campioni)
+    print(f"{nome:<38} audioop {v / 1e6:8.2f} Mcampioni/s   codec {n / 1e6:8.2f} Mcampioni/s   {n / v:5.2f}x")
+
+
+def livello_db(pcm: np.ndarray) -> float:
+    return 20 * np.log10(np.sqrt(np.mean(pcm.astype(np.float64) ** 2)) + 1e-9)
+
+
+def bench_codec():
+    print("\n🔍 Throughput codec (campioni in ingresso al secondo, un core)")
+    print("=" * 90)
+    rng = np.random.default_rng(0)
+
+    for etichetta, campioni in (("blocchi da 20ms", 160), ("blocchi da 1s", 8000)):
+        ulaw = [rng.integers(0, 256, campioni, dtype=np.uint8).tobytes() for _ in range(max(1, 400000 // campioni))]
+        confronta(f"µ-law decode ({etichetta})",
+                  lambda b: audioop.ulaw2lin(b, 2), ulaw_decode, ulaw, ulaw, campioni)
+
+        pcm = [(rng.standard_normal(campioni) * 5000).astype(np.int16) for _ in range(max(1, 400000 // campioni))]
+        pcm_bytes = [p.tobytes() for p in pcm]
+        confronta(f"µ-law encode ({etichetta})",
+                  lambda b: audioop.lin2ulaw(b, 2), ulaw_encode, pcm_bytes, pcm, campioni)
+
+    # Ricampionamento dello stream TTS: blocchi da 100ms a 24kHz, con stato tra i blocchi
+    campioni = 2400
+    pcm = [(rng.standard_normal(campioni) * 5000).astype(np.int16) for _ in range(200)]
+    pcm_bytes = [p.tobytes() for p in pcm]
+    stato = {"ratecv": None}
+
+    def ratecv(blocco):
+        _, stato["ratecv"] = audioop.ratecv(blocco, 2, 1, 24000, 8000, stato["ratecv"])
+
+    confronta("ricampionamento 24k→8k (blocchi 100ms)", ratecv, PolyphaseResampler().process,
+              pcm_bytes, pcm, campioni)
+
+    # Qualità: un tono a 5.5kHz non è rappresentabile a 8kHz e deve essere eliminato, non ripiegato
+    t = np.arange(24000) / 24000
+    tono = (10000 * np.sin(2 * np.pi * 5500 * t)).astype(np.int16)
+    alias_ratecv = np.frombuffer(audioop.ratecv(tono.tobytes(), 2, 1, 24000, 8000, None)[0], dtype=np.int16)
+    alias_codec = PolyphaseResampler().process(tono)
+    # Sotto i -96 dB il residuo è inferiore a un bit del PCM a 16 bit
+    ratecv_db = max(livello_db(alias_ratecv[200:]) - livello_db(tono), -96)
+    codec_db = max(livello_db(alias_codec[200:]) - livello_db(tono), -96)
+    print(f"\nAliasing di un tono a 5.5kHz: ratecv {ratecv_db:6.1f} dB, polifase {codec_db:6.1f} dB")
+
+
+if __name__ == "__main__":
+    bench_decodifica()
+    bench_codec()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Saluto iniziale per ristorante, sintetizzato in anticipo e pronto da inviare appena la chiamata inizia
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from fastapi import WebSocket
+
+from config import GREETING_TEMPLATE, GREETING_GENERIC, GREETING_WARM_CONCURRENCY, TWILIO_BYTES_PER_FRAME
+from ai.providers import TextToSpeech
+from audio.playback import render_ulaw, send_ulaw_frame, synthesize_ulaw
+from audio.tts_cache import TTSCache
+from database.tenant_settings import settings_for
+from metrics.registry import TurnSpans
+
+RestaurantLookup = Callable[[str], Awaitable[Optional[Dict[str, Any]]]]
+
+
+def greeting_text(restaurant: Optional[Dict[str, Any]]) -> str:
+    """Saluto personalizzato da configurazioni, altrimenti costruito dal nome del ristorante"""
+    if not restaurant:
+        return GREETING_GENERIC
+    if restaurant.get('saluto'):
+        return restaurant['saluto']
+    return GREETING_TEMPLATE.format(nome_ristorante=restaurant['nome_ristorante'])
+
+
+class GreetingStore:
+    """
+    Audio µ-law dei saluti, uno per numero Twilio, tenuto in memoria fuori dalla LRU
+    della cache TTS. I saluti vengono preparati all'avvio e rigenerati quando il
+    ristorante cambia; i numeri non ancora pronti vengono sintetizzati alla prima chiamata.
+    """
+
+    def __init__(self, tts: TextToSpeech, lookup: RestaurantLookup, cache: Optional[TTSCache] = None,
+                 concurrency: int = GREETING_WARM_CONCURRENCY):
+        self.tts = tts
+        self.lookup = lookup
+        self.cache = cache
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._audio: Dict[str, bytes] = {}
+        self._texts: Dict[str, str] = {}
+        self._voices: Dict[str, str] = {}  # namespace TTS (modello e voce) di ogni saluto
+        self._refresh_tasks: List[asyncio.Task] = []
+        self.prerendered_plays = 0
+        self.synthesized_plays = 0
+
+    def get(self, numero: str) -> Optional[bytes]:
+        return self._audio.get(numero)
+
+    def tts_for(self, restaurant: Optional[Dict[str, Any]]) -> TextToSpeech:
+        """TTS con modello e voce del ristorante"""
+        return self.tts.with_settings(settings_for(restaurant))
+
+    async def render(self, text: str, tts: Optional[TextToSpeech] = None) -> bytes:
+        """Sintetizza un saluto (o lo prende dalla cache TTS) e ritorna il µ-law completo"""
+        tts = tts or self.tts
+        return await render_ulaw(text, tts.synthesize, self.cache, tts.cache_namespace)
+
+    async def prepare(self, restaurant: Dict[str, Any]):
+        """Prepara il saluto di un ristorante"""
+        numero = restaurant['numero_twilio']
+        text = greeting_text(restaurant)
+        tts = self.tts_for(restaurant)
+        if self._texts.get(numero) == text and self._voices.get(numero) == tts.cache_namespace and numero in self._audio:
+            return
+        async with self._semaphore:
+            audio = await self.render(text, tts)
+        self._audio[numero] = audio
+        self._texts[numero] = text
+        self._voices[numero] = tts.cache_namespace
+
+    async def warm(self, restaurants: Iterable[Dict[str, Any]]):
+        """Prepara i saluti di tutti i ristoranti; un errore non blocca gli altri"""
+        restaurants = list(restaurants)
+        results = await asyncio.gather(*(self.prepare(r) for r in restaurants), return_exceptions=True)
+        errors = [r for r in results if isinstance(r, Exception)]
+        for error in errors[:3]:
+            logging.error(f"Errore nella preparazione di un saluto: {error}")
+        logging.info(f"Saluti pronti per {len(restaurants) - len(errors)} ristoranti su {len(restaurants)}.")
+
+    async def refresh(self, numeri: List[str]):
+        """Rigenera i saluti dei numeri indicati con i dati aggiornati del ristorante"""
+        for numero in numeri:
+            self._audio.pop(numero, None)
+            self._texts.pop(numero, None)
+            self._voices.pop(numero, None)
+            try:
+                restaurant = await self.lookup(numero)
+                if restaurant:
+                    await self.prepare(restaurant)
+            except Exception as e:
+                logging.error(f"Errore nell'aggiornamento del saluto per {numero}: {e}")
+
+    def on_tenants_changed(self, numeri: Optional[List[str]]):
+        """Listener del database: i saluti dei ristoranti modificati vengono rigenerati in background"""
+        numeri = list(self._audio) if numeri is None else numeri
+        self._refresh_tasks = [t for t in self._refresh_tasks if not t.done()]
+        self._refresh_tasks.append(asyncio.get_running_loop().create_task(self.refresh(numeri)))
+
+    async def play(self, websocket: WebSocket, stream_sid: Optional[str], numero: str) -> int:
+        """Invia il saluto a Twilio e ritorna il numero di frame inviati"""
+        audio = self._audio.get(numero)
+        if audio is not None:
+            self.prerendered_plays += 1
+            for i in range(0, len(audio), TWILIO_BYTES_PER_FRAME):
+                await send_ulaw_frame(websocket, stream_sid, audio[i:i + TWILIO_BYTES_PER_FRAME])
+            return len(audio) // TWILIO_BYTES_PER_FRAME
+
+        # Saluto non ancora pronto: sintesi in streaming, poi resta disponibile per le chiamate successive
+        self.synthesized_plays += 1
+        try:
+            restaurant = await self.lookup(numero)
+        except Exception as e:
+            logging.error(f"Errore nel recupero del ristorante per il saluto: {e}")
+            restaurant = None
+        text = greeting_text(restaurant)
+        tts = self.tts_for(restaurant)
+        frames = []
+        async for frame in synthesize_ulaw(text, tts.synthesize, TurnSpans(None), self.cache, tts.cache_namespace):
+            await send_ulaw_frame(websocket, stream_sid, frame)
+            frames.append(frame)
+        if restaurant:
+            self._audio[numero] = b"".join(frames)
+            self._texts[numero] = text
+            self._voices[numero] = tts.cache_namespace
+        return len(frames)
+
+    async def close(self):
+        for task in self._refresh_tasks:
+            task.cancel()
+        await asyncio.gather(*self._refresh_tasks, return_exceptions=True)
+        self._refresh_tasks = []
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'ready': len(self._audio),
+            'prerendered_plays': self.prerendered_plays,
+            'synthesized_plays': self.synthesized_plays,
+        }
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Pipeline per-chiamata: ricezione audio, VAD e turni AI disaccoppiati
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from config import (
+    VAD_SAMPLE_RATE, VAD_FRAME_MS,
+    FRAME_QUEUE_MAXSIZE, FRAME_DROP_POLICY,
+    TURN_QUEUE_MAXSIZE, TURN_DROP_POLICY,
+    BARGE_IN_ENABLED, BARGE_IN_MIN_SPEECH_MS, CALL_TEARDOWN_TIMEOUT,
+    ENDPOINT_SILENCE_MS, SPECULATIVE_TRANSCRIPTION, SPECULATIVE_SILENCE_MS,
+)
+from call.session import CallSession
+from audio.framing import VadFramer
+from audio.playback import send_clear
+from database.tenant_settings import TenantSettings
+from metrics.registry import metrics, SPECULATION_COMMITTED, SPECULATION_DISCARDED, STAGE_TRANSCRIPTION
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+# Frame di silenzio tollerati dentro il parlato che conta per il barge-in (il VAD ha brevi buchi)
+BARGE_IN_MAX_GAP_FRAMES = 3
+
+# Il gestore del turno riceve anche la trascrizione speculativa (o None) se la pipeline ha un trascrittore
+TurnHandler = Callable[..., Awaitable[None]]
+Transcriber = Callable[[bytes], Awaitable[str]]
+
+
+class BoundedQueue:
+    """Coda limitata che non blocca mai il produttore: quando è piena applica la politica di scarto"""
+
+    def __init__(self, maxsize: int, policy: str = DROP_OLDEST, on_drop: Optional[Callable[[Any], None]] = None):
+        if policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Politica di scarto non valida: {policy}")
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, maxsize))
+        self.policy = policy
+        self.on_drop = on_drop  # riceve l'elemento scartato, con entrambe le politiche
+        self.dropped = 0
+
+    def put(self, item) -> bool:
+        """Inserisce un elemento senza attendere. Ritorna False se un elemento è stato scartato"""
+        if not self._queue.full():
+            self._queue.put_nowait(item)
+            return True
+
+        self.dropped += 1
+        if self.policy == DROP_NEWEST:
+            dropped = item
+        else:
+            # DROP_OLDEST: facciamo spazio al dato più recente
+            dropped = self._queue.get_nowait()
+            self._queue.task_done()
+            self._queue.put_nowait(item)
+        if self.on_drop is not None:
+            self.on_drop(dropped)
+        return False
+
+    async def get(self):
+        return await self._queue.get()
+
+    def drain(self) -> List[Any]:
+        """Toglie dalla coda e ritorna gli elementi non ancora consumati"""
+        items = []
+        while not self._queue.empty():
+            items.append(self._queue.get_nowait())
+            self._queue.task_done()
+        return items
+
+    def task_done(self):
+        self._queue.task_done()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+
+class CallPipeline:
+    """
+    Pipeline di una chiamata:
+    1. Il loop di ricezione inserisce i frame µ-law in una coda limitata (mai bloccante)
+    2. Un task decodifica i frame, esegue il VAD e rileva la fine del turno
+    3. Un task separato esegue le fasi AI su ciascun turno completato
+    4. Se il chiamante parla mentre l'assistente pensa o parla (barge-in), il turno in corso
+       viene annullato e Twilio scarta l'audio non ancora riprodotto
+
+    Con un trascrittore la trascrizione parte già dopo SPECULATIVE_SILENCE_MS di silenzio:
+    se il silenzio arriva a ENDPOINT_SILENCE_MS il turno la riceve, spesso già pronta;
+    se il chiamante riprende a parlare viene annullata.
+    """
+
+    def __init__(self, session: CallSession, on_turn: TurnHandler, transcribe: Optional[Transcriber] = None,
+                 endpoint_silence_ms: int = ENDPOINT_SILENCE_MS, speculative_silence_ms: int = SPECULATIVE_SILENCE_MS):
+        self.session = session
+        self.on_turn = on_turn
+        self.transcribe = transcribe
+        session.pipeline = self
+        self.frames = BoundedQueue(FRAME_QUEUE_MAXSIZE, FRAME_DROP_POLICY)
+        # Un turno scartato dalla coda non userà la sua trascrizione speculativa
+        self.turns = BoundedQueue(TURN_QUEUE_MAXSIZE, TURN_DROP_POLICY, on_drop=lambda turn: self._discard(turn[1]))
+        self.frames_received = 0
+        self.turns_processed = 0
+        self.barge_ins = 0
+        self._framer = VadFramer()
+        self._vad_position = 0  # byte di PCM già valutati dal VAD
+        self._set_thresholds(endpoint_silence_ms, speculative_silence_ms, BARGE_IN_MIN_SPEECH_MS)
+        # Trascrizione speculativa in corso: fine del parlato che copre e task
+        self._speculation: Optional[Tuple[int, asyncio.Task]] = None
+        self._speech_run = 0  # frame VAD di parlato, a meno di brevi pause
+        self._gap_run = 0
+        self._frame_task: Optional[asyncio.Task] = None
+        self._turn_task: Optional[asyncio.Task] = None
+        self._current_turn: Optional[asyncio.Task] = None
+
+    def _set_thresholds(self, endpoint_silence_ms: int, speculative_silence_ms: int, barge_in_min_speech_ms: int):
+        """Soglie in frame VAD: fine del turno, trascrizione speculativa e barge-in"""
+        self.endpoint_frames = endpoint_silence_ms // VAD_FRAME_MS
+        speculate = (self.transcribe is not None and SPECULATIVE_TRANSCRIPTION
+                     and speculative_silence_ms < endpoint_silence_ms)
+        self.speculative_frames = max(1, speculative_silence_ms // VAD_FRAME_MS) if speculate else 0
+        self.barge_in_frames = max(1, barge_in_min_speech_ms // VAD_FRAME_MS) if BARGE_IN_ENABLED else 0
+
+    def configure(self, settings: TenantSettings):
+        """Applica le impostazioni del ristorante chiamato: VAD e soglie di fine turno e barge-in"""
+        self.session.settings = settings
+        self.session.vad.set_mode(settings.vad_aggressiveness)
+        self._set_thresholds(settings.endpoint_silence_ms, settings.speculative_silence_ms,
+                             settings.barge_in_min_speech_ms)
+
+    @property
+    def frames_dropped(self) -> int:
+        return self.frames.dropped
+
+    @property
+    def turns_dropped(self) -> int:
+        return self.turns.dropped
+
+    def start(self):
+        """Avvia i task di elaborazione della chiamata, nel gruppo di task della sessione"""
+        tasks = self.session.tasks
+        self._frame_task = tasks.spawn(self._frame_loop(), name=f"vad-{self.session.session_id}", long_lived=True)
+        self._turn_task = tasks.spawn(self._turn_loop(), name=f"turni-{self.session.session_id}", long_lived=True)
+
+    async def stop(self, timeout: float = CALL_TEARDOWN_TIMEOUT):
+        """Ferma la chiamata: annulla tutto il suo lavoro in background (VAD, turno AI, saluto)"""
+        # Trascrizioni speculative non ancora usate da un turno: annullate e contate qui
+        self._discard_speculation()
+        for _, transcription in self.turns.drain():
+            self._discard(transcription)
+        cancelled = await self.session.tasks.cancel(timeout)
+        if cancelled:
+            logging.info(f"Sessione {self.session.session_id}: {cancelled} task di lavoro AI annullati alla chiusura")
+        self._frame_task = None
+        self._turn_task = None
+        if self.frames_dropped or self.turns_dropped:
+            logging.warning(
+                f"Sessione {self.session.session_id}: {self.frames_dropped} frame "
+                f"e {self.turns_dropped} turni scartati"
+            )
+
+    def push_frame(self, ulaw_chunk: bytes):
+        """Chiamato dal loop di ricezione per ogni messaggio 'media': non attende mai"""
+        self.frames_received += 1
+        metrics.frame_rate.add()
+        if not self.frames.put(ulaw_chunk) and self.frames.dropped % FRAME_QUEUE_MAXSIZE == 1:
+            logging.warning(
+                f"Sessione {self.session.session_id}: coda frame piena, "
+                f"{self.frames.dropped} frame scartati ({self.frames.policy})"
+            )
+
+    def _end_turn(self):
+        """Chiude il turno corrente e lo passa al worker AI"""
+        session = self.session
+        transcription = self._take_speculation(session.audio_buffer.speech_end)
+        # Solo l'intervallo di parlato: niente silenzio iniziale né finale da caricare su Whisper
+        audio = session.audio_buffer.take_speech()
+        session.reset_turn()
+        if not audio:
+            self._discard(transcription)
+            return
+        if not self.turns.put((audio, transcription)):
+            logging.warning(
+                f"Sessione {session.session_id}: AI ancora occupata, turno scartato ({self.turns.policy})"
+            )
+
+    def _speculate(self):
+        """Avvia la trascrizione del parlato fin qui, prima della fine del turno"""
+        buffer = self.session.audio_buffer
+        audio = buffer.peek_speech()
+        if audio:
+            task = self.session.tasks.spawn(self.transcribe(audio), name=f"stt-{self.session.session_id}")
+            self._speculation = (buffer.speech_end, task)
+
+    def _take_speculation(self, speech_end: Optional[int]) -> Optional[asyncio.Task]:
+        """La trascrizione speculativa, se copre esattamente il parlato del turno che si chiude"""
+        if self._speculation is None:
+            return None
+        end, task = self._speculation
+        self._speculation = None
+        if end != speech_end:
+            self._discard(task)
+            return None
+        return task
+
+    def _discard_speculation(self):
+        """Il chiamante ha ripreso a parlare: la trascrizione speculativa non serve più"""
+        if self._speculation is not None:
+            self._discard(self._speculation[1])
+            self._speculation = None
+
+    def _discard(self, task: Optional[asyncio.Task]):
+        if task is None:
+            return
+        metrics.speculative_transcriptions.inc(SPECULATION_DISCARDED)
+        if task.done():
+            if not task.cancelled():
+                task.exception()  # evita l'avviso "exception was never retrieved"
+        else:
+            task.cancel()
+            metrics.request_cancelled(self.session.numero_chiamato, STAGE_TRANSCRIPTION)
+
+    async def _frame_loop(self):
+        """Decodifica i frame e applica il VAD per rilevare la fine del turno"""
+        session = self.session
+        while True:
+            chunk = await self.frames.get()
+            try:
+                # Decodifica vettorizzata in un buffer preallocato per la chiamata
+                pcm_chunk = self._framer.push(chunk)
+                session.audio_buffer.write(pcm_chunk)
+
+                # Logica VAD: i messaggi di Twilio sono da 20ms mentre il VAD lavora su
+                # frame da 30ms; il framer accumula e consegna i frame completi senza copie
+                for frame in self._framer.frames():
+                    self._vad_position += len(frame)
+                    if session.vad.is_speech(frame, VAD_SAMPLE_RATE):
+                        session.is_speaking = True
+                        session.silence_frames = 0
+                        session.audio_buffer.mark_speech(self._vad_position, len(frame))
+                        self._discard_speculation()
+                        self._speech_run += 1
+                        self._gap_run = 0
+                        if self._speech_run == self.barge_in_frames and self.assistant_busy():
+                            await self._barge_in()
+                    else:
+                        self._gap_run += 1
+                        if self._gap_run > BARGE_IN_MAX_GAP_FRAMES:
+                            self._speech_run = 0
+                        if session.is_speaking:
+                            session.silence_frames += 1
+                            if session.silence_frames == self.speculative_frames:
+                                self._speculate()
+
+                    # Dopo ENDPOINT_SILENCE_MS di silenzio (circa 750ms) l'utente ha finito il suo turno
+                    if session.is_speaking and session.silence_frames > self.endpoint_frames:
+                        self._end_turn()
+
+                # Memoria limitata: un turno troppo lungo (es. rumore continuo) viene chiuso
+                if session.audio_buffer.is_full():
+                    logging.warning(f"Sessione {session.session_id}: durata massima del turno raggiunta.")
+                    self._end_turn()
+            except Exception as e:
+                logging.error(f"Errore nell'elaborazione del frame audio: {e}")
+            finally:
+                self.frames.task_done()
+
+    def assistant_busy(self) -> bool:
+        """L'assistente sta pensando o parlando: turno AI o saluto in corso, audio non ancora riprodotto"""
+        session = self.session
+        tasks = (self._current_turn, session.greeting_task)
+        return any(t is not None and not t.done() for t in tasks) or session.is_playing()
+
+    async def _barge_in(self):
+        """Il chiamante parla sopra l'assistente: si annulla la generazione e si ferma l'audio"""
+        session = self.session
+        # Prima si fermano gli invii, poi si svuota il buffer di Twilio. Un task annullato non invia
+        # altro audio: l'annullamento scatta al suo prossimo await. Il gruppo di task della chiamata
+        # ne raccoglie la fine, senza fermare qui la lettura dei frame.
+        for task in (self._current_turn, session.greeting_task):
+            if task is not None and not task.done():
+                task.cancel()
+        session.clear_playback()
+        self.barge_ins += 1
+        try:
+            await send_clear(session.websocket, session.stream_sid)
+        except Exception as e:
+            logging.error(f"Errore nell'invio del 'clear' a Twilio: {e}")
+        logging.info(f"Sessione {session.session_id}: il chiamante ha interrotto l'assistente, audio scartato.")
+
+    async def _turn_loop(self):
+        """Esegue le fasi AI (STT → LLM → TTS) un turno alla volta"""
+        while True:
+            audio, transcription = await self.turns.get()
+            if transcription is not None:
+                # Solo ora la trascrizione speculativa è davvero usata dal turno
+                metrics.speculative_transcriptions.inc(SPECULATION_COMMITTED)
+            if self.transcribe is None:
+                handler = self.on_turn(self.session, audio)
+            else:
+                handler = self.on_turn(self.session, audio, transcription)
+            # Il turno gira in un task separato, così un barge-in può annullarlo
+            turn = self._current_turn = self.session.tasks.spawn(handler)
+            try:
+                await asyncio.wait([turn])
+                if turn.cancelled():
+                    logging.info(f"Sessione {self.session.session_id}: turno AI annullato dal barge-in.")
+                elif turn.exception() is not None:
+                    logging.error(f"Errore durante il turno AI: {turn.exception()}")
+                else:
+                    self.turns_processed += 1
+            finally:
+                if not turn.done():
+                    turn.cancel()  # pipeline fermata: il gruppo di task attende anche il turno
+                self._current_turn = None
+                self.turns.task_done()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Modalità realtime: lo stream Twilio collegato a una sessione speech-to-speech
+"""
+import asyncio
+import logging
+import math
+import time
+from typing import Optional
+
+from config import (
+    FRAME_QUEUE_MAXSIZE, FRAME_DROP_POLICY, TWILIO_SAMPLE_RATE, TWILIO_BYTES_PER_FRAME,
+)
+from ai.realtime import Event, RealtimeClient, RealtimeConnection
+from audio.playback import send_clear, send_mark
+from call.pipeline import BoundedQueue
+from call.session import CallSession
+from database.tenant_settings import TenantSettings
+from metrics.registry import metrics, TurnSpans, ROUTE_REALTIME, STAGE_REALTIME
+
+
+def ulaw_bytes(payload: str) -> int:
+    """Byte di µ-law contenuti in un payload base64, senza decodificarlo"""
+    return len(payload) * 3 // 4 - payload[-2:].count("=")
+
+
+class RealtimeBridge:
+    """
+    Collega una chiamata a una sessione realtime:
+    1. Il loop di ricezione accoda il payload base64 di Twilio (mai bloccante)
+    2. Un task lo inoltra alla sessione così com'è: nessuna decodifica né ricampionamento
+    3. Un task legge gli eventi della sessione e accoda l'audio della risposta, già in µ-law
+    4. Un task lo invia a Twilio, dopo l'eventuale saluto ancora in riproduzione
+
+    Fine del turno, trascrizione, risposta e voce avvengono nella sessione: nessuna richiesta
+    HTTP per turno. Se la sessione non si apre o cade, `failed` diventa True e la chiamata
+    prosegue con la CallPipeline.
+    """
+
+    def __init__(self, session: CallSession, client: RealtimeClient, settings: TenantSettings,
+                 instructions: str, greeting: Optional[str] = None):
+        self.session = session
+        self.client = client
+        self.settings = settings
+        self.instructions = instructions
+        self.greeting = greeting
+        session.realtime = self
+        self.frames = BoundedQueue(FRAME_QUEUE_MAXSIZE, FRAME_DROP_POLICY)
+        # Audio e fine delle risposte verso Twilio, nell'ordine di arrivo, con il turno a cui appartengono
+        self.playback: asyncio.Queue = asyncio.Queue()
+        self.frames_received = 0
+        self.turns_processed = 0
+        self.turns_dropped = 0
+        self.barge_ins = 0
+        self.failed = False
+        self._connection: Optional[RealtimeConnection] = None
+        self._spans: Optional[TurnSpans] = None  # turno in corso, dalla fine del parlato
+        self._responding = False
+        self._response_id: Optional[str] = None
+        self._interrupted: Optional[str] = None  # risposta annullata: i suoi ultimi delta si scartano
+        # Audio della risposta corrente: risposta, item, inizio della riproduzione (perf_counter) e byte inviati
+        self._audio_response: Optional[str] = None
+        self._item_id: Optional[str] = None
+        self._audio_started = 0.0
+        self._audio_bytes = 0
+
+    @property
+    def frames_dropped(self) -> int:
+        return self.frames.dropped
+
+    def start(self):
+        """Apre la sessione in background, nel gruppo di task della chiamata"""
+        self.session.tasks.spawn(self._run(), name=f"realtime-{self.session.session_id}", long_lived=True)
+
+    def push_media(self, payload: str):
+        """Chiamato dal loop di ricezione per ogni messaggio 'media': non attende mai"""
+        self.frames_received += 1
+        metrics.frame_rate.add()
+        if not self.frames.put(payload) and self.frames.dropped % FRAME_QUEUE_MAXSIZE == 1:
+            logging.warning(
+                f"Sessione {self.session.session_id}: coda audio realtime piena, "
+                f"{self.frames.dropped} frame scartati ({self.frames.policy})"
+            )
+
+    async def _run(self):
+        session = self.session
+        try:
+            connection = self._connection = await self.client.connect(self.settings, self.instructions)
+        except Exception as e:
+            self.failed = True
+            logging.error(f"Sessione {session.session_id}: sessione realtime non disponibile ({e}). Uso la pipeline.")
+            return
+        logging.info(f"Sessione {session.session_id}: sessione realtime aperta ({self.settings.realtime_model}).")
+        if self.greeting:
+            # Il saluto è riprodotto da Twilio: il modello deve sapere che è già stato detto
+            await connection.send({"type": "conversation.item.create", "item": {
+                "type": "message", "role": "assistant", "content": [{"type": "text", "text": self.greeting}]}})
+        sender = session.tasks.spawn(self._send_loop(connection), name=f"realtime-audio-{session.session_id}",
+                                     long_lived=True)
+        player = session.tasks.spawn(self._play_loop(), name=f"realtime-risposta-{session.session_id}",
+                                     long_lived=True)
+        try:
+            async for event in connection.events():
+                await self._handle(event)
+            self.failed = True
+            logging.error(f"Sessione {session.session_id}: sessione realtime chiusa dal server. Uso la pipeline.")
+        except Exception as e:
+            self.failed = True
+            logging.error(f"Sessione {session.session_id}: errore nella sessione realtime ({e}). Uso la pipeline.")
+        finally:
+            sender.cancel()
+            player.cancel()
+            await connection.close()
+
+    async def _send_loop(self, connection: RealtimeConnection):
+        """Inoltra l'audio del chiamante alla sessione"""
+        while True:
+            payload = await self.frames.get()
+            try:
+                await connection.append_audio(payload)
+            finally:
+                self.frames.task_done()
+
+    async def _play_loop(self):
+        """Inoltra a Twilio le risposte accodate: solo qui si attende la fine del saluto"""
+        while True:
+            event, spans = await self.playback.get()
+            if event["type"] == "response.done":
+                await self._response_done(event.get("response", {}), spans)
+            else:
+                await self._forward_audio(event, spans)
+
+    async def _handle(self, event: Event):
+        kind = event.get("type")
+        if kind == "response.audio.delta":
+            self.playback.put_nowait((event, self._spans))
+        elif kind == "input_audio_buffer.speech_started":
+            await self._caller_started()
+        elif kind == "input_audio_buffer.speech_stopped":
+            # Il server ha rilevato la fine del turno: da qui si misura la latenza della risposta
+            self._spans = TurnSpans(self.session.numero_chiamato)
+            self._spans.route = ROUTE_REALTIME
+        elif kind == "response.created":
+            self._responding = True
+            self._response_id = event.get("response", {}).get("id")
+        elif kind == "response.done":
+            # Il marker e la misura del turno seguono l'audio ancora in coda
+            spans, self._spans = self._spans, None
+            self.playback.put_nowait((event, spans))
+        elif kind == "conversation.item.input_audio_transcription.completed":
+            logging.info(f"Testo trascritto: '{event.get('transcript', '').strip()}'")
+        elif kind == "response.audio_transcript.done":
+            logging.info(f"Risposta AI (testo): '{event.get('transcript', '')}'")
+        elif kind == "error":
+            logging.error(f"Sessione {self.session.session_id}: errore realtime: {event.get('error')}")
+
+    async def _forward_audio(self, event: Event, spans: Optional[TurnSpans]):
+        """Audio della risposta verso Twilio, già in µ-law: il payload base64 passa così com'è"""
+        session = self.session
+        new_item = event.get("item_id") != self._item_id
+        if new_item and session.greeting_task is not None:
+            # La risposta non si sovrappone al saluto
+            await asyncio.wait([session.greeting_task])
+        if self._interrupted is not None and event.get("response_id") == self._interrupted:
+            return
+        if new_item:
+            self._audio_response = event.get("response_id")
+            self._item_id = event.get("item_id")
+            self._audio_started = time.perf_counter()
+            self._audio_bytes = 0
+            if spans is not None:
+                spans.mark_first_audio()
+        payload = event["delta"]
+        await session.websocket.send_json({"event": "media", "streamSid": session.stream_sid,
+                                           "media": {"payload": payload}})
+        self._audio_bytes += ulaw_bytes(payload)
+
+    async def _response_done(self, response: Event, spans: Optional[TurnSpans]):
+        session = self.session
+        self._responding = False
+        status = response.get("status")
+        completed_audio = self._audio_response == response.get("id") and response.get("id") != self._interrupted
+        if self._audio_bytes and completed_audio:
+            frames = math.ceil(self._audio_bytes / TWILIO_BYTES_PER_FRAME)
+            await send_mark(session.websocket, session.stream_sid, session.audio_queued(frames, self._audio_started))
+        if spans is None:
+            return
+        spans.add(STAGE_REALTIME, spans.elapsed())
+        if status == "cancelled":
+            spans.cancelled[STAGE_REALTIME] += 1
+        elif status == "completed":
+            self.turns_processed += 1
+        else:
+            spans.failed = True
+            logging.error(f"Sessione {session.session_id}: risposta realtime non completata: {response.get('status_details')}")
+        metrics.observe_turn(spans)
+
+    async def _caller_started(self):
+        """Il chiamante parla: se l'assistente sta parlando si ferma l'audio (barge-in)"""
+        session = self.session
+        greeting = session.greeting_task
+        greeting_playing = greeting is not None and not greeting.done()
+        if not (self._responding or greeting_playing or session.is_playing()):
+            return
+        # La risposta in corso viene annullata dal server (interrupt_response): si scartano i suoi ultimi delta
+        self._interrupted = self._response_id
+        if greeting_playing:
+            # Come nella pipeline: annullato il saluto non invia altro audio, senza attenderne la fine
+            greeting.cancel()
+        if self._audio_bytes and (self._responding or session.is_playing()):
+            # Il modello deve sapere fin dove il chiamante ha sentito la risposta
+            played_ms = int((time.perf_counter() - self._audio_started) * 1000)
+            sent_ms = self._audio_bytes * 1000 // TWILIO_SAMPLE_RATE
+            await self._connection.send({"type": "conversation.item.truncate", "item_id": self._item_id,
+                                         "content_index": 0, "audio_end_ms": max(0, min(played_ms, sent_ms))})
+        session.clear_playback()
+        self.barge_ins += 1
+        try:
+            await send_clear(session.websocket, session.stream_sid)
+        except Exception as e:
+            logging.error(f"Errore nell'invio del 'clear' a Twilio: {e}")
+        logging.info(f"Sessione {session.session_id}: il chiamante ha interrotto l'assistente, audio scartato.")
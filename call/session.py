@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Stato per-chiamata del Receptionist AI
+"""
+import asyncio
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Optional, Any, Dict, List, Set
+
+import webrtcvad
+from fastapi import WebSocket
+
+from config import VAD_AGGRESSIVENESS, TWILIO_FRAME_MS
+from audio.ring_buffer import SpeechRingBuffer
+from ai.conversation import ConversationMemory
+from call.tasks import CallTaskGroup
+from database.tenant_settings import TenantSettings
+
+
+@dataclass
+class CallSession:
+    """Stato di una singola chiamata: ogni connessione WebSocket ha la sua sessione"""
+    websocket: WebSocket
+    numero_chiamato: str
+    session_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    stream_sid: Optional[str] = None
+    call_logged: bool = False  # inizio chiamata accodato nel log chiamate
+    call_start_time: Optional[float] = None
+
+    # Stato VAD / turno di parola
+    is_speaking: bool = False
+    silence_frames: int = 0
+    audio_buffer: SpeechRingBuffer = field(default_factory=SpeechRingBuffer)
+    vad: webrtcvad.Vad = field(default_factory=lambda: webrtcvad.Vad(VAD_AGGRESSIVENESS))
+    # Cronologia dei turni inviata all'LLM, entro il budget di token
+    conversation: ConversationMemory = field(default_factory=ConversationMemory)
+    # Modelli, voce e soglie del ristorante chiamato (None = default, finché non è noto)
+    settings: Optional[TenantSettings] = None
+    # CallPipeline che elabora l'audio della sessione (impostata dalla pipeline stessa)
+    pipeline: Optional[Any] = None
+    # RealtimeBridge dei ristoranti in modalità realtime (impostata dal bridge stesso)
+    realtime: Optional[Any] = None
+    # Lavoro in background della chiamata: annullato tutto insieme quando la chiamata finisce
+    tasks: CallTaskGroup = field(default_factory=CallTaskGroup)
+    # Invio del saluto iniziale: le risposte aspettano che sia terminato
+    greeting_task: Optional[asyncio.Task] = None
+
+    # Audio inviato a Twilio e non ancora riprodotto: marker in attesa e fine stimata
+    # (perf_counter). La stima copre i client che non rimandano i marker
+    pending_marks: Set[str] = field(default_factory=set)
+    playback_until: float = 0.0
+    marks_sent: int = 0
+    # Frase del chiamante interrotta da un barge-in prima della risposta: si unisce alla successiva
+    unanswered_text: str = ""
+
+    def __post_init__(self):
+        self.tasks.name = self.session_id
+
+    def start(self, stream_sid: Optional[str]):
+        """Segna l'inizio della chiamata"""
+        self.stream_sid = stream_sid
+        self.call_start_time = time.time()
+
+    def reset_turn(self):
+        """Prepara la sessione per il prossimo turno di parola"""
+        self.audio_buffer.reset()
+        self.is_speaking = False
+        self.silence_frames = 0
+
+    def audio_queued(self, frames: int, first_frame_at: float) -> str:
+        """Registra l'audio inviato a Twilio e ritorna il nome del marker che ne segnala la fine"""
+        start = max(self.playback_until, first_frame_at)
+        self.playback_until = start + frames * TWILIO_FRAME_MS / 1000
+        self.marks_sent += 1
+        name = f"audio-{self.marks_sent}"
+        self.pending_marks.add(name)
+        return name
+
+    def audio_played(self, name: Optional[str]):
+        """Twilio ha riprodotto (o scartato) l'audio fino al marker"""
+        self.pending_marks.discard(name)
+        if not self.pending_marks:
+            self.playback_until = 0.0
+
+    def clear_playback(self):
+        self.pending_marks.clear()
+        self.playback_until = 0.0
+
+    def is_playing(self) -> bool:
+        """Twilio sta ancora riproducendo audio dell'assistente"""
+        return bool(self.pending_marks) and time.perf_counter() < self.playback_until
+
+    def duration(self) -> int:
+        """Durata della chiamata in secondi"""
+        if not self.call_start_time:
+            return 0
+        return int(time.time() - self.call_start_time)
+
+
+class SessionRegistry:
+    """Registro delle chiamate attive nel processo"""
+
+    def __init__(self):
+        self._sessions: Dict[str, CallSession] = {}
+        # Contatori delle chiamate già terminate
+        self.totals: Dict[str, int] = {
+            'calls': 0, 'frames_received': 0, 'frames_dropped': 0,
+            'turns_processed': 0, 'turns_dropped': 0, 'barge_ins': 0,
+            'tasks_cancelled': 0, 'tasks_abandoned': 0,
+        }
+
+    def register(self, session: CallSession) -> CallSession:
+        """Aggiunge una sessione al registro"""
+        self._sessions[session.session_id] = session
+        logging.info(f"Sessione {session.session_id} registrata. Chiamate attive: {len(self._sessions)}")
+        return session
+
+    def unregister(self, session: CallSession):
+        """Rimuove una sessione dal registro"""
+        if self._sessions.pop(session.session_id, None) is not None:
+            self.totals['calls'] += 1
+            self.totals['tasks_cancelled'] += session.tasks.cancelled
+            self.totals['tasks_abandoned'] += session.tasks.abandoned
+            self._add_pipeline_counters(self.totals, session)
+            logging.info(f"Sessione {session.session_id} rimossa. Chiamate attive: {len(self._sessions)}")
+
+    def get(self, session_id: str) -> Optional[CallSession]:
+        """Recupera una sessione dal suo ID"""
+        return self._sessions.get(session_id)
+
+    def get_by_stream_sid(self, stream_sid: str) -> Optional[CallSession]:
+        """Recupera una sessione dallo Stream SID di Twilio"""
+        for session in self._sessions.values():
+            if session.stream_sid == stream_sid:
+                return session
+        return None
+
+    def sessions(self) -> List[CallSession]:
+        """Elenco delle sessioni attive"""
+        return list(self._sessions.values())
+
+    def stats(self) -> Dict[str, int]:
+        """Contatori cumulativi: chiamate terminate più quelle ancora attive"""
+        stats = dict(self.totals)
+        stats['active_calls'] = len(self._sessions)
+        for session in self._sessions.values():
+            self._add_pipeline_counters(stats, session)
+        return stats
+
+    @staticmethod
+    def _add_pipeline_counters(counters: Dict[str, int], session: CallSession):
+        for pipeline in (session.pipeline, session.realtime):
+            if pipeline is None:
+                continue
+            counters['frames_received'] += pipeline.frames_received
+            counters['frames_dropped'] += pipeline.frames_dropped
+            counters['turns_processed'] += pipeline.turns_processed
+            counters['turns_dropped'] += pipeline.turns_dropped
+            counters['barge_ins'] += pipeline.barge_ins
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+
+# Registro globale delle chiamate attive
+session_registry = SessionRegistry()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Gruppo dei task in background di una chiamata, annullati tutti insieme quando la chiamata finisce
+"""
+import asyncio
+import logging
+from typing import Coroutine, Optional, Set
+
+from config import CALL_TEARDOWN_TIMEOUT
+
+
+class CallTaskGroup:
+    """
+    Task di una chiamata (VAD, turni AI, saluto). Alla fine della chiamata cancel() li annulla
+    tutti: trascrizioni, completamenti e sintesi in corso si fermano invece di arrivare in fondo
+    per poi essere scartati. L'attesa della loro chiusura è limitata da un timeout.
+
+    I task che durano quanto la chiamata (long_lived: loop del VAD, worker dei turni, sessione
+    realtime) sono sempre in corso alla chiusura: vengono fermati ma non contati in `cancelled`,
+    che conta solo il lavoro AI interrotto dal riaggancio.
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._tasks: Set[asyncio.Task] = set()
+        self._long_lived: Set[asyncio.Task] = set()
+        self.closed = False
+        self.cancelled = 0  # task di lavoro AI annullati alla chiusura
+        self.abandoned = 0  # task non terminati entro il timeout
+
+    def spawn(self, coro: Coroutine, name: Optional[str] = None, long_lived: bool = False) -> asyncio.Task:
+        """Avvia un task legato alla chiamata"""
+        if self.closed:
+            coro.close()
+            raise RuntimeError(f"Chiamata {self.name} già terminata: task non avviato")
+        task = asyncio.create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        if long_lived:
+            self._long_lived.add(task)
+            task.add_done_callback(self._long_lived.discard)
+        return task
+
+    async def cancel(self, timeout: float = CALL_TEARDOWN_TIMEOUT) -> int:
+        """
+        Annulla i task ancora in corso e ne attende la fine per al massimo timeout secondi.
+        Ritorna i task di lavoro AI annullati, esclusi quelli long_lived
+        """
+        self.closed = True
+        pending = [task for task in self._tasks if not task.done()]
+        if not pending:
+            return 0
+        interrupted = sum(1 for task in pending if task not in self._long_lived)
+        for task in pending:
+            task.cancel()
+        _, still_running = await asyncio.wait(pending, timeout=timeout)
+        self.cancelled += interrupted
+        if still_running:
+            # Restano in background ma la chiamata non li aspetta: le sue risorse vengono liberate
+            self.abandoned += len(still_running)
+            logging.warning(f"Chiamata {self.name}: {len(still_running)} task non terminati entro {timeout}s dalla chiusura")
+        return interrupted
+
+    def __len__(self) -> int:
+        return sum(1 for task in self._tasks if not task.done())
@@ -6,6 +6,8 @@ load_dotenv()
 
 # Configurazione OpenAI
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Endpoint alternativo compatibile (es. il sostituto locale usato da load_test.py)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
 
 # Configurazione VAD (Voice Activity Detection)
 VAD_AGGRESSIVENESS = 3  # Da 0 (meno aggressivo) a 3 (più aggressivo)
@@ -23,3 +25,135 @@ Rispondi in modo cortese e conciso. Sei specializzato in:
 - Specialità del giorno
 
 Rispondi sempre in italiano in modo professionale ma amichevole."""
+
+# Configurazione pipeline per-chiamata
+# Coda dei frame in ingresso: ogni messaggio 'media' di Twilio sono 20ms di audio,
+# 50 frame = 1 secondo di margine prima di iniziare a scartare.
+FRAME_QUEUE_MAXSIZE = int(os.getenv("FRAME_QUEUE_MAXSIZE", "50"))
+FRAME_DROP_POLICY = os.getenv("FRAME_DROP_POLICY", "drop_oldest")  # drop_oldest | drop_newest
+# Turni in attesa mentre l'AI sta ancora rispondendo al precedente
+TURN_QUEUE_MAXSIZE = int(os.getenv("TURN_QUEUE_MAXSIZE", "1"))
+TURN_DROP_POLICY = os.getenv("TURN_DROP_POLICY", "drop_oldest")  # drop_oldest | drop_newest
+
+# Fine del turno (endpointing): silenzio dopo il parlato che chiude il turno
+ENDPOINT_SILENCE_MS = int(os.getenv("ENDPOINT_SILENCE_MS", "750"))
+# Trascrizione speculativa: parte dopo un silenzio più breve ed è già pronta (o quasi) alla fine
+# del turno; se il chiamante riprende a parlare prima di ENDPOINT_SILENCE_MS viene scartata
+SPECULATIVE_TRANSCRIPTION = os.getenv("SPECULATIVE_TRANSCRIPTION", "true").lower() == "true"
+SPECULATIVE_SILENCE_MS = int(os.getenv("SPECULATIVE_SILENCE_MS", "300"))
+
+# Barge-in: se il chiamante parla mentre l'assistente pensa o parla, l'audio in coda su Twilio
+# viene scartato ('clear') e la generazione in corso (LLM e TTS) annullata
+BARGE_IN_ENABLED = os.getenv("BARGE_IN_ENABLED", "true").lower() == "true"
+# Parlato continuo necessario per interrompere: colpi di tosse e rumori brevi non bastano
+BARGE_IN_MIN_SPEECH_MS = int(os.getenv("BARGE_IN_MIN_SPEECH_MS", "240"))
+# Attesa massima, alla fine di una chiamata, della chiusura dei suoi task annullati
+CALL_TEARDOWN_TIMEOUT = float(os.getenv("CALL_TEARDOWN_TIMEOUT", "2"))
+
+# Configurazione audio in uscita verso Twilio
+TTS_SAMPLE_RATE = 24000  # OpenAI TTS restituisce PCM 16-bit a 24kHz
+TWILIO_SAMPLE_RATE = 8000
+TWILIO_FRAME_MS = 20
+TWILIO_BYTES_PER_FRAME = int(TWILIO_SAMPLE_RATE * (TWILIO_FRAME_MS / 1000.0))  # µ-law: 1 byte per campione
+TTS_STREAM_CHUNK_BYTES = 4800  # 100ms di PCM a 24kHz letti per volta dallo stream TTS
+
+# Configurazione risposta in streaming (LLM → TTS frase per frase)
+LLM_STREAMING = os.getenv("LLM_STREAMING", "true").lower() == "true"
+TTS_SEGMENT_MIN_CHARS = 20   # Evita di sintetizzare frammenti troppo corti ("Sì.")
+TTS_SEGMENT_MAX_CHARS = 200  # Oltre questa lunghezza si spezza anche senza punteggiatura
+TTS_MAX_PREFETCH = 2         # Segmenti sintetizzati in parallelo mentre il precedente è in riproduzione
+
+# Configurazione cache dei ristoranti (tenant)
+TENANT_CACHE_TTL_SECONDS = float(os.getenv("TENANT_CACHE_TTL_SECONDS", "300"))
+TENANT_CACHE_MAX_SIZE = int(os.getenv("TENANT_CACHE_MAX_SIZE", "1000"))
+TENANT_NOTIFY_CHANNEL = "ristoranti_changed"  # Canale LISTEN/NOTIFY per l'invalidazione
+
+# Configurazione buffer audio del chiamante
+TURN_MAX_SECONDS = 30       # Oltre questa durata il turno viene chiuso comunque
+SPEECH_PREROLL_MS = 300     # Audio conservato prima dell'inizio del parlato
+SPEECH_TRAILING_MS = 200    # Silenzio conservato dopo l'ultimo frame di parlato
+
+# Configurazione provider AI
+AI_PROVIDER = os.getenv("AI_PROVIDER", "openai")  # openai | local
+STT_MODEL = "whisper-1"
+LLM_MODEL = "gpt-4o-mini"
+LLM_TEMPERATURE = 0.7
+TTS_MODEL = "tts-1"
+TTS_VOICE = "nova"
+TTS_VOICES = ("alloy", "ash", "coral", "echo", "fable", "nova", "onyx", "sage", "shimmer")
+# Latenze artificiali del provider locale (millisecondi), per benchmark e test senza rete
+LOCAL_AI_STT_MS = float(os.getenv("LOCAL_AI_STT_MS", "0"))
+LOCAL_AI_LLM_FIRST_TOKEN_MS = float(os.getenv("LOCAL_AI_LLM_FIRST_TOKEN_MS", "0"))
+LOCAL_AI_LLM_TOKEN_MS = float(os.getenv("LOCAL_AI_LLM_TOKEN_MS", "0"))
+LOCAL_AI_TTS_FIRST_BYTE_MS = float(os.getenv("LOCAL_AI_TTS_FIRST_BYTE_MS", "0"))
+
+# Modalità di conversazione (default; per ristorante con la chiave 'modalita' in configurazioni):
+# pipeline = VAD → STT → LLM → TTS, realtime = sessione speech-to-speech con µ-law in entrambe le direzioni
+CALL_MODE_PIPELINE = "pipeline"
+CALL_MODE_REALTIME = "realtime"
+CALL_MODES = (CALL_MODE_PIPELINE, CALL_MODE_REALTIME)
+CALL_MODE = os.getenv("CALL_MODE", CALL_MODE_PIPELINE)
+
+# Configurazione sessioni realtime (protocollo OpenAI Realtime, audio g711_ulaw, fine turno lato server)
+OPENAI_REALTIME_URL = os.getenv("OPENAI_REALTIME_URL") or None  # default: derivato da OPENAI_BASE_URL
+REALTIME_MODEL = "gpt-4o-realtime-preview"
+REALTIME_VOICE = "alloy"  # usata se la voce TTS del ristorante non esiste in realtime
+REALTIME_VOICES = ("alloy", "ash", "ballad", "coral", "echo", "sage", "shimmer", "verse")
+REALTIME_CONNECT_TIMEOUT = float(os.getenv("REALTIME_CONNECT_TIMEOUT", "5"))  # oltre si resta sulla pipeline
+
+# Configurazione metriche (/metrics)
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0)  # secondi
+METRICS_MAX_TENANTS = 500              # Oltre questo numero i ristoranti confluiscono nell'etichetta "altro"
+METRICS_FRAME_RATE_WINDOW_SECONDS = 10  # Finestra della media dei frame ricevuti al secondo
+
+# Configurazione memoria della conversazione
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "1500"))  # token stimati per richiesta LLM
+CONVERSATION_SUMMARY_TOKENS = 200  # spazio massimo del riassunto dei turni più vecchi
+
+# Configurazione cache dell'audio sintetizzato (µ-law a 8kHz pronto da inviare)
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))  # ~70 minuti di audio in memoria
+# Archivio su disco opzionale (vuoto = solo memoria). Su Cloud Run il filesystem locale è in RAM e
+# conta nel limite di memoria del container (512Mi): va attivato solo con un volume o un budget piccolo
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "")
+TTS_CACHE_DISK_MAX_BYTES = int(os.getenv("TTS_CACHE_DISK_MAX_BYTES", str(64 * 1024 * 1024)))
+TTS_CACHE_MAX_TEXT_CHARS = 300  # i testi più lunghi sono quasi sempre unici: non vengono salvati
+
+# Configurazione saluto iniziale
+GREETINGS_ENABLED = os.getenv("GREETINGS_ENABLED", "true").lower() == "true"
+GREETING_CONFIG_KEY = "saluto"  # chiave in configurazioni per un saluto personalizzato
+GREETING_TEMPLATE = "Buongiorno, grazie per aver chiamato {nome_ristorante}. Come posso aiutarti?"
+GREETING_GENERIC = "Buongiorno, come posso aiutarti?"
+GREETING_WARM_CONCURRENCY = 2  # saluti sintetizzati in parallelo durante il riscaldamento
+
+# Configurazione risposte rapide (FAQ senza LLM)
+FAQ_FAST_PATH = os.getenv("FAQ_FAST_PATH", "true").lower() == "true"
+FAQ_MIN_SCORE = 2.0   # punteggio minimo di un intento per rispondere senza LLM
+FAQ_MAX_WORDS = 25    # frasi più lunghe contengono quasi sempre altre richieste
+FAQ_HOURS_TEMPLATE = "I nostri orari sono: {orari_apertura}."
+FAQ_ADDRESS_TEMPLATE = "Ci trovi in {indirizzo}."
+
+# Configurazione scrittura asincrona del log chiamate
+CALL_LOG_QUEUE_MAXSIZE = int(os.getenv("CALL_LOG_QUEUE_MAXSIZE", "10000"))  # eventi in attesa prima di scartare
+CALL_LOG_BATCH_SIZE = 200           # eventi scritti per transazione; a questa soglia si scrive subito
+CALL_LOG_FLUSH_INTERVAL = 1.0       # secondi massimi di attesa prima di una scrittura
+CALL_LOG_DRAIN_TIMEOUT = 10.0       # secondi concessi allo svuotamento della coda alla chiusura
+CALL_LOG_MAX_ATTEMPTS = 10          # tentativi (con attesa crescente, max 30s) prima di scartare un blocco
+
+# Configurazione statistiche giornaliere delle chiamate
+# Fuso orario in cui si conta il "giorno" di una chiamata. Entra nel trigger creato dalle migrazioni:
+# se cambia servono una nuova migrazione del trigger e backfill_call_stats.py
+STATS_TIMEZONE = os.getenv("STATS_TIMEZONE", "Europe/Rome")
+
+# Configurazione partizioni mensili di chiamate_log
+CALL_LOG_PARTITION_MONTHS_AHEAD = 3        # mesi futuri con la partizione già pronta
+CALL_LOG_RETENTION_MONTHS = int(os.getenv("CALL_LOG_RETENTION_MONTHS", "0"))  # mesi conservati oltre al corrente, 0 = tutti
+CALL_LOG_PARTITION_CHECK_INTERVAL = 6 * 3600  # secondi tra due controlli delle partizioni
+
+# Configurazione pool di connessioni al database
+# Connessioni totali verso Cloud SQL ≈ istanze × (DB_POOL_MAX_SIZE + 1 connessione LISTEN)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))    # connessioni aperte e preparate all'avvio
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_MAX_IDLE_SECONDS = float(os.getenv("DB_POOL_MAX_IDLE_SECONDS", "300"))  # chiusura delle connessioni inattive oltre il minimo
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "5"))  # attesa massima di una connessione libera
+DB_QUERY_TIMEOUT = float(os.getenv("DB_QUERY_TIMEOUT", "5"))  # secondi per ogni query del registro
+METRICS_DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)  # secondi
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Partizioni mensili di chiamate_log: creazione dei mesi futuri, retention e migrazione
+"""
+import asyncio
+import logging
+import re
+from datetime import date, datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+
+from config import CALL_LOG_PARTITION_MONTHS_AHEAD, CALL_LOG_RETENTION_MONTHS, CALL_LOG_PARTITION_CHECK_INTERVAL
+
+DEFAULT_PARTITION = "chiamate_log_default"
+UNPARTITIONED_TABLE = "chiamate_log_non_partizionata"
+_PARTITION_NAME = re.compile(r"^chiamate_log_(\d{4})_(\d{2})$")
+
+# Una sola istanza alla volta crea o elimina partizioni
+MAINTENANCE_LOCK_ID = 7310018
+
+# chiamate_log partizionata per mese su timestamp_inizio. La chiave primaria deve contenere
+# la colonna di partizione; l'id resta unico perché viene dalla sequenza.
+CALL_LOG_TABLE = """
+    CREATE TABLE chiamate_log (
+        id INTEGER NOT NULL DEFAULT nextval('chiamate_log_id_seq'),
+        ristorante_id INTEGER REFERENCES ristoranti(id),
+        stream_sid VARCHAR(100) NOT NULL,
+        numero_chiamante VARCHAR(50),
+        numero_chiamato VARCHAR(50),
+        durata_chiamata INTEGER, -- in secondi
+        timestamp_inizio TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        timestamp_fine TIMESTAMP WITH TIME ZONE,
+        status VARCHAR(20) DEFAULT 'completed', -- completed, failed, escalated
+        PRIMARY KEY (id, timestamp_inizio)
+    ) PARTITION BY RANGE (timestamp_inizio);
+"""
+
+# BRIN sul tempo: poche pagine e quasi nessun costo in scrittura, le righe arrivano in ordine.
+# stream_sid resta B-tree perché la fine chiamata aggiorna la riga per stream_sid.
+CALL_LOG_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_chiamate_timestamp_brin ON chiamate_log USING BRIN (timestamp_inizio);",
+    "CREATE INDEX IF NOT EXISTS idx_chiamate_stream_sid ON chiamate_log(stream_sid);",
+]
+
+IS_PARTITIONED_SQL = """
+    SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('chiamate_log')
+"""
+
+LIST_PARTITIONS_SQL = """
+    SELECT c.relname
+    FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'chiamate_log'::regclass
+"""
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"chiamate_log_{month.year:04d}_{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    """Mese di una partizione dal nome, None per le tabelle non gestite (es. la default)"""
+    match = _PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def plan_partitions(today: date, existing: Iterable[str], months_ahead: int,
+                    retention_months: int) -> Tuple[List[date], List[str]]:
+    """
+    Mesi da creare (il corrente e i successivi months_ahead) e partizioni da eliminare:
+    oltre al mese corrente se ne conservano retention_months completi, 0 = tutte
+    """
+    current = month_start(today)
+    existing_months = {partition_month(name): name for name in existing if partition_month(name)}
+    to_create = [month for month in (add_months(current, i) for i in range(months_ahead + 1))
+                 if month not in existing_months]
+    to_drop = []
+    if retention_months > 0:
+        oldest_kept = add_months(current, -retention_months)
+        to_drop = sorted(name for month, name in existing_months.items() if month < oldest_kept)
+    return to_create, to_drop
+
+
+def create_partition_sql(month: date) -> str:
+    start, end = month, add_months(month, 1)
+    return (f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF chiamate_log "
+            f"FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') TO ('{end.isoformat()} 00:00:00+00');")
+
+
+async def is_partitioned(connection) -> bool:
+    return bool(await connection.fetchval(IS_PARTITIONED_SQL))
+
+
+async def create_call_log_table(connection, months: Iterable[date]):
+    """Crea chiamate_log partizionata con le partizioni dei mesi indicati, la default e gli indici"""
+    await connection.execute("CREATE SEQUENCE IF NOT EXISTS chiamate_log_id_seq;")
+    await connection.execute(CALL_LOG_TABLE)
+    await connection.execute("ALTER SEQUENCE chiamate_log_id_seq OWNED BY chiamate_log.id;")
+    for month in months:
+        await connection.execute(create_partition_sql(month))
+    # Le righe fuori dalle partizioni mensili (es. manutenzione ferma) non vengono perse
+    await connection.execute(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF chiamate_log DEFAULT;")
+    for sql in CALL_LOG_INDEXES:
+        await connection.execute(sql)
+
+
+async def migrate_to_partitions(connection, months_ahead: int = CALL_LOG_PARTITION_MONTHS_AHEAD) -> int:
+    """
+    Converte una chiamate_log non partizionata copiando le righe nelle partizioni mensili.
+    Le scritture sul log restano bloccate fino al termine. Ritorna le righe copiate
+    """
+    async with connection.transaction():
+        if await is_partitioned(connection):
+            return 0
+        await connection.execute("LOCK TABLE chiamate_log IN ACCESS EXCLUSIVE MODE;")
+        await connection.execute(f"ALTER TABLE chiamate_log RENAME TO {UNPARTITIONED_TABLE};")
+        await connection.execute(f"ALTER TABLE {UNPARTITIONED_TABLE} RENAME CONSTRAINT chiamate_log_pkey TO {UNPARTITIONED_TABLE}_pkey;")
+        await connection.execute(
+            "DROP INDEX IF EXISTS idx_chiamate_ristorante_id, idx_chiamate_timestamp, idx_chiamate_stream_sid;"
+        )
+
+        first, last = await connection.fetchrow(
+            f"SELECT MIN(COALESCE(timestamp_inizio, timestamp_fine)), MAX(COALESCE(timestamp_inizio, timestamp_fine)) "
+            f"FROM {UNPARTITIONED_TABLE}"
+        )
+        current = month_start(datetime.now(timezone.utc).date())
+        start = month_start(first.astimezone(timezone.utc).date()) if first else current
+        end = max(add_months(current, months_ahead),
+                  month_start(last.astimezone(timezone.utc).date()) if last else current)
+        months = []
+        while start <= end:
+            months.append(start)
+            start = add_months(start, 1)
+        await create_call_log_table(connection, months)
+
+        status = await connection.execute(f"""
+            INSERT INTO chiamate_log
+            (id, ristorante_id, stream_sid, numero_chiamante, numero_chiamato, durata_chiamata,
+             timestamp_inizio, timestamp_fine, status)
+            SELECT id, ristorante_id, stream_sid, numero_chiamante, numero_chiamato, durata_chiamata,
+                   COALESCE(timestamp_inizio, timestamp_fine, CURRENT_TIMESTAMP), timestamp_fine, status
+            FROM {UNPARTITIONED_TABLE}
+        """)
+        await connection.execute(f"DROP TABLE {UNPARTITIONED_TABLE};")
+    return int(status.split()[-1])
+
+
+async def maintain_partitions(connection, today: Optional[date] = None,
+                             months_ahead: int = CALL_LOG_PARTITION_MONTHS_AHEAD,
+                             retention_months: int = CALL_LOG_RETENTION_MONTHS) -> Tuple[List[str], List[str]]:
+    """Crea i mesi mancanti ed elimina quelli scaduti. Ritorna i nomi creati ed eliminati"""
+    today = today or datetime.now(timezone.utc).date()
+    async with connection.transaction():
+        if not await is_partitioned(connection):
+            return [], []
+        locked = await connection.fetchval("SELECT pg_try_advisory_xact_lock($1)", MAINTENANCE_LOCK_ID)
+        if not locked:
+            return [], []  # un'altra istanza sta già facendo la manutenzione
+        existing = [row['relname'] for row in await connection.fetch(LIST_PARTITIONS_SQL)]
+        to_create, to_drop = plan_partitions(today, existing, months_ahead, retention_months)
+        for month in to_create:
+            await connection.execute(create_partition_sql(month))
+        # DROP invece di DELETE: nessuna scansione, nessun vacuum; le statistiche giornaliere restano
+        for name in to_drop:
+            await connection.execute(f"DROP TABLE IF EXISTS {name};")
+
+    created = [partition_name(month) for month in to_create]
+    if created:
+        logging.info(f"Partizioni del log chiamate create: {', '.join(created)}")
+    if to_drop:
+        logging.info(f"Partizioni del log chiamate eliminate (retention {retention_months} mesi): {', '.join(to_drop)}")
+    return created, to_drop
+
+
+class CallLogPartitions:
+    """Mantiene le partizioni mensili di chiamate_log: crea i mesi futuri ed elimina quelli scaduti"""
+
+    def __init__(self, db, months_ahead: int = CALL_LOG_PARTITION_MONTHS_AHEAD,
+                 retention_months: int = CALL_LOG_RETENTION_MONTHS,
+                 check_interval: float = CALL_LOG_PARTITION_CHECK_INTERVAL):
+        self.db = db
+        self.months_ahead = months_ahead
+        self.retention_months = retention_months
+        self.check_interval = check_interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def maintain(self, today: Optional[date] = None) -> Tuple[List[str], List[str]]:
+        """Crea e elimina le partizioni necessarie. Ritorna i nomi creati ed eliminati"""
+        async with self.db.pool.acquire() as connection:
+            return await maintain_partitions(connection, today, self.months_ahead, self.retention_months)
+
+    def start(self):
+        """Avvia il controllo periodico delle partizioni"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await self.maintain()
+            except Exception as e:
+                logging.error(f"Errore nella manutenzione delle partizioni del log chiamate: {e}")
+            await asyncio.sleep(self.check_interval)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
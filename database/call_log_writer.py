@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Scrittura in background del log delle chiamate (chiamate_log), a blocchi
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import asyncpg
+
+from config import (
+    CALL_LOG_QUEUE_MAXSIZE, CALL_LOG_BATCH_SIZE, CALL_LOG_FLUSH_INTERVAL,
+    CALL_LOG_DRAIN_TIMEOUT, CALL_LOG_MAX_ATTEMPTS,
+)
+from database.db_manager import db_manager
+from database.statements import register
+
+# Attesa massima tra due tentativi di scrittura falliti
+MAX_RETRY_DELAY = 30.0
+
+# Errori dovuti ai dati di un evento: riprovare non serve, si scarta solo l'evento che li causa.
+# Tutti gli altri (connessione, timeout) sono temporanei e il blocco torna in coda.
+DATA_ERRORS = (
+    asyncpg.DataError,                           # valore rifiutato da Postgres
+    asyncpg.IntegrityConstraintViolationError,  # vincolo violato
+    ValueError,                                  # argomento non codificabile dal client
+)
+
+INSERT_CALLS_SQL = """
+    INSERT INTO chiamate_log
+    (ristorante_id, stream_sid, numero_chiamante, numero_chiamato, timestamp_inizio,
+     durata_chiamata, timestamp_fine, status)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, COALESCE($8, 'completed'))
+"""
+
+UPDATE_CALL_END_SQL = """
+    UPDATE chiamate_log
+    SET durata_chiamata = $2, timestamp_fine = $3, status = $4
+    WHERE stream_sid = $1 AND timestamp_fine IS NULL
+      AND timestamp_inizio > $3 - INTERVAL '1 day' -- solo le partizioni recenti
+"""
+
+INSERT_CALLS = register("log_chiamate_inserimento", INSERT_CALLS_SQL)
+UPDATE_CALL_END = register("log_chiamate_fine", UPDATE_CALL_END_SQL)
+
+
+@dataclass
+class CallLogEntry:
+    """Una chiamata in attesa di essere scritta: inizio, fine o entrambi"""
+    stream_sid: str
+    ristorante_id: Optional[int] = None
+    numero_chiamante: Optional[str] = None
+    numero_chiamato: Optional[str] = None
+    timestamp_inizio: Optional[datetime] = None
+    durata_chiamata: Optional[int] = None
+    timestamp_fine: Optional[datetime] = None
+    status: Optional[str] = None
+    attempts: int = 0
+
+    @property
+    def has_start(self) -> bool:
+        return self.timestamp_inizio is not None
+
+    @property
+    def has_end(self) -> bool:
+        return self.timestamp_fine is not None
+
+
+class CallLogWriter:
+    """
+    Accoda inizio e fine delle chiamate in memoria e li scrive con executemany in
+    un'unica transazione, ogni flush_interval secondi o appena si raggiunge batch_size.
+    Inizio e fine della stessa chiamata ancora in coda diventano un solo INSERT.
+    Se un evento ha dati non validi il blocco viene riscritto un evento alla volta e si
+    scarta solo quello. Chi registra non attende mai il database: a coda piena gli eventi vengono scartati.
+    """
+
+    def __init__(self, db, max_queue: int = CALL_LOG_QUEUE_MAXSIZE, batch_size: int = CALL_LOG_BATCH_SIZE,
+                 flush_interval: float = CALL_LOG_FLUSH_INTERVAL, max_attempts: int = CALL_LOG_MAX_ATTEMPTS):
+        self.db = db
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._pending: Dict[str, CallLogEntry] = {}  # per stream_sid, in ordine di arrivo
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.failed_flushes = 0
+
+    def start(self):
+        """Avvia il task di scrittura"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def log_start(self, ristorante_id: int, stream_sid: str, numero_chiamante: str, numero_chiamato: str) -> bool:
+        """Registra l'inizio di una chiamata senza attendere. Ritorna False se l'evento è stato scartato"""
+        entry = self._entry(stream_sid)
+        if entry is None:
+            return False
+        entry.ristorante_id = ristorante_id
+        entry.numero_chiamante = numero_chiamante
+        entry.numero_chiamato = numero_chiamato
+        entry.timestamp_inizio = datetime.now(timezone.utc)
+        self._maybe_wakeup()
+        return True
+
+    def log_end(self, stream_sid: str, durata_secondi: int, status: str = 'completed') -> bool:
+        """Registra la fine di una chiamata senza attendere. Ritorna False se l'evento è stato scartato"""
+        entry = self._entry(stream_sid)
+        if entry is None:
+            return False
+        entry.durata_chiamata = durata_secondi
+        entry.timestamp_fine = datetime.now(timezone.utc)
+        entry.status = status
+        self._maybe_wakeup()
+        return True
+
+    def _entry(self, stream_sid: str) -> Optional[CallLogEntry]:
+        entry = self._pending.get(stream_sid)
+        if entry is not None:
+            return entry
+        if len(self._pending) >= self.max_queue:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                logging.warning(f"Coda del log chiamate piena: {self.dropped} eventi scartati.")
+            return None
+        entry = self._pending[stream_sid] = CallLogEntry(stream_sid)
+        return entry
+
+    def _maybe_wakeup(self):
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def _run(self):
+        failures = 0
+        while True:
+            if failures:
+                # Database non raggiungibile: si riprova con attesa crescente
+                await asyncio.sleep(min(MAX_RETRY_DELAY, self.flush_interval * 2 ** failures))
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                logging.error(f"Errore nella scrittura del log chiamate (tentativo {failures}): {e}")
+
+    async def flush(self):
+        """Scrive tutti gli eventi in coda, a blocchi di batch_size"""
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._take_batch()
+                try:
+                    await self._write(batch)
+                except DATA_ERRORS as e:
+                    logging.warning(f"Log chiamate: blocco di {len(batch)} eventi rifiutato ({e}), scrittura uno per volta.")
+                    await self._write_each(batch)
+                    continue
+                except BaseException:
+                    # Anche una cancellazione (es. alla chiusura) annulla la transazione: il blocco torna in coda
+                    self.failed_flushes += 1
+                    self._requeue(batch)
+                    raise
+                self.written += len(batch)
+
+    async def _write_each(self, batch: List[CallLogEntry]):
+        """Scrive un evento per transazione: quelli con dati non validi vengono scartati"""
+        for i, entry in enumerate(batch):
+            try:
+                await self._write([entry])
+            except DATA_ERRORS as e:
+                self.rejected += 1
+                logging.error(f"Log chiamate: evento di {entry.stream_sid} scartato per dati non validi: {e}")
+                continue
+            except BaseException:
+                self.failed_flushes += 1
+                self._requeue(batch[i:])
+                raise
+            self.written += 1
+
+    def _take_batch(self) -> List[CallLogEntry]:
+        batch = []
+        for stream_sid in list(self._pending)[:self.batch_size]:
+            batch.append(self._pending.pop(stream_sid))
+        return batch
+
+    def _requeue(self, batch: List[CallLogEntry]):
+        """Rimette in coda un blocco non scritto, davanti agli eventi arrivati nel frattempo"""
+        newer = self._pending
+        self._pending = {}
+        for entry in batch:
+            entry.attempts += 1
+            if entry.attempts >= self.max_attempts:
+                self.dropped += 1
+            elif len(self._pending) < self.max_queue:
+                self._pending[entry.stream_sid] = entry
+            else:
+                self.dropped += 1
+        for stream_sid, entry in newer.items():
+            queued = self._pending.get(stream_sid)
+            if queued is not None:
+                # La fine è arrivata mentre l'inizio era in scrittura: si uniscono
+                self._merge(queued, entry)
+            elif len(self._pending) < self.max_queue:
+                self._pending[stream_sid] = entry
+            else:
+                self.dropped += 1
+
+    @staticmethod
+    def _merge(target: CallLogEntry, newer: CallLogEntry):
+        for field in ('ristorante_id', 'numero_chiamante', 'numero_chiamato', 'timestamp_inizio',
+                      'durata_chiamata', 'timestamp_fine', 'status'):
+            value = getattr(newer, field)
+            if value is not None:
+                setattr(target, field, value)
+
+    async def _write(self, batch: List[CallLogEntry]):
+        inserts = [
+            (e.ristorante_id, e.stream_sid, e.numero_chiamante, e.numero_chiamato, e.timestamp_inizio,
+             e.durata_chiamata, e.timestamp_fine, e.status)
+            for e in batch if e.has_start
+        ]
+        updates = [
+            (e.stream_sid, e.durata_chiamata, e.timestamp_fine, e.status)
+            for e in batch if e.has_end and not e.has_start
+        ]
+        async with self.db.acquire() as connection:
+            async with connection.transaction():
+                if inserts:
+                    await self.db.run(connection, INSERT_CALLS, "executemany", inserts)
+                if updates:
+                    await self.db.run(connection, UPDATE_CALL_END, "executemany", updates)
+
+    async def close(self, timeout: float = CALL_LOG_DRAIN_TIMEOUT):
+        """Ferma il task e scrive tutto ciò che è ancora in coda"""
+        if self._task is not None:
+            # Si attende la fine di un'eventuale scrittura in corso prima di fermare il task
+            try:
+                await asyncio.wait_for(self._flush_lock.acquire(), timeout=timeout)
+                self._flush_lock.release()
+            except asyncio.TimeoutError:
+                pass
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if not self._pending:
+            return
+        try:
+            await asyncio.wait_for(self.flush(), timeout=timeout)
+            logging.info("Log chiamate svuotato prima della chiusura.")
+        except Exception as e:
+            logging.error(f"Log chiamate non svuotato alla chiusura ({len(self._pending)} eventi persi): {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'pending': len(self._pending),
+            'written': self.written,
+            'dropped': self.dropped,
+            'rejected': self.rejected,
+            'failed_flushes': self.failed_flushes,
+        }
+
+
+# Scrittore globale del log chiamate
+call_log_writer = CallLogWriter(db_manager)
@@ -2,214 +2,342 @@
 """
 Gestore del database per Receptionist AI
 """
+import asyncio
 import asyncpg
+import json
 import logging
 import os
-from typing import Optional, Dict, Any
+import time
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import Optional, Dict, Any, Callable, List, AsyncIterator, Mapping
 from dotenv import load_dotenv
 
+from config import (
+    TENANT_CACHE_TTL_SECONDS, TENANT_CACHE_MAX_SIZE, TENANT_NOTIFY_CHANNEL, GREETING_CONFIG_KEY, STATS_TIMEZONE,
+    DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_MAX_IDLE_SECONDS, DB_POOL_ACQUIRE_TIMEOUT, DB_QUERY_TIMEOUT,
+)
+from database.tenant_cache import TenantCache
+from database.tenant_settings import compile_settings
+from database.statements import PreparedConnection, prepare_statements, register
+from metrics.registry import metrics
+from database.call_log_partitions import CallLogPartitions
+from database.migrations import CALL_STATS_BACKFILL_DELETE, CALL_STATS_BACKFILL_INSERT, check_schema_version
+
 load_dotenv()
 
+# Secondi di attesa prima di riaprire la connessione LISTEN persa
+LISTENER_RECONNECT_DELAY = 5
+
+# Colonne di un ristorante, con il saluto personalizzato e tutte le righe di configurazioni
+# (compilate nelle impostazioni del ristorante): nessuna query in più per turno
+RESTAURANT_SELECT = f"""
+    SELECT r.id, r.nome_ristorante, r.numero_twilio, r.system_prompt,
+           r.telefono_escalation, r.orari_apertura, r.indirizzo,
+           (SELECT c.valore FROM configurazioni c
+            WHERE c.ristorante_id = r.id AND c.chiave = '{GREETING_CONFIG_KEY}') AS saluto,
+           (SELECT json_object_agg(c.chiave, c.valore) FROM configurazioni c
+            WHERE c.ristorante_id = r.id) AS configurazioni
+    FROM ristoranti r
+"""
+
+# Query del registro, preparate su ogni connessione del pool (vedi statements.py)
+RESTAURANT_BY_PHONE = register("ristorante_per_numero", RESTAURANT_SELECT + "WHERE r.numero_twilio = $1")
+ALL_RESTAURANTS = register("tutti_i_ristoranti", RESTAURANT_SELECT + "ORDER BY r.id")
+LOG_CALL_START = register("inizio_chiamata", """
+    INSERT INTO chiamate_log
+    (ristorante_id, stream_sid, numero_chiamante, numero_chiamato)
+    VALUES ($1, $2, $3, $4)
+    RETURNING id
+""")
+LOG_CALL_END = register("fine_chiamata", """
+    UPDATE chiamate_log
+    SET durata_chiamata = $1, timestamp_fine = CURRENT_TIMESTAMP, status = $2
+    WHERE id = $3
+""")
+RESTAURANT_STATS = register("statistiche_ristorante", f"""
+    SELECT status,
+           SUM(chiamate) AS chiamate,
+           SUM(durata_totale) AS durata_totale,
+           SUM(chiamate_con_durata) AS chiamate_con_durata
+    FROM statistiche_chiamate_giornaliere
+    WHERE ristorante_id = $1
+    AND giorno > (CURRENT_TIMESTAMP AT TIME ZONE '{STATS_TIMEZONE}')::DATE - $2::INTEGER
+    GROUP BY status
+""")
+
+# Funzione chiamata con i numeri modificati, o None se potrebbe essere cambiato qualsiasi ristorante
+TenantListener = Callable[[Optional[List[str]]], None]
+
+def restaurant_record(row: Mapping[str, Any]) -> Dict[str, Any]:
+    """Record del ristorante in cache: le righe di configurazioni diventano impostazioni tipizzate"""
+    restaurant = dict(row)
+    configurazioni = restaurant.pop('configurazioni', None)
+    restaurant['settings'] = compile_settings(json.loads(configurazioni) if configurazioni else {},
+                                              restaurant.get('numero_twilio'))
+    return restaurant
+
+
 class DatabaseManager:
     def __init__(self):
         self.pool: Optional[asyncpg.Pool] = None
         self.database_url = os.getenv("DATABASE_URL")
-        
+        self.tenant_cache = TenantCache(TENANT_CACHE_TTL_SECONDS, TENANT_CACHE_MAX_SIZE)
+        self._tenant_lookups: Dict[str, asyncio.Future] = {}
+        self._listen_connection: Optional[asyncpg.Connection] = None
+        self._listener_task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._tenant_listeners: List[TenantListener] = []
+        self.call_log_partitions = CallLogPartitions(self)
+        self.query_timeout = DB_QUERY_TIMEOUT
+        self.schema_version: Optional[int] = None
+
+    def add_tenant_listener(self, listener: TenantListener):
+        """Registra una funzione da chiamare quando i dati di uno o più ristoranti cambiano"""
+        self._tenant_listeners.append(listener)
+
+    def _notify_tenant_listeners(self, numeri: Optional[List[str]]):
+        for listener in self._tenant_listeners:
+            try:
+                listener(numeri)
+            except Exception as e:
+                logging.error(f"Errore in un listener dei ristoranti: {e}")
+
     async def initialize(self):
         """Inizializza il pool di connessioni al database"""
         if not self.database_url:
             raise ValueError("DATABASE_URL non configurata nelle variabili d'ambiente")
         
+        # Le connessioni minime vengono aperte subito e ognuna prepara le query del registro
         self.pool = await asyncpg.create_pool(
             self.database_url,
-            min_size=1,
-            max_size=10
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            max_inactive_connection_lifetime=DB_POOL_MAX_IDLE_SECONDS,
+            connection_class=PreparedConnection,
+            init=prepare_statements,
         )
-        logging.info("Pool di connessioni al database creato.")
-        
-        # Crea le tabelle se non esistono
-        await self._create_tables_if_not_exist()
-        
-    async def _create_tables_if_not_exist(self):
-        """Crea le tabelle del database se non esistono"""
+        logging.info(f"Pool di connessioni al database creato ({DB_POOL_MIN_SIZE}-{DB_POOL_MAX_SIZE} connessioni).")
+
+        # Controllo dello schema e connessione LISTEN (invalidazione della cache dei ristoranti) in parallelo
+        self._closing = False
+        await asyncio.gather(self._check_schema_version(), self._start_tenant_listener())
+
+        # Partizioni del log chiamate controllate in background
+        self.call_log_partitions.start()
+
+    async def _check_schema_version(self):
+        """Lo schema viene aggiornato al deploy (python3 -m database.migrations): all'avvio solo il controllo"""
+        async with self.pool.acquire() as connection:
+            self.schema_version = await check_schema_version(connection)
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[PreparedConnection]:
+        """Connessione dal pool, misurando l'attesa"""
+        if not self.pool:
+            raise RuntimeError("Database non inizializzato")
+        start = time.perf_counter()
+        try:
+            connection = await self.pool.acquire(timeout=DB_POOL_ACQUIRE_TIMEOUT)
+        except asyncio.TimeoutError:
+            metrics.db_query_errors.inc("pool", "timeout")
+            raise
+        metrics.db_pool_wait_seconds.labels().observe(time.perf_counter() - start)
+        try:
+            yield connection
+        finally:
+            await self.pool.release(connection)
+
+    async def run(self, connection: PreparedConnection, name: str, method: str, *args):
+        """Esegue una query del registro (fetch, fetchrow, fetchval, executemany) con timeout e metriche"""
+        start = time.perf_counter()
+        try:
+            stmt = await connection.statement(name)
+            try:
+                return await getattr(stmt, method)(*args, timeout=self.query_timeout)
+            except asyncpg.FeatureNotSupportedError:
+                # "cached plan must not change result type": lo schema è cambiato, si riprepara
+                connection.forget_statement(name)
+                stmt = await connection.statement(name)
+                return await getattr(stmt, method)(*args, timeout=self.query_timeout)
+        except asyncio.TimeoutError:
+            metrics.db_query_errors.inc(name, "timeout")
+            raise
+        except Exception:
+            metrics.db_query_errors.inc(name, "errore")
+            raise
+        finally:
+            metrics.db_query_seconds.labels(name).observe(time.perf_counter() - start)
+
+    async def query(self, name: str, *args, method: str = "fetch"):
+        """Esegue una query del registro su una connessione del pool"""
+        async with self.acquire() as connection:
+            return await self.run(connection, name, method, *args)
+
+    def pool_stats(self) -> Dict[str, int]:
+        if not self.pool:
+            return {'size': 0, 'idle': 0, 'max_size': 0}
+        return {'size': self.pool.get_size(), 'idle': self.pool.get_idle_size(), 'max_size': self.pool.get_max_size()}
+
+    async def _start_tenant_listener(self):
+        """Apre una connessione dedicata in ascolto delle modifiche ai ristoranti"""
         try:
-            async with self.pool.acquire() as connection:
-                # Verifica se la tabella ristoranti esiste
-                table_exists = await connection.fetchval(
-                    """
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.tables 
-                        WHERE table_name = 'ristoranti'
-                    );
-                    """
-                )
-                
-                if not table_exists:
-                    logging.info("Creazione tabelle del database...")
-                    
-                    # Crea le tabelle
-                    await connection.execute("""
-                        CREATE TABLE ristoranti (
-                            id SERIAL PRIMARY KEY,
-                            nome_ristorante VARCHAR(255) NOT NULL,
-                            numero_twilio VARCHAR(50) UNIQUE NOT NULL,
-                            system_prompt TEXT NOT NULL,
-                            telefono_escalation VARCHAR(50),
-                            orari_apertura TEXT,
-                            indirizzo TEXT,
-                            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                            updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-                        );
-                    """)
-                    
-                    await connection.execute("""
-                        CREATE TABLE chiamate_log (
-                            id SERIAL PRIMARY KEY,
-                            ristorante_id INTEGER REFERENCES ristoranti(id),
-                            stream_sid VARCHAR(100) NOT NULL,
-                            numero_chiamante VARCHAR(50),
-                            numero_chiamato VARCHAR(50),
-                            durata_chiamata INTEGER,
-                            timestamp_inizio TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                            timestamp_fine TIMESTAMP WITH TIME ZONE,
-                            status VARCHAR(20) DEFAULT 'completed'
-                        );
-                    """)
-                    
-                    await connection.execute("""
-                        CREATE TABLE configurazioni (
-                            id SERIAL PRIMARY KEY,
-                            ristorante_id INTEGER REFERENCES ristoranti(id),
-                            chiave VARCHAR(100) NOT NULL,
-                            valore TEXT NOT NULL,
-                            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                            UNIQUE(ristorante_id, chiave)
-                        );
-                    """)
-                    
-                    # Crea indici
-                    await connection.execute("CREATE INDEX idx_ristoranti_numero_twilio ON ristoranti(numero_twilio);")
-                    await connection.execute("CREATE INDEX idx_chiamate_ristorante_id ON chiamate_log(ristorante_id);")
-                    await connection.execute("CREATE INDEX idx_chiamate_timestamp ON chiamate_log(timestamp_inizio);")
-                    
-                    # Crea trigger per updated_at
-                    await connection.execute("""
-                        CREATE OR REPLACE FUNCTION update_updated_at_column()
-                        RETURNS TRIGGER AS $$
-                        BEGIN
-                            NEW.updated_at = CURRENT_TIMESTAMP;
-                            RETURN NEW;
-                        END;
-                        $$ language 'plpgsql';
-                    """)
-                    
-                    await connection.execute("""
-                        CREATE TRIGGER update_ristoranti_updated_at 
-                            BEFORE UPDATE ON ristoranti 
-                            FOR EACH ROW 
-                            EXECUTE FUNCTION update_updated_at_column();
-                    """)
-                    
-                    # Inserisci dati di esempio
-                    await connection.execute("""
-                        INSERT INTO ristoranti (nome_ristorante, numero_twilio, system_prompt, telefono_escalation, orari_apertura, indirizzo)
-                        VALUES 
-                        ('Trattoria da Mario', '+39021111111', 'Sei un assistente virtuale per la Trattoria da Mario. Rispondi in modo cortese e conciso. Orari: 19:00-23:00, chiuso lunedì.', '+393331111111', '19:00-23:00, chiuso lunedì', 'Via Roma 123, Milano'),
-                        ('Pizzeria da Gino', '+39062222222', 'Sei l''assistente virtuale della Pizzeria da Gino. Sei veloce e informale. Orari: 7 giorni su 7, 18:30-24:00.', '+393332222222', '18:30-24:00, tutti i giorni', 'Via Napoli 456, Roma')
-                        ON CONFLICT (numero_twilio) DO NOTHING;
-                    """)
-                    
-                    logging.info("Tabelle del database create con successo.")
-                else:
-                    logging.info("Tabelle del database già esistenti.")
-                    
+            self._listen_connection = await asyncpg.connect(self.database_url)
+            await self._listen_connection.add_listener(TENANT_NOTIFY_CHANNEL, self._on_tenant_notify)
+            self._listen_connection.add_termination_listener(self._on_listener_lost)
+            logging.info(f"In ascolto sul canale '{TENANT_NOTIFY_CHANNEL}' per l'invalidazione della cache.")
         except Exception as e:
-            logging.error(f"Errore durante la creazione delle tabelle: {e}")
-            # Non bloccare l'avvio dell'applicazione se le tabelle non possono essere create
-        
+            # Senza LISTEN la cache resta valida, ma le modifiche arrivano solo allo scadere del TTL
+            self._listen_connection = None
+            logging.error(f"Impossibile avviare il listener dei ristoranti: {e}")
+            self._schedule_listener_reconnect()
+
+    def _on_tenant_notify(self, connection, pid, channel, payload):
+        """Invalida i numeri indicati nella notifica del trigger"""
+        try:
+            numeri = json.loads(payload).get('numeri')
+        except (ValueError, AttributeError):
+            numeri = None
+
+        if numeri is None:
+            self.tenant_cache.clear()
+            logging.info("Notifica ristoranti non interpretabile: cache svuotata.")
+            self._notify_tenant_listeners(None)
+            return
+        if not numeri:
+            return
+        for numero in numeri:
+            self.tenant_cache.invalidate(numero)
+        logging.info(f"Cache ristoranti invalidata per: {', '.join(numeri)}")
+        self._notify_tenant_listeners(numeri)
+
+    def _on_listener_lost(self, connection):
+        """La connessione LISTEN è caduta: le notifiche potrebbero essere perse"""
+        if self._closing:
+            return
+        logging.warning("Connessione LISTEN persa. Cache ristoranti svuotata.")
+        self.tenant_cache.clear()
+        self._notify_tenant_listeners(None)
+        self._listen_connection = None
+        self._schedule_listener_reconnect()
+
+    def _schedule_listener_reconnect(self):
+        if self._closing or (self._listener_task and not self._listener_task.done()):
+            return
+        self._listener_task = asyncio.get_running_loop().create_task(self._reconnect_listener())
+
+    async def _reconnect_listener(self):
+        await asyncio.sleep(LISTENER_RECONNECT_DELAY)
+        if self._closing:
+            return
+        # Anche le notifiche perse durante la disconnessione non devono lasciare dati vecchi
+        self.tenant_cache.clear()
+        self._notify_tenant_listeners(None)
+        self._listener_task = None
+        await self._start_tenant_listener()
+
     async def close(self):
         """Chiude il pool di connessioni"""
+        self._closing = True
+        await self.call_log_partitions.close()
+        if self._listener_task:
+            self._listener_task.cancel()
+            self._listener_task = None
+        if self._listen_connection:
+            try:
+                await self._listen_connection.close()
+            except Exception as e:
+                logging.error(f"Errore nella chiusura della connessione LISTEN: {e}")
+            self._listen_connection = None
         if self.pool:
             await self.pool.close()
             logging.info("Pool di connessioni al database chiuso.")
             
     async def get_restaurant_by_phone(self, phone_number: str) -> Optional[Dict[str, Any]]:
-        """Recupera le informazioni di un ristorante dal numero di telefono"""
-        if not self.pool:
-            raise RuntimeError("Database non inizializzato")
-            
-        async with self.pool.acquire() as connection:
-            row = await connection.fetchrow(
-                """
-                SELECT id, nome_ristorante, numero_twilio, system_prompt, 
-                       telefono_escalation, orari_apertura, indirizzo
-                FROM ristoranti 
-                WHERE numero_twilio = $1
-                """,
-                phone_number
-            )
-            
-            if row:
-                return dict(row)
-            return None
+        """Recupera le informazioni di un ristorante dal numero di telefono (con cache)"""
+        found, restaurant = self.tenant_cache.get(phone_number)
+        if found:
+            return restaurant
+
+        # Più chiamate contemporanee verso lo stesso numero condividono una sola query
+        pending = self._tenant_lookups.get(phone_number)
+        if pending is not None:
+            try:
+                restaurant = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # Annullata la chiamata che eseguiva la query (barge-in, riaggancio): si riprova
+                if pending.cancelled() and not asyncio.current_task().cancelling():
+                    return await self.get_restaurant_by_phone(phone_number)
+                raise
+            return dict(restaurant) if restaurant is not None else None
+
+        generation = self.tenant_cache.generation
+        pending = asyncio.get_running_loop().create_future()
+        self._tenant_lookups[phone_number] = pending
+        try:
+            restaurant = await self._fetch_restaurant_by_phone(phone_number)
+            self.tenant_cache.set(phone_number, restaurant, generation)
+            pending.set_result(restaurant)
+        except Exception as e:
+            pending.set_exception(e)
+            # Evita l'avviso "exception was never retrieved" se nessuno era in attesa
+            pending.exception()
+            raise
+        finally:
+            del self._tenant_lookups[phone_number]
+            if not pending.done():
+                # Query annullata: chi è in attesa non deve restare bloccato
+                pending.cancel()
+        return dict(restaurant) if restaurant is not None else None
+
+    async def _fetch_restaurant_by_phone(self, phone_number: str) -> Optional[Dict[str, Any]]:
+        """Legge un ristorante direttamente dal database"""
+        row = await self.query(RESTAURANT_BY_PHONE, phone_number, method="fetchrow")
+        return restaurant_record(row) if row else None
+
+    async def get_all_restaurants(self) -> List[Dict[str, Any]]:
+        """Elenco di tutti i ristoranti (es. per preparare i saluti all'avvio)"""
+        rows = await self.query(ALL_RESTAURANTS)
+        return [restaurant_record(row) for row in rows]
             
     async def log_call_start(self, ristorante_id: int, stream_sid: str, 
                            numero_chiamante: str, numero_chiamato: str) -> int:
         """Registra l'inizio di una chiamata"""
-        if not self.pool:
-            raise RuntimeError("Database non inizializzato")
-            
-        async with self.pool.acquire() as connection:
-            call_id = await connection.fetchval(
-                """
-                INSERT INTO chiamate_log 
-                (ristorante_id, stream_sid, numero_chiamante, numero_chiamato)
-                VALUES ($1, $2, $3, $4)
-                RETURNING id
-                """,
-                ristorante_id, stream_sid, numero_chiamante, numero_chiamato
-            )
-            return call_id
-            
+        return await self.query(LOG_CALL_START, ristorante_id, stream_sid, numero_chiamante, numero_chiamato,
+                                method="fetchval")
+
     async def log_call_end(self, call_id: int, durata_secondi: int, status: str = 'completed'):
         """Registra la fine di una chiamata"""
-        if not self.pool:
-            raise RuntimeError("Database non inizializzato")
-            
-        async with self.pool.acquire() as connection:
-            await connection.execute(
-                """
-                UPDATE chiamate_log 
-                SET durata_chiamata = $1, timestamp_fine = CURRENT_TIMESTAMP, status = $2
-                WHERE id = $3
-                """,
-                durata_secondi, status, call_id
-            )
-            
+        await self.query(LOG_CALL_END, durata_secondi, status, call_id)
+
     async def get_restaurant_stats(self, ristorante_id: int, giorni: int = 30) -> Dict[str, Any]:
-        """Recupera statistiche per un ristorante"""
+        """Statistiche di un ristorante sugli ultimi `giorni` giorni (oggi compreso), dalle statistiche giornaliere"""
+        rows = await self.query(RESTAURANT_STATS, ristorante_id, giorni)
+
+        per_status = {row['status']: int(row['chiamate']) for row in rows if row['chiamate']}
+        durata_totale = sum(int(row['durata_totale']) for row in rows)
+        chiamate_con_durata = sum(int(row['chiamate_con_durata']) for row in rows)
+        return {
+            'totale_chiamate': sum(per_status.values()),
+            'durata_media': durata_totale / chiamate_con_durata if chiamate_con_durata else 0,
+            'durata_totale': durata_totale,
+            'escalation': per_status.get('escalated', 0),
+            'per_status': per_status,
+        }
+
+    async def backfill_call_stats(self, ristorante_id: Optional[int] = None, dal: Optional[date] = None) -> int:
+        """Ricalcola le statistiche giornaliere dallo storico di chiamate_log. Ritorna le righe scritte"""
         if not self.pool:
             raise RuntimeError("Database non inizializzato")
-            
+
         async with self.pool.acquire() as connection:
-            stats = await connection.fetchrow(
-                """
-                SELECT 
-                    COUNT(*) as totale_chiamate,
-                    AVG(durata_chiamata) as durata_media,
-                    COUNT(CASE WHEN status = 'escalated' THEN 1 END) as escalation
-                FROM chiamate_log 
-                WHERE ristorante_id = $1 
-                AND timestamp_inizio >= CURRENT_TIMESTAMP - INTERVAL '$2 days'
-                """,
-                ristorante_id, giorni
-            )
-            
-            return dict(stats) if stats else {
-                'totale_chiamate': 0,
-                'durata_media': 0,
-                'escalation': 0
-            }
+            async with connection.transaction():
+                # Le scritture sul log restano in attesa fino al commit: senza il lock una
+                # chiamata conclusa durante il ricalcolo verrebbe contata due volte o persa
+                await connection.execute("LOCK TABLE chiamate_log IN SHARE ROW EXCLUSIVE MODE")
+                await connection.execute(CALL_STATS_BACKFILL_DELETE, ristorante_id, dal)
+                status = await connection.execute(CALL_STATS_BACKFILL_INSERT, ristorante_id, dal)
+        return int(status.split()[-1])
 
 # Istanza globale del database manager
 db_manager = DatabaseManager()
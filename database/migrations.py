@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Migrazioni versionate dello schema del database, registrate nella tabella schema_version.
+Si eseguono al deploy, prima di avviare le nuove istanze: all'avvio l'applicazione
+controlla soltanto la versione.
+
+Uso:
+    python3 -m database.migrations            # applica le migrazioni mancanti
+    python3 -m database.migrations --status   # mostra versione attuale e migrazioni mancanti
+"""
+import argparse
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional
+
+import asyncpg
+from dotenv import load_dotenv
+
+from config import TENANT_NOTIFY_CHANNEL, STATS_TIMEZONE
+from database.call_log_partitions import create_call_log_table, maintain_partitions, migrate_to_partitions
+
+# Un solo processo alla volta applica le migrazioni
+MIGRATIONS_LOCK_ID = 7310020
+
+SCHEMA_VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        versione INTEGER PRIMARY KEY,
+        descrizione TEXT NOT NULL,
+        applicata_il TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+
+# Tabelle principali. IF NOT EXISTS: i database creati prima delle migrazioni le hanno già
+RISTORANTI_TABLE = """
+    CREATE TABLE IF NOT EXISTS ristoranti (
+        id SERIAL PRIMARY KEY,
+        nome_ristorante VARCHAR(255) NOT NULL,
+        numero_twilio VARCHAR(50) UNIQUE NOT NULL, -- La chiave per identificare il ristorante
+        system_prompt TEXT NOT NULL, -- Le istruzioni personalizzate per l'IA
+        telefono_escalation VARCHAR(50), -- Numero per escalation umana
+        orari_apertura TEXT, -- Orari di apertura in formato testo
+        indirizzo TEXT, -- Indirizzo del ristorante
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+
+CONFIGURAZIONI_TABLE = """
+    CREATE TABLE IF NOT EXISTS configurazioni (
+        id SERIAL PRIMARY KEY,
+        ristorante_id INTEGER REFERENCES ristoranti(id),
+        chiave VARCHAR(100) NOT NULL,
+        valore TEXT NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(ristorante_id, chiave)
+    );
+"""
+
+UPDATED_AT_FUNCTION = """
+    CREATE OR REPLACE FUNCTION update_updated_at_column()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        NEW.updated_at = CURRENT_TIMESTAMP;
+        RETURN NEW;
+    END;
+    $$ language 'plpgsql';
+"""
+
+UPDATED_AT_TRIGGER = """
+    CREATE TRIGGER update_ristoranti_updated_at
+        BEFORE UPDATE ON ristoranti
+        FOR EACH ROW
+        EXECUTE FUNCTION update_updated_at_column();
+"""
+
+# Notifica le istanze in ascolto quando un ristorante viene creato, modificato o eliminato.
+# Il payload contiene i numeri Twilio coinvolti (vecchio e nuovo in caso di cambio numero).
+NOTIFY_RISTORANTI_FUNCTION = f"""
+    CREATE OR REPLACE FUNCTION notify_ristoranti_changed()
+    RETURNS TRIGGER AS $$
+    DECLARE
+        numeri TEXT[] := ARRAY[]::TEXT[];
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            numeri := numeri || OLD.numero_twilio::TEXT;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            numeri := numeri || NEW.numero_twilio::TEXT;
+        END IF;
+        PERFORM pg_notify('{TENANT_NOTIFY_CHANNEL}', json_build_object('op', TG_OP, 'numeri', numeri)::TEXT);
+        RETURN NULL;
+    END;
+    $$ language 'plpgsql';
+"""
+
+NOTIFY_RISTORANTI_TRIGGER = """
+    CREATE TRIGGER notify_ristoranti_changed
+        AFTER INSERT OR UPDATE OR DELETE ON ristoranti
+        FOR EACH ROW
+        EXECUTE FUNCTION notify_ristoranti_changed();
+"""
+
+# Anche le configurazioni fanno parte dei dati del ristorante (es. il saluto)
+NOTIFY_CONFIGURAZIONI_FUNCTION = f"""
+    CREATE OR REPLACE FUNCTION notify_configurazioni_changed()
+    RETURNS TRIGGER AS $$
+    DECLARE
+        numeri TEXT[];
+    BEGIN
+        SELECT array_agg(numero_twilio::TEXT) INTO numeri
+        FROM ristoranti
+        WHERE id IN (
+            CASE WHEN TG_OP IN ('UPDATE', 'DELETE') THEN OLD.ristorante_id END,
+            CASE WHEN TG_OP IN ('INSERT', 'UPDATE') THEN NEW.ristorante_id END
+        );
+        PERFORM pg_notify('{TENANT_NOTIFY_CHANNEL}', json_build_object('op', TG_OP, 'numeri', COALESCE(numeri, ARRAY[]::TEXT[]))::TEXT);
+        RETURN NULL;
+    END;
+    $$ language 'plpgsql';
+"""
+
+NOTIFY_CONFIGURAZIONI_TRIGGER = """
+    CREATE TRIGGER notify_configurazioni_changed
+        AFTER INSERT OR UPDATE OR DELETE ON configurazioni
+        FOR EACH ROW
+        EXECUTE FUNCTION notify_configurazioni_changed();
+"""
+
+# Statistiche giornaliere per ristorante e status, aggiornate a ogni chiamata conclusa:
+# le finestre di get_restaurant_stats leggono un numero di righe proporzionale ai giorni
+CALL_STATS_TABLE = """
+    CREATE TABLE IF NOT EXISTS statistiche_chiamate_giornaliere (
+        ristorante_id INTEGER NOT NULL REFERENCES ristoranti(id) ON DELETE CASCADE,
+        giorno DATE NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        chiamate INTEGER NOT NULL DEFAULT 0,
+        durata_totale BIGINT NOT NULL DEFAULT 0, -- in secondi
+        chiamate_con_durata INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (ristorante_id, giorno, status)
+    );
+"""
+
+# Giorno (nel fuso di STATS_TIMEZONE) a cui appartiene una riga di chiamate_log
+CALL_DAY_SQL = f"(COALESCE({{row}}.timestamp_inizio, {{row}}.timestamp_fine) AT TIME ZONE '{STATS_TIMEZONE}')::DATE"
+
+# Una chiamata conta quando ha timestamp_fine; se una riga già conclusa viene modificata
+# (es. status cambiato in 'escalated') il vecchio contributo viene tolto e il nuovo aggiunto
+CALL_STATS_FUNCTION = f"""
+    CREATE OR REPLACE FUNCTION aggiorna_statistiche_chiamate()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' AND OLD.timestamp_fine IS NOT NULL AND OLD.ristorante_id IS NOT NULL THEN
+            UPDATE statistiche_chiamate_giornaliere
+            SET chiamate = chiamate - 1,
+                durata_totale = durata_totale - COALESCE(OLD.durata_chiamata, 0),
+                chiamate_con_durata = chiamate_con_durata - (OLD.durata_chiamata IS NOT NULL)::INT
+            WHERE ristorante_id = OLD.ristorante_id
+              AND giorno = {CALL_DAY_SQL.format(row='OLD')}
+              AND status = COALESCE(OLD.status, 'completed');
+        END IF;
+        IF NEW.timestamp_fine IS NOT NULL AND NEW.ristorante_id IS NOT NULL THEN
+            INSERT INTO statistiche_chiamate_giornaliere AS s
+                (ristorante_id, giorno, status, chiamate, durata_totale, chiamate_con_durata)
+            VALUES (NEW.ristorante_id, {CALL_DAY_SQL.format(row='NEW')}, COALESCE(NEW.status, 'completed'),
+                    1, COALESCE(NEW.durata_chiamata, 0), (NEW.durata_chiamata IS NOT NULL)::INT)
+            ON CONFLICT (ristorante_id, giorno, status) DO UPDATE
+            SET chiamate = s.chiamate + 1,
+                durata_totale = s.durata_totale + EXCLUDED.durata_totale,
+                chiamate_con_durata = s.chiamate_con_durata + EXCLUDED.chiamate_con_durata;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ language 'plpgsql';
+"""
+
+CALL_STATS_TRIGGER = """
+    CREATE TRIGGER aggiorna_statistiche_chiamate
+        AFTER INSERT OR UPDATE OF ristorante_id, timestamp_inizio, timestamp_fine, durata_chiamata, status
+        ON chiamate_log
+        FOR EACH ROW
+        EXECUTE FUNCTION aggiorna_statistiche_chiamate();
+"""
+
+# Ricalcolo delle statistiche dallo storico di chiamate_log ($1 ristorante o NULL, $2 primo giorno o NULL).
+# Vengono sostituiti solo i giorni presenti nel log, così quelli già eliminati dal log
+# conservano le loro statistiche.
+CALL_STATS_BACKFILL_FILTER = f"""
+    ristorante_id IS NOT NULL
+    AND ($1::INTEGER IS NULL OR ristorante_id = $1)
+    AND ($2::DATE IS NULL OR timestamp_inizio >= ($2::DATE::TIMESTAMP AT TIME ZONE '{STATS_TIMEZONE}'))
+"""
+
+CALL_STATS_BACKFILL_DELETE = f"""
+    DELETE FROM statistiche_chiamate_giornaliere s
+    USING (SELECT DISTINCT ristorante_id, {CALL_DAY_SQL.format(row='c')} AS giorno
+           FROM chiamate_log c WHERE {CALL_STATS_BACKFILL_FILTER}) r
+    WHERE s.ristorante_id = r.ristorante_id AND s.giorno = r.giorno
+"""
+
+CALL_STATS_BACKFILL_INSERT = f"""
+    INSERT INTO statistiche_chiamate_giornaliere
+        (ristorante_id, giorno, status, chiamate, durata_totale, chiamate_con_durata)
+    SELECT ristorante_id, {CALL_DAY_SQL.format(row='c')}, COALESCE(status, 'completed'),
+           COUNT(*), COALESCE(SUM(durata_chiamata), 0), COUNT(durata_chiamata)
+    FROM chiamate_log c
+    WHERE timestamp_fine IS NOT NULL AND {CALL_STATS_BACKFILL_FILTER}
+    GROUP BY 1, 2, 3
+"""
+
+
+@dataclass(frozen=True)
+class Migration:
+    versione: int
+    descrizione: str
+    apply: Callable[[asyncpg.Connection], Awaitable[None]]
+
+
+async def _tabelle_iniziali(connection):
+    await connection.execute(RISTORANTI_TABLE)
+    await connection.execute(CONFIGURAZIONI_TABLE)
+    await connection.execute("CREATE INDEX IF NOT EXISTS idx_ristoranti_numero_twilio ON ristoranti(numero_twilio);")
+    await connection.execute(UPDATED_AT_FUNCTION)
+    await connection.execute("DROP TRIGGER IF EXISTS update_ristoranti_updated_at ON ristoranti;")
+    await connection.execute(UPDATED_AT_TRIGGER)
+    if await connection.fetchval("SELECT to_regclass('chiamate_log')") is None:
+        # Database nuovo: il log nasce partizionato, i mesi vengono creati da maintain_partitions
+        await create_call_log_table(connection, [])
+
+
+async def _notifiche_ristoranti(connection):
+    await connection.execute(NOTIFY_RISTORANTI_FUNCTION)
+    await connection.execute("DROP TRIGGER IF EXISTS notify_ristoranti_changed ON ristoranti;")
+    await connection.execute(NOTIFY_RISTORANTI_TRIGGER)
+    await connection.execute(NOTIFY_CONFIGURAZIONI_FUNCTION)
+    await connection.execute("DROP TRIGGER IF EXISTS notify_configurazioni_changed ON configurazioni;")
+    await connection.execute(NOTIFY_CONFIGURAZIONI_TRIGGER)
+
+
+async def _log_chiamate_partizionato(connection):
+    # Nessuna operazione se il log è già partizionato (database nuovo)
+    righe = await migrate_to_partitions(connection)
+    if righe:
+        logging.info(f"chiamate_log partizionata: {righe} righe copiate")
+
+
+async def _statistiche_giornaliere(connection):
+    await connection.execute(CALL_STATS_TABLE)
+    await connection.execute(CALL_STATS_FUNCTION)
+    await connection.execute("DROP TRIGGER IF EXISTS aggiorna_statistiche_chiamate ON chiamate_log;")
+    await connection.execute(CALL_STATS_TRIGGER)
+    # Statistiche dello storico già presente
+    await connection.execute("LOCK TABLE chiamate_log IN SHARE ROW EXCLUSIVE MODE;")
+    await connection.execute(CALL_STATS_BACKFILL_DELETE, None, None)
+    await connection.execute(CALL_STATS_BACKFILL_INSERT, None, None)
+
+
+# In ordine di versione; una migrazione già rilasciata non va più modificata
+MIGRATIONS: List[Migration] = [
+    Migration(1, "tabelle ristoranti, configurazioni e chiamate_log", _tabelle_iniziali),
+    Migration(2, "notifiche LISTEN/NOTIFY delle modifiche ai ristoranti", _notifiche_ristoranti),
+    Migration(3, "chiamate_log partizionata per mese", _log_chiamate_partizionato),
+    Migration(4, "statistiche giornaliere delle chiamate", _statistiche_giornaliere),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].versione
+
+
+async def current_version(connection) -> int:
+    """Versione dello schema, 0 se le migrazioni non sono mai state eseguite"""
+    if await connection.fetchval("SELECT to_regclass('schema_version')") is None:
+        return 0
+    return await connection.fetchval("SELECT COALESCE(MAX(versione), 0) FROM schema_version")
+
+
+async def check_schema_version(connection) -> int:
+    """Controllo all'avvio: una sola query, nessuna DDL"""
+    versione = await current_version(connection)
+    if versione < LATEST_VERSION:
+        logging.error(f"Schema del database alla versione {versione}, l'applicazione richiede la {LATEST_VERSION}: "
+                      f"eseguire 'python3 -m database.migrations'.")
+    elif versione > LATEST_VERSION:
+        logging.warning(f"Schema del database alla versione {versione}, più recente di questa applicazione "
+                        f"({LATEST_VERSION}).")
+    return versione
+
+
+async def upgrade(connection, target: Optional[int] = None) -> List[Migration]:
+    """Applica in ordine le migrazioni mancanti, ognuna nella propria transazione"""
+    await connection.execute(SCHEMA_VERSION_TABLE)
+    await connection.execute("SELECT pg_advisory_lock($1)", MIGRATIONS_LOCK_ID)
+    try:
+        applied = []
+        done = {row['versione'] for row in await connection.fetch("SELECT versione FROM schema_version")}
+        for migration in MIGRATIONS:
+            if target is not None and migration.versione > target:
+                break
+            if migration.versione in done:
+                continue
+            logging.info(f"Migrazione {migration.versione}: {migration.descrizione}...")
+            async with connection.transaction():
+                await migration.apply(connection)
+                await connection.execute(
+                    "INSERT INTO schema_version (versione, descrizione) VALUES ($1, $2)",
+                    migration.versione, migration.descrizione
+                )
+            applied.append(migration)
+        return applied
+    finally:
+        await connection.execute("SELECT pg_advisory_unlock($1)", MIGRATIONS_LOCK_ID)
+
+
+async def main(status_only: bool, target: Optional[int]):
+    load_dotenv()
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        raise SystemExit("DATABASE_URL non configurata nelle variabili d'ambiente")
+
+    connection = await asyncpg.connect(database_url)
+    try:
+        versione = await current_version(connection)
+        if status_only:
+            mancanti = [m for m in MIGRATIONS if m.versione > versione]
+            print(f"📋 Schema alla versione {versione} (ultima: {LATEST_VERSION})")
+            for migration in mancanti:
+                print(f"   - da applicare: {migration.versione} {migration.descrizione}")
+            return
+
+        applied = await upgrade(connection, target)
+        for migration in applied:
+            print(f"✅ Migrazione {migration.versione} applicata: {migration.descrizione}")
+        if not applied:
+            print(f"✅ Schema già aggiornato (versione {versione})")
+        # Partizioni del mese corrente e dei successivi, prima che arrivino le chiamate
+        await maintain_partitions(connection)
+    finally:
+        await connection.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Migrazioni dello schema del database")
+    parser.add_argument("--status", action="store_true", help="mostra la versione senza applicare nulla")
+    parser.add_argument("--target", type=int, help="applica le migrazioni fino a questa versione")
+    args = parser.parse_args()
+    asyncio.run(main(args.status, args.target))
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Registro delle query usate dall'applicazione, preparate su ogni connessione del pool
+"""
+import logging
+from typing import Dict
+
+import asyncpg
+from asyncpg.prepared_stmt import PreparedStatement
+
+# Nome → SQL. Ogni modulo registra le proprie query all'import
+STATEMENTS: Dict[str, str] = {}
+
+
+def register(name: str, sql: str) -> str:
+    """Registra una query con un nome (usato anche come etichetta nelle metriche)"""
+    if STATEMENTS.get(name, sql) != sql:
+        raise ValueError(f"Query '{name}' già registrata con un SQL diverso")
+    STATEMENTS[name] = sql
+    return name
+
+
+class PreparedConnection(asyncpg.Connection):
+    """Connessione che conserva le query del registro già preparate (parse e plan una volta sola)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements: Dict[str, PreparedStatement] = {}
+
+    async def statement(self, name: str) -> PreparedStatement:
+        stmt = self.statements.get(name)
+        if stmt is None:
+            stmt = self.statements[name] = await self.prepare(STATEMENTS[name])
+        return stmt
+
+    def forget_statement(self, name: str):
+        """Da chiamare se lo schema è cambiato e la query va ripreparata"""
+        self.statements.pop(name, None)
+
+
+async def prepare_statements(connection: PreparedConnection):
+    """Callback init del pool: prepara tutte le query registrate sulla nuova connessione"""
+    for name in STATEMENTS:
+        try:
+            await connection.statement(name)
+        except asyncpg.PostgresError as e:
+            # Es. tabelle non ancora create al primo avvio: la query verrà preparata al primo uso
+            logging.debug(f"Query '{name}' non preparata: {e}")
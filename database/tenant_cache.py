@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Cache in memoria dei ristoranti (tenant) con TTL e dimensione massima
+"""
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+
+class TenantCache:
+    """
+    Cache LRU dei ristoranti indicizzata per numero Twilio.
+    Memorizza anche i numeri sconosciuti (valore None) per non interrogare
+    il database a ogni chiamata verso un numero non registrato.
+    """
+
+    def __init__(self, ttl_seconds: float, max_size: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+        # Incrementata a ogni invalidazione: una lettura iniziata prima non può
+        # ripopolare la cache con dati ormai vecchi
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """Ritorna (trovato, valore). Il valore può essere None per un numero sconosciuto"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return False, None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, dict(value) if value is not None else None
+
+    def set(self, key: str, value: Optional[Dict[str, Any]], generation: Optional[int] = None):
+        """Memorizza un valore, a meno che la cache sia stata invalidata dopo `generation`"""
+        if generation is not None and generation != self.generation:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, dict(value) if value is not None else None)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: str):
+        """Rimuove un singolo numero dalla cache"""
+        self.generation += 1
+        self.invalidations += 1
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """Svuota completamente la cache"""
+        self.generation += 1
+        self.invalidations += 1
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Contatori della cache"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations,
+            'evictions': self.evictions,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
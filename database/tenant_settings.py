@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Impostazioni di runtime per ristorante, compilate dalle righe di configurazioni
+"""
+import logging
+from dataclasses import Field, dataclass, field, fields
+from typing import Any, Dict, Mapping, Optional
+
+from config import (
+    STT_MODEL, LLM_MODEL, LLM_TEMPERATURE, TTS_MODEL, TTS_VOICE, TTS_VOICES,
+    VAD_AGGRESSIVENESS, VAD_FRAME_MS, ENDPOINT_SILENCE_MS, SPECULATIVE_SILENCE_MS, BARGE_IN_MIN_SPEECH_MS,
+    CALL_MODE, CALL_MODES, REALTIME_MODEL,
+)
+
+
+def _setting(default, chiave: str, **limits) -> Any:
+    """Campo letto dalla chiave indicata di configurazioni, con eventuali limiti (min/max o valori ammessi)"""
+    return field(default=default, metadata={"chiave": chiave, **limits})
+
+
+@dataclass(frozen=True)
+class TenantSettings:
+    """
+    Modalità, modelli, voce e soglie di un ristorante. Le chiavi assenti o non valide in configurazioni
+    mantengono i valori di default. Immutabile: la stessa istanza è condivisa dalle chiamate.
+    """
+    stt_model: str = _setting(STT_MODEL, "modello_stt")
+    llm_model: str = _setting(LLM_MODEL, "modello_llm")
+    llm_temperature: float = _setting(LLM_TEMPERATURE, "temperatura", min=0.0, max=2.0)
+    tts_model: str = _setting(TTS_MODEL, "modello_tts")
+    tts_voice: str = _setting(TTS_VOICE, "voce", valori=TTS_VOICES)
+    vad_aggressiveness: int = _setting(VAD_AGGRESSIVENESS, "vad_aggressivita", min=0, max=3)
+    endpoint_silence_ms: int = _setting(ENDPOINT_SILENCE_MS, "silenzio_fine_turno_ms", min=150, max=5000)
+    speculative_silence_ms: int = _setting(SPECULATIVE_SILENCE_MS, "silenzio_speculativo_ms", min=VAD_FRAME_MS, max=5000)
+    barge_in_min_speech_ms: int = _setting(BARGE_IN_MIN_SPEECH_MS, "barge_in_parlato_ms", min=VAD_FRAME_MS, max=5000)
+    call_mode: str = _setting(CALL_MODE, "modalita", valori=CALL_MODES)
+    realtime_model: str = _setting(REALTIME_MODEL, "modello_realtime")
+
+
+DEFAULT_SETTINGS = TenantSettings()
+
+# Chiave di configurazioni → campo delle impostazioni
+SETTINGS_FIELDS: Dict[str, Field] = {f.metadata["chiave"]: f for f in fields(TenantSettings)}
+
+
+def parse_setting(setting: Field, raw: str) -> Any:
+    """Converte il testo di configurazioni nel tipo del campo e ne controlla i limiti"""
+    value = setting.type(raw.strip())
+    if setting.type is str and not value:
+        raise ValueError("valore vuoto")
+    limits = setting.metadata
+    if "valori" in limits and value not in limits["valori"]:
+        raise ValueError(f"valori ammessi: {', '.join(limits['valori'])}")
+    if "min" in limits and not limits["min"] <= value <= limits["max"]:
+        raise ValueError(f"fuori dall'intervallo {limits['min']}-{limits['max']}")
+    return value
+
+
+def compile_settings(values: Mapping[str, str], tenant: Optional[str] = None) -> TenantSettings:
+    """Impostazioni di un ristorante dalle sue righe di configurazioni (chiave → valore)"""
+    parsed = {}
+    for chiave, raw in values.items():
+        setting = SETTINGS_FIELDS.get(chiave)
+        if setting is None:
+            continue  # altre chiavi (es. il saluto) sono lette altrove
+        try:
+            parsed[setting.name] = parse_setting(setting, raw)
+        except (TypeError, ValueError) as e:
+            logging.warning(f"Configurazione '{chiave}' non valida per {tenant}: {raw!r} ({e}). Uso il default.")
+    return TenantSettings(**parsed) if parsed else DEFAULT_SETTINGS
+
+
+def settings_for(restaurant: Optional[Dict[str, Any]]) -> TenantSettings:
+    """Impostazioni del record di un ristorante (quelle di default se assenti)"""
+    if not restaurant:
+        return DEFAULT_SETTINGS
+    return restaurant.get('settings') or DEFAULT_SETTINGS
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Test di carico: N chiamate Twilio simulate in parallelo contro l'app FastAPI.
+
+Ogni chiamata segue il protocollo Media Streams (connected → media → stop) e invia
+frame µ-law da 20ms a ritmo reale, alternando parlato sintetico e silenzio.
+Per default avvia in locale sia l'app (main:app) sia il sostituto degli endpoint
+OpenAI (openai_standin.py), quindi funziona completamente offline. Con --provider local
+l'app usa il provider AI in-process (ai/local_provider.py) e misura solo il nostro overhead.
+
+Esempi:
+    python3 load_test.py --calls 50 --turns 3
+    python3 load_test.py --calls 50 --provider local --stt-ms 0 --llm-ms 0 --tts-ms 0
+    python3 load_test.py --calls 20 --url ws://localhost:8000   # server già avviato
+    python3 load_test.py --calls 20 --mode realtime            # sessioni speech-to-speech simulate
+"""
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+import websockets
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+FRAME_MS = 20
+FRAME_SAMPLES = 160
+NUMERI_TEST = ["+39021111111", "+39062222222", "+39063333333"]
+
+
+@dataclass
+class CallResult:
+    """Risultato di una chiamata simulata"""
+    turn_latencies: List[float] = field(default_factory=list)  # secondi: fine parlato → primo audio
+    turns_without_reply: int = 0
+    frames_sent: int = 0
+    frames_received: int = 0
+    max_send_delay: float = 0.0  # ritardo massimo del client rispetto al ritmo reale
+    error: Optional[str] = None
+
+
+def genera_audio(secondi: float, parlato: bool, seme: int) -> List[bytes]:
+    """Frame µ-law da 20ms: voce sintetica (armoniche modulate) o rumore di fondo"""
+    from audio.codec import ulaw_encode
+
+    campioni = int(8000 * secondi)
+    t = np.arange(campioni) / 8000
+    if parlato:
+        f0 = 150 + (seme % 7) * 15
+        segnale = np.sin(2 * np.pi * f0 * t) + 0.5 * np.sin(2 * np.pi * 3 * f0 * t)
+        segnale *= 8000 * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t))
+    else:
+        segnale = np.random.default_rng(seme).integers(-30, 30, campioni)
+    pcm = ulaw_encode(segnale.astype(np.int16))
+    return [pcm[i:i + FRAME_SAMPLES] for i in range(0, len(pcm) - FRAME_SAMPLES + 1, FRAME_SAMPLES)]
+
+
+async def simula_chiamata(url: str, indice: int, turni: int, parlato_s: float, silenzio_s: float) -> CallResult:
+    """Una chiamata: per ogni turno parla, resta in silenzio e misura quando arriva la risposta"""
+    risultato = CallResult()
+    numero = NUMERI_TEST[indice % len(NUMERI_TEST)]
+    stream_sid = f"MZ-load-{indice}"
+    parlato = genera_audio(parlato_s, True, indice)
+    silenzio = genera_audio(silenzio_s, False, indice)
+
+    fine_parlato: Optional[float] = None
+    primo_audio: Optional[float] = None
+
+    async def ricevi(websocket):
+        nonlocal primo_audio
+        async for raw in websocket:
+            message = json.loads(raw)
+            if message.get("event") == "media":
+                risultato.frames_received += 1
+                if fine_parlato is not None and primo_audio is None:
+                    primo_audio = time.perf_counter()
+
+    try:
+        # Twilio non negozia permessage-deflate: senza compressione il costo per frame è realistico
+        async with websockets.connect(f"{url}/ws/{numero}", max_size=None, compression=None) as websocket:
+            receiver = asyncio.create_task(ricevi(websocket))
+            await websocket.send(json.dumps({"event": "connected", "protocol": "Call", "streamSid": stream_sid}))
+
+            inizio = time.perf_counter()
+            inviati = 0
+
+            async def invia(frames):
+                nonlocal inviati
+                for frame in frames:
+                    # Ritmo reale: ogni frame parte al suo istante, senza accumulare ritardo
+                    attesa = inizio + inviati * FRAME_MS / 1000 - time.perf_counter()
+                    if attesa > 0:
+                        await asyncio.sleep(attesa)
+                    else:
+                        risultato.max_send_delay = max(risultato.max_send_delay, -attesa)
+                    await websocket.send(json.dumps({
+                        "event": "media",
+                        "streamSid": stream_sid,
+                        "media": {"payload": base64.b64encode(frame).decode('utf-8')}
+                    }))
+                    inviati += 1
+
+            for _ in range(turni):
+                fine_parlato, primo_audio = None, None
+                await invia(parlato)
+                fine_parlato = time.perf_counter()
+                await invia(silenzio)
+                if primo_audio is not None:
+                    risultato.turn_latencies.append(primo_audio - fine_parlato)
+                else:
+                    risultato.turns_without_reply += 1
+
+            risultato.frames_sent = inviati
+            await websocket.send(json.dumps({"event": "stop", "streamSid": stream_sid}))
+            await asyncio.sleep(0.1)
+            receiver.cancel()
+    except Exception as e:
+        risultato.error = str(e)
+    return risultato
+
+
+class ServerThread(threading.Thread):
+    """Esegue un'app ASGI con uvicorn in un thread con il proprio event loop"""
+
+    def __init__(self, app, port: int):
+        super().__init__(daemon=True)
+        import uvicorn
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.server.serve())
+
+    def wait_started(self, timeout: float = 10):
+        limite = time.time() + timeout
+        while not self.server.started:
+            if time.time() > limite:
+                raise RuntimeError("Il server non si è avviato in tempo")
+            time.sleep(0.05)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.join(timeout=10)
+
+
+async def misura_lag(loop: asyncio.AbstractEventLoop, campioni: List[float], stop: threading.Event,
+                     intervallo: float = 0.05):
+    """Misura di quanto l'event loop del server ritarda un timer da 50ms"""
+    async def sonda():
+        prima = time.perf_counter()
+        await asyncio.sleep(intervallo)
+        return time.perf_counter() - prima - intervallo
+
+    while not stop.is_set():
+        futuro = asyncio.run_coroutine_threadsafe(sonda(), loop)
+        campioni.append(await asyncio.wrap_future(futuro))
+
+
+def percentile(valori: List[float], p: float) -> float:
+    if not valori:
+        return float("nan")
+    ordinati = sorted(valori)
+    return ordinati[min(len(ordinati) - 1, int(round(p / 100 * (len(ordinati) - 1))))]
+
+
+def stampa_report(risultati: List[CallResult], durata: float, lag: List[float], stats_server: Optional[dict]):
+    latenze = [l for r in risultati for l in r.turn_latencies]
+    errori = [r.error for r in risultati if r.error]
+
+    print("\n📊 Report test di carico")
+    print("=" * 60)
+    print(f"Chiamate simulate:        {len(risultati)} ({len(errori)} con errori)")
+    print(f"Durata:                   {durata:.1f} s")
+    print(f"Turni con risposta:       {len(latenze)}")
+    print(f"Turni senza risposta:     {sum(r.turns_without_reply for r in risultati)}")
+    if latenze:
+        print("Latenza turno (fine parlato → primo audio):")
+        print(f"   p50 {percentile(latenze, 50) * 1000:7.0f} ms   p95 {percentile(latenze, 95) * 1000:7.0f} ms   "
+              f"p99 {percentile(latenze, 99) * 1000:7.0f} ms   max {max(latenze) * 1000:7.0f} ms")
+    print(f"Frame inviati / ricevuti: {sum(r.frames_sent for r in risultati)} / "
+          f"{sum(r.frames_received for r in risultati)}")
+    print(f"Ritardo massimo client:   {max((r.max_send_delay for r in risultati), default=0) * 1000:.1f} ms")
+    if stats_server is not None:
+        print(f"Frame scartati (server):  {stats_server['frames_dropped']} su {stats_server['frames_received']}")
+        print(f"Turni scartati (server):  {stats_server['turns_dropped']}")
+    if lag:
+        print(f"Lag event loop (server):  p50 {percentile(lag, 50) * 1000:.1f} ms   "
+              f"p99 {percentile(lag, 99) * 1000:.1f} ms   max {max(lag) * 1000:.1f} ms")
+    for errore in sorted(set(errori))[:5]:
+        print(f"❌ {errore}")
+
+
+async def esegui(args):
+    server = standin = None
+    registry = None
+    lag: List[float] = []
+    stop_lag = threading.Event()
+    url = args.url
+
+    if url is None:
+        # Risultati ripetibili: la cache TTS su disco non sopravvive tra un'esecuzione e l'altra
+        os.environ.setdefault("TTS_CACHE_DIR", "")
+
+    if url is None and args.provider == "local":
+        # Provider AI in-process: nessuna richiesta HTTP verso il sostituto
+        os.environ["AI_PROVIDER"] = "local"
+        os.environ["LOCAL_AI_STT_MS"] = str(args.stt_ms)
+        os.environ["LOCAL_AI_LLM_FIRST_TOKEN_MS"] = str(args.llm_ms)
+        os.environ["LOCAL_AI_TTS_FIRST_BYTE_MS"] = str(args.tts_ms)
+    elif url is None:
+        # App e sostituto OpenAI locali, ognuno con il proprio event loop.
+        # Le variabili d'ambiente vanno impostate prima di importare config.
+        os.environ["OPENAI_API_KEY"] = "sk-local"
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.standin_port}/v1"
+        os.environ["CALL_MODE"] = args.mode
+        import openai_standin
+        openai_standin.latency.stt_ms = args.stt_ms
+        openai_standin.latency.llm_first_token_ms = args.llm_ms
+        openai_standin.latency.tts_first_byte_ms = args.tts_ms
+        standin = ServerThread(openai_standin.app, args.standin_port)
+        standin.start()
+        standin.wait_started()
+
+    if url is None:
+        import main
+        # Offline non c'è database: gli errori di lookup del ristorante sono attesi
+        logging.getLogger().setLevel(logging.INFO if args.verbose else logging.CRITICAL)
+        registry = main.session_registry
+        server = ServerThread(main.app, args.port)
+        server.start()
+        server.wait_started()
+        url = f"ws://127.0.0.1:{args.port}"
+
+    lag_task = asyncio.create_task(misura_lag(server.loop, lag, stop_lag)) if server else None
+
+    print(f"🚀 {args.calls} chiamate × {args.turns} turni verso {url}")
+    inizio = time.perf_counter()
+
+    async def chiamata_scaglionata(i):
+        # Le chiamate reali non iniziano tutte nello stesso millisecondo
+        await asyncio.sleep(i * args.ramp / max(1, args.calls))
+        return await simula_chiamata(url, i, args.turns, args.speech, args.silence)
+
+    risultati = await asyncio.gather(*(chiamata_scaglionata(i) for i in range(args.calls)))
+    durata = time.perf_counter() - inizio
+
+    stop_lag.set()
+    if lag_task:
+        await lag_task
+    await asyncio.sleep(0.2)  # lascia chiudere le sessioni sul server
+    stampa_report(risultati, durata, lag, registry.stats() if registry is not None else None)
+
+    if server:
+        server.stop()
+    if standin:
+        standin.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test di carico con chiamate Twilio simulate")
+    parser.add_argument("--calls", type=int, default=20, help="Chiamate contemporanee")
+    parser.add_argument("--turns", type=int, default=3, help="Turni di parola per chiamata")
+    parser.add_argument("--speech", type=float, default=1.5, help="Secondi di parlato per turno")
+    parser.add_argument("--silence", type=float, default=4.0, help="Secondi di silenzio dopo il parlato")
+    parser.add_argument("--ramp", type=float, default=2.0, help="Secondi in cui distribuire l'avvio delle chiamate")
+    parser.add_argument("--url", default=None, help="Server già avviato (es. ws://localhost:8000)")
+    parser.add_argument("--port", type=int, default=8765, help="Porta dell'app avviata localmente")
+    parser.add_argument("--provider", choices=["standin", "local"], default="standin",
+                        help="standin: API OpenAI simulate via HTTP; local: provider AI in-process")
+    parser.add_argument("--mode", choices=["pipeline", "realtime"], default="pipeline",
+                        help="Modalità di conversazione di tutte le chiamate (solo con --provider standin)")
+    parser.add_argument("--standin-port", type=int, default=8766, help="Porta del sostituto OpenAI")
+    parser.add_argument("--stt-ms", type=float, default=400, help="Latenza simulata della trascrizione")
+    parser.add_argument("--llm-ms", type=float, default=350, help="Latenza simulata del primo token")
+    parser.add_argument("--tts-ms", type=float, default=200, help="Latenza simulata del primo byte TTS")
+    parser.add_argument("--verbose", action="store_true", help="Mostra i log del server")
+    asyncio.run(esegui(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
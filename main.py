@@ -1,162 +1,371 @@
 # main.py
 import logging
 import base64
-import audioop
 import io
 import wave
-import webrtcvad
 import time
+import asyncio
+from typing import AsyncIterator, Optional
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from openai import AsyncOpenAI
-from urllib.parse import parse_qs, urlparse
-from config import OPENAI_API_KEY, VAD_AGGRESSIVENESS, VAD_FRAME_MS, VAD_SAMPLE_RATE, VAD_BYTES_PER_FRAME
+from fastapi.responses import PlainTextResponse
+from urllib.parse import unquote
+from config import (
+    VAD_SAMPLE_RATE, LLM_STREAMING, GREETINGS_ENABLED, FAQ_FAST_PATH, DEFAULT_SYSTEM_PROMPT, CALL_MODE_REALTIME,
+)
 from database.db_manager import db_manager
+from database.call_log_writer import call_log_writer
+from database.tenant_settings import settings_for
+from call.session import CallSession, session_registry
+from call.pipeline import CallPipeline
+from call.realtime import RealtimeBridge
+from audio.playback import render_ulaw, send_mark, stream_segments_to_twilio
+from audio.tts_cache import tts_cache
+from ai.sentences import split_sentences
+from ai.providers import AIProviders, create_providers
+from ai.realtime import create_realtime_client
+from call.greetings import GreetingStore, greeting_text
+from ai.faq import FaqMatcher
+from metrics.registry import (
+    metrics, render_counter, render_gauge, timed_iter, TurnSpans, ROUTE_FAQ,
+    STAGE_WAV_BUILD, STAGE_TRANSCRIPTION, STAGE_TENANT_LOOKUP, STAGE_COMPLETION, STAGE_SYNTHESIS,
+)
 
 # --- Configurazione ---
 logging.basicConfig(level=logging.INFO)
 app = FastAPI()
 
-# Inizializza il client OpenAI solo se la chiave API è disponibile
-client = None
-if OPENAI_API_KEY and OPENAI_API_KEY.startswith("sk-"):
-    client = AsyncOpenAI(api_key=OPENAI_API_KEY)
-    logging.info("Client OpenAI inizializzato.")
-else:
-    logging.warning("OPENAI_API_KEY non configurata o non valida. Le funzionalità AI non saranno disponibili.")
-
-# Variabili di stato della chiamata
-is_speaking = False
-speech_buffer = bytearray()
-silence_frames = 0
-audio_buffer = bytearray()
-current_stream_sid = None
-current_call_id = None
-call_start_time = None
-
-vad = webrtcvad.Vad(VAD_AGGRESSIVENESS)
+# Provider AI per trascrizione, risposta e sintesi (AI_PROVIDER=openai|local, vedi ai/providers.py).
+# Vengono creati in startup(): l'import di openai è la parte più lenta dell'avvio.
+providers = None
+
+# Sessioni speech-to-speech per i ristoranti in modalità realtime (vedi call/realtime.py)
+realtime = None
+
+# Saluti iniziali pre-sintetizzati per ristorante (vedi call/greetings.py)
+greetings = None
+tenant_audio_task = None
+
+# Risposte rapide a orari e indirizzo senza LLM (vedi ai/faq.py)
+faq_matcher = FaqMatcher()
+db_manager.add_tenant_listener(faq_matcher.forget)
+
+# Lo stato di ogni chiamata vive in una CallSession (vedi call/session.py),
+# così un'istanza può servire più chiamate in contemporanea.
 
 # --- EVENT HANDLERS PER DATABASE ---
 @app.on_event("startup")
 async def startup():
     """Inizializza il database all'avvio dell'applicazione"""
+    global providers, realtime, greetings, tenant_audio_task
+    # I provider AI (import compreso) vengono caricati in un thread mentre si apre il pool del database
+    loading = asyncio.create_task(asyncio.to_thread(create_providers)) if providers is None else None
     try:
         await db_manager.initialize()
+        database_ready = True
         logging.info("Applicazione avviata e database inizializzato.")
     except Exception as e:
+        database_ready = False
         logging.error(f"Errore durante l'inizializzazione del database: {e}")
         logging.warning("L'applicazione continuerà senza database. Le funzionalità multi-tenant non saranno disponibili.")
 
+    if loading is not None:
+        providers = await loading
+        if providers is not None and GREETINGS_ENABLED:
+            greetings = GreetingStore(providers.tts, db_manager.get_restaurant_by_phone, tts_cache)
+            db_manager.add_tenant_listener(greetings.on_tenants_changed)
+    if realtime is None:
+        realtime = create_realtime_client()
+    if not database_ready:
+        return
+
+    # Il log delle chiamate viene scritto a blocchi in background
+    call_log_writer.start()
+
+    # Saluti e risposte rapide vengono sintetizzati in background: l'avvio non aspetta il TTS
+    if providers is not None:
+        tenant_audio_task = asyncio.create_task(warm_tenant_audio())
+
+async def warm_tenant_audio():
+    """Prepara il saluto e le risposte rapide di ogni ristorante"""
+    try:
+        restaurants = await db_manager.get_all_restaurants()
+        if greetings is not None:
+            await greetings.warm(restaurants)
+        if FAQ_FAST_PATH:
+            for restaurant in restaurants:
+                tts = providers.tts.with_settings(settings_for(restaurant))
+                for answer in faq_matcher.answers(restaurant):
+                    await render_ulaw(answer, tts.synthesize, tts_cache, tts.cache_namespace)
+            logging.info("Audio delle risposte rapide pronto.")
+    except Exception as e:
+        logging.error(f"Errore nella preparazione dell'audio dei ristoranti: {e}")
+
 @app.on_event("shutdown")
 async def shutdown():
     """Chiude le connessioni al database alla chiusura"""
+    if tenant_audio_task is not None:
+        tenant_audio_task.cancel()
+    if greetings is not None:
+        await greetings.close()
+    # Prima di chiudere il pool si scrivono gli eventi ancora in coda
+    await call_log_writer.close()
     await db_manager.close()
     logging.info("Applicazione chiusa e connessioni database terminate.")
 
-async def process_user_speech(websocket: WebSocket, stream_sid: str, numero_chiamato: str):
+async def text_segments(*texts: str) -> AsyncIterator[str]:
+    """Testi già pronti come stream di segmenti"""
+    for text in texts:
+        yield text
+
+async def speak(session: CallSession, segments: AsyncIterator[str], spans: TurnSpans) -> int:
+    """Riproduce i segmenti di testo: l'audio già in cache TTS non passa dalla sintesi"""
+    if session.greeting_task is not None:
+        # Le risposte non si sovrappongono al saluto
+        await asyncio.wait([session.greeting_task])
+    tts = call_providers(session).tts
+    frames_sent = await stream_segments_to_twilio(
+        session.websocket, session.stream_sid, segments,
+        lambda text: timed_iter(tts.synthesize(text), spans, STAGE_SYNTHESIS),
+        spans=spans, cache=tts_cache, cache_namespace=tts.cache_namespace
+    )
+    if frames_sent:
+        await track_playback(session, frames_sent, spans.started + spans.first_audio)
+    return frames_sent
+
+async def track_playback(session: CallSession, frames: int, first_frame_at: float):
+    """Marker dopo l'audio inviato: finché Twilio non lo rimanda, il chiamante può interrompere"""
+    await send_mark(session.websocket, session.stream_sid, session.audio_queued(frames, first_frame_at))
+
+def build_wav(audio: bytes) -> bytes:
+    """File WAV in memoria per il provider STT"""
+    wav_buffer = io.BytesIO()
+    with wave.open(wav_buffer, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2) # PCM 16-bit
+        wf.setframerate(VAD_SAMPLE_RATE)
+        wf.writeframes(audio)
+    return wav_buffer.getvalue()
+
+def call_providers(session: CallSession) -> AIProviders:
+    """Provider AI con modelli, voce e temperatura del ristorante chiamato"""
+    return providers.with_settings(session.settings)
+
+async def transcribe_audio(session: CallSession, audio: bytes) -> str:
+    """Trascrizione speculativa della pipeline, avviata prima della fine del turno"""
+    if providers is None:
+        raise RuntimeError("Provider AI non inizializzato")
+    return await call_providers(session).stt.transcribe(build_wav(audio))
+
+async def process_user_speech(session: CallSession, audio: bytes, transcription: Optional[asyncio.Task] = None):
     """
     Funzione principale che gestisce la logica AI:
-    1. Trascrive l'audio dell'utente
+    1. Trascrive l'audio dell'utente (o attende la trascrizione speculativa già avviata)
     2. Pensa a una risposta
     3. Converte la risposta in audio e la invia a Twilio
+
+    Viene eseguita dal worker dei turni della pipeline, mai dal loop di ricezione.
     """
-    global audio_buffer
-    logging.info("L'utente ha finito di parlare. Processo l'audio...")
+    numero_chiamato = session.numero_chiamato
+    logging.info(f"L'utente ha finito di parlare. Processo {len(audio) // (VAD_SAMPLE_RATE * 2 // 1000)}ms di audio...")
 
-    # Verifica se il client OpenAI è inizializzato
-    if client is None:
-        logging.error("Client OpenAI non inizializzato. Impossibile processare l'audio.")
-        audio_buffer.clear()
+    # Verifica se i provider AI sono disponibili
+    if providers is None:
+        logging.error("Provider AI non inizializzato. Impossibile processare l'audio.")
         return
 
+    # Modelli e voce del ristorante, già compilati nella cache dei tenant
+    tenant_ai = call_providers(session)
+    # Tempi di ogni fase del turno, aggregati per ristorante su /metrics
+    spans = TurnSpans(numero_chiamato)
+    transcript = None
     try:
         # --- 1. TRASCRIVERE (Speech-to-Text) ---
-        # Creiamo un file WAV in memoria per OpenAI
-        wav_buffer = io.BytesIO()
-        with wave.open(wav_buffer, "wb") as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2) # PCM 16-bit
-            wf.setframerate(VAD_SAMPLE_RATE)
-            wf.writeframes(audio_buffer)
-        
-        wav_buffer.seek(0)
-        wav_buffer.name = "user_speech.wav" # Nome fittizio per l'API
-
-        transcript = await client.audio.transcriptions.create(
-            model="whisper-1",
-            file=wav_buffer,
-            response_format="text"
-        )
+        if transcription is not None:
+            # Partita durante il silenzio finale: si attende solo la parte che manca
+            with spans.span(STAGE_TRANSCRIPTION):
+                transcript = await transcription
+        else:
+            # Creiamo un file WAV in memoria per il provider STT
+            with spans.span(STAGE_WAV_BUILD):
+                wav = build_wav(audio)
+            with spans.span(STAGE_TRANSCRIPTION):
+                transcript = await tenant_ai.stt.transcribe(wav)
         logging.info(f"Testo trascritto: '{transcript}'")
+        if session.unanswered_text:
+            # Il chiamante aveva interrotto la risposta alla frase precedente: la si ripropone insieme
+            transcript = f"{session.unanswered_text} {transcript}"
+            session.unanswered_text = ""
 
         # --- 2. PENSARE (LLM) ---
         # Recupera il prompt specifico per il ristorante dal database
+        restaurant_info = None
         try:
-            restaurant_info = await db_manager.get_restaurant_by_phone(numero_chiamato)
-            
+            with spans.span(STAGE_TENANT_LOOKUP):
+                restaurant_info = await db_manager.get_restaurant_by_phone(numero_chiamato)
+
             if not restaurant_info:
                 logging.warning(f"Ristorante non trovato per il numero: {numero_chiamato}")
                 # Fallback a un prompt generico
-                system_prompt = "Sei un assistente virtuale generico per ristoranti. Rispondi in modo cortese e conciso."
+                system_prompt = DEFAULT_SYSTEM_PROMPT
             else:
                 system_prompt = restaurant_info['system_prompt']
                 logging.info(f"Prompt caricato per {restaurant_info['nome_ristorante']} ({numero_chiamato})")
         except Exception as e:
             logging.error(f"Errore nel recupero delle informazioni del ristorante: {e}")
             # Fallback a un prompt generico
-            system_prompt = "Sei un assistente virtuale generico per ristoranti. Rispondi in modo cortese e conciso."
+            system_prompt = DEFAULT_SYSTEM_PROMPT
         
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": transcript}
-            ],
-            temperature=0.7
-        )
-        ai_response_text = response.choices[0].message.content
+        # --- RISPOSTA RAPIDA ---
+        # Orari e indirizzo si leggono dai dati del ristorante: niente LLM, audio quasi sempre in cache
+        faq = faq_matcher.match(restaurant_info, transcript) if FAQ_FAST_PATH else None
+        if faq is not None:
+            spans.route = ROUTE_FAQ
+            logging.info(f"Risposta rapida ({', '.join(faq.intents)}): '{faq.answer}'")
+            session.conversation.add_turn(transcript, faq.answer)
+            frames_sent = await speak(session, text_segments(faq.answer), spans)
+            logging.info(f"Risposta audio inviata a Twilio ({frames_sent} frame).")
+            return
+
+        # Cronologia della chiamata entro il budget di token: la latenza dell'LLM
+        # non cresce con la durata della chiamata
+        messages = session.conversation.build_messages(system_prompt, transcript)
+
+        if LLM_STREAMING:
+            # --- 3./4. PARLARE MENTRE SI PENSA ---
+            # Ogni frase viene inviata al TTS appena l'LLM la completa; l'audio
+            # dei segmenti viene riprodotto nell'ordine originale.
+            reply_segments = []
+
+            async def segments():
+                async for segment in split_sentences(timed_iter(tenant_ai.llm.stream(messages), spans, STAGE_COMPLETION)):
+                    reply_segments.append(segment)
+                    yield segment
+
+            try:
+                frames_sent = await speak(session, segments(), spans)
+            finally:
+                # Anche una risposta interrotta fa parte della conversazione
+                session.conversation.add_turn(transcript, " ".join(reply_segments))
+            logging.info(f"Risposta audio inviata a Twilio ({frames_sent} frame).")
+            return
+
+        with spans.span(STAGE_COMPLETION):
+            ai_response_text = await tenant_ai.llm.complete(messages)
         logging.info(f"Risposta AI (testo): '{ai_response_text}'")
+        session.conversation.add_turn(transcript, ai_response_text)
 
-        # --- 3. PARLARE (Text-to-Speech) ---
-        speech_response = await client.audio.speech.create(
-            model="tts-1",
-            voice="nova",
-            input=ai_response_text,
-            response_format="pcm" # Chiediamo PCM per una conversione più facile
-        )
-        
-        # L'output di OpenAI TTS è PCM 24kHz. Dobbiamo ricampionarlo a 8kHz per Twilio.
-        pcm_24k = speech_response.read()
-        pcm_8k, _ = audioop.ratecv(pcm_24k, 2, 1, 24000, 8000, None)
-        
-        # E poi convertirlo in µ-law
-        ulaw_response = audioop.lin2ulaw(pcm_8k, 2)
-        
-        # --- 4. RISPONDERE A TWILIO ---
-        payload = base64.b64encode(ulaw_response).decode('utf-8')
-        response_message = {
-            "event": "media",
-            "streamSid": stream_sid,
-            "media": {
-                "payload": payload
-            }
-        }
-        await websocket.send_json(response_message)
-        logging.info("Risposta audio inviata a Twilio.")
+        # --- 3. PARLARE (Text-to-Speech) e 4. RISPONDERE A TWILIO ---
+        # L'audio viene ricampionato e inviato in frame da 20ms man mano che arriva,
+        # senza attendere la fine della sintesi.
+        frames_sent = await speak(session, text_segments(ai_response_text), spans)
+        logging.info(f"Risposta audio inviata a Twilio ({frames_sent} frame).")
 
+    except asyncio.CancelledError:
+        # Barge-in o fine chiamata: LLM e TTS in corso vengono annullati
+        if transcript and spans.first_audio is None:
+            session.unanswered_text = transcript
+        logging.info("Turno AI interrotto.")
+        raise
     except Exception as e:
+        spans.failed = True
         logging.error(f"Errore durante il processo AI: {e}")
     finally:
-        # Pulisci il buffer per il prossimo turno di parola
-        audio_buffer.clear()
+        metrics.observe_turn(spans)
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Metriche in formato testo Prometheus: latenze per fase e per ristorante, chiamate e frame"""
+    stats = session_registry.stats()
+    lines = metrics.render()
+    lines += render_gauge("receptionist_active_calls", "Chiamate attive.", stats['active_calls'])
+    lines += render_counter("receptionist_calls_total", "Chiamate terminate.", stats['calls'])
+    lines += render_counter("receptionist_frames_received_total", "Frame audio ricevuti.", stats['frames_received'])
+    lines += render_counter("receptionist_frames_dropped_total", "Frame audio scartati.", stats['frames_dropped'])
+    lines += render_counter("receptionist_turns_processed_total", "Turni elaborati.", stats['turns_processed'])
+    lines += render_counter("receptionist_turns_dropped_total", "Turni scartati.", stats['turns_dropped'])
+    lines += render_counter("receptionist_barge_ins_total", "Interruzioni del chiamante durante la risposta.",
+                            stats['barge_ins'])
+    lines += render_counter("receptionist_call_tasks_cancelled_total",
+                            "Task di lavoro AI (turni, saluti, trascrizioni) interrotti dalla fine della chiamata.",
+                            stats['tasks_cancelled'])
+    lines += render_counter("receptionist_call_tasks_abandoned_total",
+                            "Task delle chiamate non terminati entro il timeout di chiusura.", stats['tasks_abandoned'])
+
+    cache = db_manager.tenant_cache.stats()
+    lines += render_gauge("receptionist_tenant_cache_size", "Ristoranti in cache.", cache['size'])
+    lines += render_counter("receptionist_tenant_cache_hits_total", "Lookup serviti dalla cache.", cache['hits'])
+    lines += render_counter("receptionist_tenant_cache_misses_total", "Lookup andati al database.", cache['misses'])
+
+    tts = tts_cache.stats()
+    lines += render_gauge("receptionist_tts_cache_bytes", "Byte di audio µ-law nella cache TTS in memoria.", tts['bytes'])
+    lines += render_gauge("receptionist_tts_cache_entries", "Testi nella cache TTS in memoria.", tts['entries'])
+    lines += render_counter("receptionist_tts_cache_hits_total", "Audio servito dalla cache TTS in memoria.", tts['hits'])
+    lines += render_counter("receptionist_tts_cache_disk_hits_total", "Audio servito dalla cache TTS su disco.", tts['disk_hits'])
+    lines += render_counter("receptionist_tts_cache_misses_total", "Testi sintetizzati dal provider TTS.", tts['misses'])
+    lines += render_gauge("receptionist_tts_cache_hit_ratio", "Frazione di testi serviti dalla cache TTS.", tts['hit_rate'])
+
+    pool = db_manager.pool_stats()
+    lines += render_gauge("receptionist_db_pool_size", "Connessioni aperte nel pool del database.", pool['size'])
+    lines += render_gauge("receptionist_db_pool_idle", "Connessioni libere nel pool del database.", pool['idle'])
+    lines += render_gauge("receptionist_db_pool_max_size", "Connessioni massime del pool del database.", pool['max_size'])
+
+    log = call_log_writer.stats()
+    lines += render_gauge("receptionist_call_log_pending", "Eventi del log chiamate in attesa di scrittura.", log['pending'])
+    lines += render_counter("receptionist_call_log_written_total", "Eventi del log chiamate scritti.", log['written'])
+    lines += render_counter("receptionist_call_log_dropped_total", "Eventi del log chiamate scartati.", log['dropped'])
+    lines += render_counter("receptionist_call_log_rejected_total",
+                            "Eventi del log chiamate scartati per dati non validi.", log['rejected'])
+
+    if greetings is not None:
+        saluti = greetings.stats()
+        lines += render_gauge("receptionist_greetings_ready", "Ristoranti con il saluto già pronto.", saluti['ready'])
+        lines += render_counter("receptionist_greetings_prerendered_total",
+                                "Saluti inviati da audio pre-sintetizzato.", saluti['prerendered_plays'])
+        lines += render_counter("receptionist_greetings_synthesized_total",
+                                "Saluti sintetizzati al momento della chiamata.", saluti['synthesized_plays'])
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
+async def play_greeting(session: CallSession):
+    """Invia il saluto del ristorante appena lo stream è pronto"""
+    try:
+        started = time.perf_counter()
+        frames_sent = await greetings.play(session.websocket, session.stream_sid, session.numero_chiamato)
+        logging.info(f"Saluto inviato a Twilio ({frames_sent} frame).")
+        if frames_sent:
+            await track_playback(session, frames_sent, started)
+    except Exception as e:
+        logging.error(f"Errore nell'invio del saluto: {e}")
+
+
+def start_realtime(session: CallSession, restaurant: Optional[dict]) -> Optional[RealtimeBridge]:
+    """Sessione speech-to-speech per i ristoranti in modalità realtime (None = si resta sulla pipeline)"""
+    if realtime is None:
+        logging.warning(f"Modalità realtime non disponibile per {session.numero_chiamato}: uso la pipeline.")
+        return None
+    instructions = restaurant['system_prompt'] if restaurant else DEFAULT_SYSTEM_PROMPT
+    greeting = greeting_text(restaurant) if greetings is not None else None
+    bridge = RealtimeBridge(session, realtime, settings_for(restaurant), instructions, greeting)
+    bridge.start()
+    return bridge
+
+
+def finalize_call(session: CallSession, status: str):
+    """Accoda la fine della chiamata nel log (se ne era stato registrato l'inizio)"""
+    if session.call_logged and session.call_start_time:
+        durata_secondi = session.duration()
+        if call_log_writer.log_end(session.stream_sid, durata_secondi, status):
+            logging.info(f"Fine chiamata accodata nel log ({status}). Durata: {durata_secondi} secondi")
+    # Evita una doppia registrazione se arrivano sia 'stop' che la disconnessione
+    session.call_logged = False
 
 
 @app.websocket("/ws/{numero_chiamato}")
 async def websocket_endpoint(websocket: WebSocket, numero_chiamato: str):
-    global is_speaking, speech_buffer, silence_frames, audio_buffer, current_stream_sid, current_call_id, call_start_time
-    
     # --- NUOVO: ESTRAZIONE NUMERO CHIAMATO DAL PATH ---
     # Il numero ora arriva direttamente come argomento della funzione!
-    numero_chiamato = urllib.parse.unquote(numero_chiamato)
+    numero_chiamato = unquote(numero_chiamato)
     
     # --- AGGIUNGI QUESTA RIGA ---
     logging.info(f"Numero chiamato ricevuto nel path: '{numero_chiamato}'")
@@ -170,99 +379,77 @@ async def websocket_endpoint(websocket: WebSocket, numero_chiamato: str):
         return
     
     logging.info(f"Connessione da Twilio per {numero_chiamato} accettata.")
+    session = session_registry.register(CallSession(websocket=websocket, numero_chiamato=numero_chiamato))
+    pipeline = CallPipeline(session, process_user_speech, transcribe=lambda audio: transcribe_audio(session, audio))
+    pipeline.start()
+    bridge = None
     
     try:
         while True:
             message = await websocket.receive_json()
             event = message.get("event")
 
-            if event == "connected":
-                current_stream_sid = message.get('streamSid')
-                call_start_time = time.time()
-                
-                # Log dell'inizio chiamata nel database
-                try:
-                    restaurant_info = await db_manager.get_restaurant_by_phone(numero_chiamato)
-                    if restaurant_info:
-                        current_call_id = await db_manager.log_call_start(
-                            restaurant_info['id'], 
-                            current_stream_sid, 
-                            message.get('start', {}).get('callSid', 'unknown'),
-                            numero_chiamato
-                        )
-                        logging.info(f"Chiamata registrata nel database. ID: {current_call_id}")
-                except Exception as e:
-                    logging.error(f"Errore nel logging della chiamata: {e}")
+            if event in ("connected", "start"):
+                # Twilio invia 'connected' e poi 'start' con lo Stream SID: la chiamata parte dal primo che lo contiene
+                stream_sid = message.get('streamSid')
+                if stream_sid and session.stream_sid is None:
+                    session.start(stream_sid)
+
+                    # Il saluto parte subito, prima di qualsiasi accesso al database
+                    if greetings is not None:
+                        session.greeting_task = session.tasks.spawn(play_greeting(session))
+
+                    # Log dell'inizio chiamata: accodato, scritto in background dal CallLogWriter
+                    restaurant_info = None
+                    try:
+                        restaurant_info = await db_manager.get_restaurant_by_phone(numero_chiamato)
+                        if restaurant_info:
+                            # VAD e soglie di fine turno del ristorante
+                            pipeline.configure(settings_for(restaurant_info))
+                            session.call_logged = call_log_writer.log_start(
+                                restaurant_info['id'], 
+                                session.stream_sid, 
+                                message.get('start', {}).get('callSid', 'unknown'),
+                                numero_chiamato
+                            )
+                            logging.info(f"Inizio chiamata accodato nel log. Stream SID: {session.stream_sid}")
+                    except Exception as e:
+                        logging.error(f"Errore nel logging della chiamata: {e}")
+
+                    # Modalità realtime: una sessione speech-to-speech al posto di STT → LLM → TTS
+                    if settings_for(restaurant_info).call_mode == CALL_MODE_REALTIME:
+                        bridge = start_realtime(session, restaurant_info)
                 
-                logging.info(f"Evento 'connected' ricevuto. Stream SID: {current_stream_sid}")
+                logging.info(f"Evento '{event}' ricevuto. Stream SID: {session.stream_sid}")
             
             elif event == "media":
-                payload = message["media"]["payload"]
-                chunk = base64.b64decode(payload)
-                pcm_chunk = audioop.ulaw2lin(chunk, 2)
-                
-                audio_buffer.extend(pcm_chunk)
-
-                # Logica VAD: processiamo l'audio in frame
-                for i in range(0, len(pcm_chunk), VAD_BYTES_PER_FRAME):
-                    frame = pcm_chunk[i:i+VAD_BYTES_PER_FRAME]
-                    if len(frame) < VAD_BYTES_PER_FRAME:
-                        continue
-                    
-                    if vad.is_speech(frame, VAD_SAMPLE_RATE):
-                        is_speaking = True
-                        silence_frames = 0
-                    else:
-                        if is_speaking:
-                            silence_frames += 1
-
-                    # Se rileva 25 frame di silenzio (circa 750ms) dopo aver parlato,
-                    # l'utente ha finito il suo turno.
-                    if not is_speaking and len(audio_buffer) > 0:
-                        continue # Ignora il silenzio iniziale
-                    
-                    if is_speaking and silence_frames > 25:
-                        is_speaking = False
-                        silence_frames = 0
-                        await process_user_speech(websocket, current_stream_sid, numero_chiamato)
+                if bridge is not None and not bridge.failed:
+                    # Il payload µ-law va alla sessione realtime così com'è, senza decodifica
+                    bridge.push_media(message["media"]["payload"])
+                else:
+                    # Solo decodifica Base64 e accodamento: VAD e AI girano nei task della pipeline
+                    pipeline.push_frame(base64.b64decode(message["media"]["payload"]))
+
+            elif event == "mark":
+                # Twilio ha riprodotto l'audio fino al marker (o lo ha scartato dopo un 'clear')
+                session.audio_played(message.get("mark", {}).get("name"))
 
             elif event == "stop":
                 logging.info(f"Chiamata terminata: {message.get('streamSid')}")
                 
                 # Log della fine chiamata nel database
-                if current_call_id and call_start_time:
-                    try:
-                        durata_secondi = int(time.time() - call_start_time)
-                        await db_manager.log_call_end(current_call_id, durata_secondi, 'completed')
-                        logging.info(f"Chiamata registrata nel database. Durata: {durata_secondi} secondi")
-                    except Exception as e:
-                        logging.error(f"Errore nel logging della fine chiamata: {e}")
-                
-                # Reset dello stato
-                audio_buffer.clear()
-                is_speaking = False
-                silence_frames = 0
-                current_stream_sid = None
-                current_call_id = None
-                call_start_time = None
+                finalize_call(session, 'completed')
                 break
     
     except WebSocketDisconnect:
         logging.warning("Connessione da Twilio chiusa.")
         
         # Log della fine chiamata nel database (se non già fatto)
-        if current_call_id and call_start_time:
-            try:
-                durata_secondi = int(time.time() - call_start_time)
-                await db_manager.log_call_end(current_call_id, durata_secondi, 'disconnected')
-                logging.info(f"Chiamata registrata nel database (disconnessa). Durata: {durata_secondi} secondi")
-            except Exception as e:
-                logging.error(f"Errore nel logging della disconnessione: {e}")
-        
-        # Reset dello stato
-        audio_buffer.clear()
-        is_speaking = False
-        silence_frames = 0
-        current_stream_sid = None
-        current_call_id = None
-        call_start_time = None
+        finalize_call(session, 'disconnected')
+    
+    finally:
+        # Lo stato della chiamata muore con la sua sessione: STT, LLM, TTS, saluto e
+        # sessione realtime ancora in corso vengono annullati subito, con un'attesa limitata
+        await pipeline.stop()
+        session.reset_turn()
+        session_registry.unregister(session)
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Metriche di latenza per fase e per ristorante (e del database), esposte in formato testo Prometheus
+"""
+import asyncio
+import time
+from bisect import bisect_left
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config import METRICS_LATENCY_BUCKETS, METRICS_MAX_TENANTS, METRICS_FRAME_RATE_WINDOW_SECONDS, METRICS_DB_BUCKETS
+
+# Fasi di un turno di conversazione
+STAGE_WAV_BUILD = "wav_build"
+STAGE_TRANSCRIPTION = "transcription"
+STAGE_TENANT_LOOKUP = "tenant_lookup"
+STAGE_COMPLETION = "completion"
+STAGE_SYNTHESIS = "synthesis"
+STAGE_TRANSCODE = "transcode"
+STAGE_SEND = "send"
+# Sessione speech-to-speech: dalla fine del parlato (rilevata dal server) alla fine della risposta
+STAGE_REALTIME = "realtime"
+
+# Fasi che sono richieste ai provider AI (a pagamento): le loro cancellazioni vengono contate
+AI_STAGES = (STAGE_TRANSCRIPTION, STAGE_COMPLETION, STAGE_SYNTHESIS, STAGE_REALTIME)
+
+# Percorso seguito da un turno: risposta rapida dai dati del ristorante, LLM o sessione realtime
+ROUTE_FAQ = "faq"
+ROUTE_LLM = "llm"
+ROUTE_REALTIME = "realtime"
+
+# Esito delle trascrizioni speculative: usate dal turno o scartate perché il chiamante ha ripreso a parlare
+SPECULATION_COMMITTED = "committed"
+SPECULATION_DISCARDED = "discarded"
+
+OTHER_TENANT = "altro"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+class Histogram:
+    """Istogramma cumulativo con bucket fissi"""
+
+    def __init__(self, buckets: Sequence[float] = METRICS_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # l'ultimo è +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: Sequence[Tuple[str, str]]) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            cumulative += count
+            le = bound if isinstance(bound, str) else repr(float(bound))
+            lines.append(f"{name}_bucket{_format_labels([*labels, ('le', le)])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {self.sum}")
+        lines.append(f"{name}_count{_format_labels(labels)} {self.count}")
+        return lines
+
+
+class HistogramFamily:
+    """Istogrammi con lo stesso nome, uno per combinazione di etichette"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str],
+                 buckets: Sequence[float] = METRICS_LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = buckets
+        self._histograms: Dict[Tuple[str, ...], Histogram] = {}
+
+    def labels(self, *values: str) -> Histogram:
+        histogram = self._histograms.get(values)
+        if histogram is None:
+            histogram = self._histograms[values] = Histogram(self.buckets)
+        return histogram
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for values in sorted(self._histograms):
+            lines.extend(self._histograms[values].render(self.name, list(zip(self.label_names, values))))
+        return lines
+
+
+class CounterFamily:
+    """Contatori con lo stesso nome, uno per combinazione di etichette"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.values: Dict[Tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, *values: str, amount: float = 1):
+        self.values[values] += amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for values in sorted(self.values):
+            lines.append(f"{self.name}{_format_labels(list(zip(self.label_names, values)))} {self.values[values]}")
+        return lines
+
+
+class RateMeter:
+    """Eventi al secondo su una finestra scorrevole, con un contatore per ogni secondo"""
+
+    def __init__(self, window_seconds: int = METRICS_FRAME_RATE_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self._buckets: deque = deque()  # (secondo, eventi)
+
+    def add(self, count: int = 1):
+        now = int(time.monotonic())
+        if self._buckets and self._buckets[-1][0] == now:
+            self._buckets[-1][1] += count
+        else:
+            self._buckets.append([now, count])
+            self._expire(now)
+
+    def rate(self) -> float:
+        now = int(time.monotonic())
+        self._expire(now)
+        # Il secondo corrente non è ancora completo: si considerano i secondi interi precedenti
+        total = sum(count for second, count in self._buckets if second < now)
+        return total / self.window_seconds
+
+    def _expire(self, now: int):
+        while self._buckets and self._buckets[0][0] < now - self.window_seconds:
+            self._buckets.popleft()
+
+
+def render_gauge(name: str, help_text: str, value: float) -> List[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+
+def render_counter(name: str, help_text: str, value: float) -> List[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {value}"]
+
+
+class TurnSpans:
+    """
+    Tempi delle fasi di un singolo turno. Le fasi ripetute (es. invio dei frame)
+    si sommano; alla fine del turno i totali confluiscono negli istogrammi.
+    """
+
+    def __init__(self, tenant: Optional[str]):
+        self.tenant = tenant
+        self.started = time.perf_counter()
+        self.durations: Dict[str, float] = defaultdict(float)
+        self.first_audio: Optional[float] = None
+        self.cancelled: Dict[str, int] = defaultdict(int)  # richieste annullate per fase
+        self.failed = False
+        self.route = ROUTE_LLM
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        except asyncio.CancelledError:
+            self.cancelled[stage] += 1
+            raise
+        finally:
+            self.durations[stage] += time.perf_counter() - start
+
+    def add(self, stage: str, seconds: float):
+        self.durations[stage] += seconds
+
+    def mark_first_audio(self):
+        """Registra il primo frame audio inviato a Twilio"""
+        if self.first_audio is None:
+            self.first_audio = time.perf_counter() - self.started
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+
+async def timed_iter(iterator: AsyncIterator, spans: TurnSpans, stage: str) -> AsyncIterator:
+    """Inoltra gli elementi di uno stream sommando il tempo passato ad attenderli"""
+    iterator = iterator.__aiter__()
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                break
+            except asyncio.CancelledError:
+                spans.cancelled[stage] += 1
+                raise
+            finally:
+                spans.add(stage, time.perf_counter() - start)
+            yield item
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+class MetricsRegistry:
+    """Metriche del processo: latenze per fase e per ristorante, frame ricevuti"""
+
+    def __init__(self, max_tenants: int = METRICS_MAX_TENANTS):
+        self.max_tenants = max_tenants
+        self._tenants = set()
+        self.stage_seconds = HistogramFamily(
+            "receptionist_stage_seconds", "Durata delle fasi di un turno per ristorante.", ("tenant", "stage"))
+        self.first_audio_seconds = HistogramFamily(
+            "receptionist_turn_first_audio_seconds",
+            "Dall'inizio dell'elaborazione del turno al primo audio inviato a Twilio.", ("tenant",))
+        self.turn_seconds = HistogramFamily(
+            "receptionist_turn_seconds", "Durata complessiva di un turno.", ("tenant",))
+        self.turn_errors = CounterFamily(
+            "receptionist_turn_errors_total", "Turni terminati con un errore.", ("tenant",))
+        self.turns_by_route = CounterFamily(
+            "receptionist_turns_total", "Turni per percorso di risposta (faq = senza LLM).", ("tenant", "route"))
+        self.frame_rate = RateMeter()
+        self.db_pool_wait_seconds = HistogramFamily(
+            "receptionist_db_pool_wait_seconds", "Attesa di una connessione libera dal pool del database.", (),
+            METRICS_DB_BUCKETS)
+        self.db_query_seconds = HistogramFamily(
+            "receptionist_db_query_seconds", "Durata delle query del registro, per query.", ("statement",),
+            METRICS_DB_BUCKETS)
+        self.db_query_errors = CounterFamily(
+            "receptionist_db_query_errors_total", "Query fallite per query e tipo di errore (timeout, errore).",
+            ("statement", "error"))
+        self.ai_requests_cancelled = CounterFamily(
+            "receptionist_ai_requests_cancelled_total",
+            "Richieste STT, LLM, TTS e risposte realtime annullate a metà (barge-in o fine chiamata).", ("tenant", "stage"))
+        self.speculative_transcriptions = CounterFamily(
+            "receptionist_speculative_transcriptions_total",
+            "Trascrizioni avviate prima della fine del turno, per esito (committed = usate, discarded = scartate).",
+            ("outcome",))
+
+    def tenant_label(self, tenant: Optional[str]) -> str:
+        """Etichetta del ristorante, con un limite al numero di valori distinti"""
+        tenant = tenant or "sconosciuto"
+        if tenant in self._tenants:
+            return tenant
+        if len(self._tenants) >= self.max_tenants:
+            return OTHER_TENANT
+        self._tenants.add(tenant)
+        return tenant
+
+    def observe_turn(self, spans: TurnSpans):
+        """Aggiunge i tempi di un turno concluso agli istogrammi"""
+        tenant = self.tenant_label(spans.tenant)
+        for stage, seconds in spans.durations.items():
+            self.stage_seconds.labels(tenant, stage).observe(seconds)
+        if spans.first_audio is not None:
+            self.first_audio_seconds.labels(tenant).observe(spans.first_audio)
+        self.turn_seconds.labels(tenant).observe(spans.elapsed())
+        if spans.failed:
+            self.turn_errors.inc(tenant)
+        for stage, count in spans.cancelled.items():
+            if stage in AI_STAGES:
+                self.request_cancelled(tenant, stage, count)
+        self.turns_by_route.inc(tenant, spans.route)
+
+    def request_cancelled(self, tenant: Optional[str], stage: str, count: int = 1):
+        """Richieste AI annullate a metà, anche fuori da un turno (es. trascrizioni speculative)"""
+        self.ai_requests_cancelled.inc(self.tenant_label(tenant), stage, amount=count)
+
+    def fast_path_ratio(self) -> float:
+        """Frazione dei turni a cui si è risposto senza LLM"""
+        total = sum(self.turns_by_route.values.values())
+        faq = sum(count for (_, route), count in self.turns_by_route.values.items() if route == ROUTE_FAQ)
+        return faq / total if total else 0.0
+
+    def speculation_hit_ratio(self) -> float:
+        """Frazione delle trascrizioni speculative usate dal turno (il resto è lavoro sprecato)"""
+        total = sum(self.speculative_transcriptions.values.values())
+        committed = self.speculative_transcriptions.values.get((SPECULATION_COMMITTED,), 0)
+        return committed / total if total else 0.0
+
+    def render(self) -> List[str]:
+        lines = []
+        for family in (self.stage_seconds, self.first_audio_seconds, self.turn_seconds, self.turn_errors,
+                       self.turns_by_route, self.db_pool_wait_seconds, self.db_query_seconds, self.db_query_errors,
+                       self.ai_requests_cancelled, self.speculative_transcriptions):
+            lines.extend(family.render())
+        lines.extend(render_gauge(
+            "receptionist_faq_fast_path_ratio", "Frazione dei turni con risposta rapida senza LLM.",
+            self.fast_path_ratio()))
+        lines.extend(render_gauge(
+            "receptionist_speculative_transcription_hit_ratio",
+            "Frazione delle trascrizioni speculative usate dal turno.", self.speculation_hit_ratio()))
+        lines.extend(render_gauge(
+            "receptionist_inbound_frames_per_second",
+            f"Frame audio ricevuti da Twilio al secondo (media su {self.frame_rate.window_seconds}s).",
+            self.frame_rate.rate()))
+        return lines
+
+
+# Registro globale delle metriche
+metrics = MetricsRegistry()
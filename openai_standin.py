@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Sostituto locale degli endpoint OpenAI usati da main.py (Whisper, chat, TTS e sessioni realtime).
+Risponde in modo deterministico con latenze configurabili, per i test di carico offline.
+
+Uso autonomo:
+    python3 -m uvicorn openai_standin:app --port 8001
+    OPENAI_API_KEY=sk-local OPENAI_BASE_URL=http://127.0.0.1:8001/v1 uvicorn main:app
+"""
+import asyncio
+import base64
+import itertools
+import json
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Optional
+
+import webrtcvad
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+# Stesse risposte e stessa voce sintetica del provider locale (AI_PROVIDER=local)
+from ai.local_provider import LocalLatency, RISPOSTA, TRASCRIZIONE, split_tokens, synthetic_pcm
+from audio.codec import ulaw_decode
+from audio.playback import StreamingTranscoder
+
+latency = LocalLatency(stt_ms=400, llm_first_token_ms=350, llm_token_ms=15,
+                       tts_first_byte_ms=200, tts_realtime_factor=4.0)
+app = FastAPI()
+
+
+@app.post("/v1/audio/transcriptions")
+async def transcriptions(request: Request):
+    await request.body()
+    await asyncio.sleep(latency.stt_ms / 1000)
+    return PlainTextResponse(TRASCRIZIONE)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "gpt-4o-mini")
+    created = int(time.time())
+
+    if not body.get("stream"):
+        await asyncio.sleep((latency.llm_first_token_ms + latency.llm_token_ms * len(split_tokens(RISPOSTA))) / 1000)
+        return JSONResponse({
+            "id": "chatcmpl-standin", "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": RISPOSTA}}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    async def stream():
+        await asyncio.sleep(latency.llm_first_token_ms / 1000)
+        for token in split_tokens(RISPOSTA):
+            chunk = {
+                "id": "chatcmpl-standin", "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(latency.llm_token_ms / 1000)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.post("/v1/audio/speech")
+async def speech(request: Request):
+    body = await request.json()
+    pcm = synthetic_pcm(latency.tts_ms_per_char * len(body.get("input", "")))
+    chunk_bytes = 4800  # 100ms
+    pausa = 0.1 / latency.tts_realtime_factor
+
+    async def stream():
+        await asyncio.sleep(latency.tts_first_byte_ms / 1000)
+        for i in range(0, len(pcm), chunk_bytes):
+            yield pcm[i:i + chunk_bytes]
+            await asyncio.sleep(pausa)
+
+    return StreamingResponse(stream(), media_type="audio/pcm")
+
+
+# --- Sessioni realtime (sottoinsieme del protocollo OpenAI Realtime usato da call/realtime.py) ---
+# Eventi ricevuti dal client, per tipo: i test verificano ad esempio i 'conversation.item.truncate'
+realtime_events: Counter = Counter()
+_ids = itertools.count(1)
+
+REALTIME_FRAME_BYTES = 320    # 20ms di PCM 16-bit a 8kHz valutati dal VAD
+REALTIME_CHUNK_BYTES = 800    # 100ms di µ-law per ogni 'response.audio.delta'
+
+
+@lru_cache(maxsize=1)
+def realtime_audio() -> bytes:
+    """La risposta sintetica in µ-law a 8kHz, come la produce una sessione g711_ulaw"""
+    transcoder = StreamingTranscoder()
+    frames = transcoder.feed(synthetic_pcm(latency.tts_ms_per_char * len(RISPOSTA))) + transcoder.flush()
+    return b"".join(frames)
+
+
+class RealtimeStandin:
+    """Una sessione: VAD lato server, trascrizione e risposta predefinite in µ-law"""
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.vad = webrtcvad.Vad(3)
+        self.silence_ms = 500
+        self.pcm = bytearray()
+        self.speaking = False
+        self.silence = 0
+        self.response: Optional[asyncio.Task] = None
+
+    async def send(self, event_type: str, **fields):
+        await self.websocket.send_json({"type": event_type, "event_id": f"event_{next(_ids)}", **fields})
+
+    async def run(self):
+        await self.send("session.created", session={"id": f"sess_{next(_ids)}"})
+        try:
+            while True:
+                event = await self.websocket.receive_json()
+                realtime_events[event["type"]] += 1
+                await self.handle(event)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            if self.response is not None:
+                self.response.cancel()
+
+    async def handle(self, event: dict):
+        kind = event["type"]
+        if kind == "session.update":
+            turn_detection = event["session"].get("turn_detection") or {}
+            self.silence_ms = turn_detection.get("silence_duration_ms", self.silence_ms)
+            await self.send("session.updated", session=event["session"])
+        elif kind == "input_audio_buffer.append":
+            self.pcm.extend(ulaw_decode(base64.b64decode(event["audio"])).tobytes())
+            while len(self.pcm) >= REALTIME_FRAME_BYTES:
+                frame = bytes(self.pcm[:REALTIME_FRAME_BYTES])
+                del self.pcm[:REALTIME_FRAME_BYTES]
+                await self.vad_frame(self.vad.is_speech(frame, 8000))
+        elif kind == "conversation.item.create":
+            await self.send("conversation.item.created", item=event["item"])
+        elif kind == "conversation.item.truncate":
+            await self.send("conversation.item.truncated", item_id=event["item_id"],
+                            content_index=event["content_index"], audio_end_ms=event["audio_end_ms"])
+        elif kind == "response.cancel" and self.response is not None:
+            self.response.cancel()
+
+    async def vad_frame(self, speech: bool):
+        if speech:
+            self.silence = 0
+            if not self.speaking:
+                self.speaking = True
+                await self.send("input_audio_buffer.speech_started")
+                if self.response is not None and not self.response.done():
+                    self.response.cancel()  # interrupt_response
+            return
+        if not self.speaking:
+            return
+        self.silence += 20
+        if self.silence >= self.silence_ms:
+            self.speaking = False
+            item_id = f"item_{next(_ids)}"
+            await self.send("input_audio_buffer.speech_stopped")
+            await self.send("input_audio_buffer.committed", item_id=item_id)
+            await self.send("conversation.item.input_audio_transcription.completed",
+                            item_id=item_id, content_index=0, transcript=TRASCRIZIONE)
+            self.response = asyncio.create_task(self.respond())
+
+    async def respond(self):
+        response_id, item_id = f"resp_{next(_ids)}", f"item_{next(_ids)}"
+        await self.send("response.created", response={"id": response_id, "status": "in_progress"})
+        status = "completed"
+        try:
+            await asyncio.sleep(latency.llm_first_token_ms / 1000)
+            audio = realtime_audio()
+            pausa = 0.1 / latency.tts_realtime_factor
+            for i in range(0, len(audio), REALTIME_CHUNK_BYTES):
+                await self.send("response.audio.delta", response_id=response_id, item_id=item_id,
+                                output_index=0, content_index=0,
+                                delta=base64.b64encode(audio[i:i + REALTIME_CHUNK_BYTES]).decode())
+                await asyncio.sleep(pausa)
+            await self.send("response.audio.done", response_id=response_id, item_id=item_id)
+            await self.send("response.audio_transcript.done", response_id=response_id, item_id=item_id,
+                            transcript=RISPOSTA)
+        except asyncio.CancelledError:
+            status = "cancelled"
+        await self.send("response.done", response={"id": response_id, "status": status})
+
+
+@app.websocket("/v1/realtime")
+async def realtime(websocket: WebSocket):
+    await websocket.accept()
+    await RealtimeStandin(websocket).run()
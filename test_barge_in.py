@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Test per verificare il barge-in: il chiamante che parla sopra l'assistente ferma audio e generazione
+"""
+import asyncio
+import logging
+import time
+
+from call.session import CallSession
+from call.pipeline import CallPipeline
+from test_pipeline import genera_frame
+from testutils import FakeWebSocket
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def invia(pipeline: CallPipeline, parlato: bool, quanti: int):
+    """Invia frame da 20ms alla pipeline e lascia lavorare il VAD"""
+    for i in range(quanti):
+        pipeline.push_frame(genera_frame(parlato, i))
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.05)
+
+
+def crea_pipeline(on_turn):
+    websocket = FakeWebSocket()
+    session = CallSession(websocket=websocket, numero_chiamato="+39021111111")
+    session.start("MZ-barge-in")
+    pipeline = CallPipeline(session, on_turn)
+    return session, pipeline, websocket
+
+
+def test_marker_di_riproduzione():
+    """L'audio resta in riproduzione fino al marker di Twilio o alla fine stimata"""
+    session = CallSession(websocket=None, numero_chiamato="+39021111111")
+    assert not session.is_playing()
+
+    nome = session.audio_queued(100, time.perf_counter())  # 2 secondi di audio
+    assert session.is_playing() and nome in session.pending_marks
+    session.audio_played(nome)
+    assert not session.is_playing()
+
+    # Senza marker di ritorno vale la stima: l'audio già terminato non è più in riproduzione
+    session.audio_queued(10, time.perf_counter() - 1)
+    assert not session.is_playing()
+    print("✅ Stato di riproduzione seguito con marker e stima")
+
+
+def test_interruzione_durante_la_risposta():
+    """Il parlato del chiamante annulla il turno in corso e svuota l'audio di Twilio"""
+    stati = []
+
+    async def ai_lenta(session, audio):
+        try:
+            await session.websocket.send_json({"event": "media", "streamSid": session.stream_sid})
+            await asyncio.sleep(5)
+            stati.append("completato")
+        except asyncio.CancelledError:
+            stati.append("annullato")
+            raise
+
+    async def main():
+        session, pipeline, websocket = crea_pipeline(ai_lenta)
+        pipeline.start()
+        await invia(pipeline, True, 50)
+        await invia(pipeline, False, 60)
+        assert pipeline.assistant_busy(), "Il turno AI non è partito"
+
+        inizio = time.perf_counter()
+        await invia(pipeline, True, 20)
+        reazione = time.perf_counter() - inizio
+        await pipeline.stop()
+        return session, pipeline, websocket, reazione
+
+    session, pipeline, websocket, reazione = asyncio.run(main())
+    assert stati == ["annullato"]
+    assert pipeline.barge_ins == 1 and pipeline.turns_processed == 0
+    clear = websocket.eventi("clear")
+    assert clear == [{"event": "clear", "streamSid": "MZ-barge-in"}]
+    # Il 'clear' segue l'ultimo audio inviato dal turno annullato
+    assert websocket.messaggi[-1]["event"] == "clear"
+    print(f"✅ Turno annullato e audio scartato in {reazione * 1000:.0f}ms")
+
+
+def test_annullamento_lento_non_blocca_i_frame():
+    """Il 'clear' parte subito anche se il turno annullato impiega tempo a chiudersi"""
+    async def ai_lenta_a_chiudere(session, audio):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            await asyncio.sleep(1)  # es. chiusura di uno stream del provider
+            raise
+
+    async def main():
+        session, pipeline, websocket = crea_pipeline(ai_lenta_a_chiudere)
+        pipeline.start()
+        await invia(pipeline, True, 50)
+        await invia(pipeline, False, 60)
+        assert pipeline.assistant_busy(), "Il turno AI non è partito"
+
+        await invia(pipeline, True, 20)
+        # Il turno è ancora in chiusura, ma 'clear' è inviato e i frame sono stati letti
+        assert pipeline.assistant_busy() and websocket.eventi("clear")
+        assert pipeline.frames.qsize() == 0
+        await pipeline.stop()
+        return pipeline
+
+    pipeline = asyncio.run(main())
+    assert pipeline.barge_ins == 1
+    print("✅ 'clear' inviato senza attendere la chiusura del turno annullato")
+
+
+def test_interruzione_durante_la_riproduzione():
+    """Anche a generazione conclusa l'audio ancora in coda su Twilio viene scartato"""
+    async def ai(session, audio):
+        pass
+
+    async def main():
+        session, pipeline, websocket = crea_pipeline(ai)
+        pipeline.start()
+        session.audio_queued(250, time.perf_counter())  # 5 secondi di saluto in riproduzione
+        await invia(pipeline, True, 20)
+        await pipeline.stop()
+        return session, pipeline, websocket
+
+    session, pipeline, websocket = asyncio.run(main())
+    assert pipeline.barge_ins == 1 and len(websocket.eventi("clear")) == 1
+    assert not session.is_playing() and not session.pending_marks
+    print("✅ Audio in riproduzione scartato")
+
+
+def test_nessuna_interruzione_ad_assistente_inattivo():
+    """Il parlato normale e i rumori brevi non generano 'clear'"""
+    turni = []
+
+    async def ai(session, audio):
+        turni.append(len(audio))
+
+    async def main():
+        session, pipeline, websocket = crea_pipeline(ai)
+        pipeline.start()
+        # Rumore breve (60ms) mentre l'assistente parla: sotto la soglia del barge-in
+        session.audio_queued(250, time.perf_counter())
+        await invia(pipeline, True, 3)
+        await invia(pipeline, False, 10)
+        session.clear_playback()
+        # Frase normale ad assistente in silenzio
+        await invia(pipeline, True, 50)
+        await invia(pipeline, False, 60)
+        await pipeline.stop()
+        return pipeline, websocket
+
+    pipeline, websocket = asyncio.run(main())
+    assert turni and pipeline.barge_ins == 0
+    assert websocket.eventi("clear") == []
+    print("✅ Nessun barge-in senza parlato sopra l'assistente")
+
+
+if __name__ == "__main__":
+    print("🧪 Test barge-in")
+    print("=" * 50)
+    test_marker_di_riproduzione()
+    test_interruzione_durante_la_risposta()
+    test_annullamento_lento_non_blocca_i_frame()
+    test_interruzione_durante_la_riproduzione()
+    test_nessuna_interruzione_ad_assistente_inattivo()
+    print("\n🎉 Tutti i test sono passati!")
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Test per verificare la pianificazione delle partizioni mensili del log chiamate
+"""
+import logging
+from datetime import date
+
+from database.call_log_partitions import (
+    add_months, create_partition_sql, partition_month, partition_name, plan_partitions,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def test_aritmetica_dei_mesi():
+    """I mesi attraversano correttamente il cambio d'anno"""
+    assert add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+    assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+    assert partition_name(date(2024, 3, 1)) == "chiamate_log_2024_03"
+    assert partition_month("chiamate_log_2024_03") == date(2024, 3, 1)
+    assert partition_month("chiamate_log_default") is None
+    print("✅ Aritmetica dei mesi e nomi delle partizioni")
+
+
+def test_creazione_mesi_futuri():
+    """Si creano il mese corrente e i successivi mancanti"""
+    esistenti = ["chiamate_log_default", "chiamate_log_2024_12", "chiamate_log_2025_01"]
+    da_creare, da_eliminare = plan_partitions(date(2024, 12, 18), esistenti, months_ahead=3, retention_months=0)
+    assert da_creare == [date(2025, 2, 1), date(2025, 3, 1)]
+    assert da_eliminare == []
+    sql = create_partition_sql(date(2024, 12, 1))
+    assert "FROM ('2024-12-01 00:00:00+00') TO ('2025-01-01 00:00:00+00')" in sql
+    print(f"✅ Partizioni da creare: {[partition_name(m) for m in da_creare]}")
+
+
+def test_retention():
+    """Le partizioni più vecchie della retention vengono eliminate, la default mai"""
+    esistenti = ["chiamate_log_default"] + [partition_name(add_months(date(2024, 1, 1), i)) for i in range(12)]
+    _, da_eliminare = plan_partitions(date(2024, 12, 5), esistenti, months_ahead=0, retention_months=6)
+    # Dicembre più 6 mesi completi: si conserva da giugno in poi
+    assert da_eliminare == [f"chiamate_log_2024_{m:02d}" for m in range(1, 6)]
+    _, nessuna = plan_partitions(date(2024, 12, 5), esistenti, months_ahead=0, retention_months=0)
+    assert nessuna == []
+    print(f"✅ Retention: {len(da_eliminare)} partizioni eliminate")
+
+
+if __name__ == "__main__":
+    print("🧪 Test partizioni del log chiamate")
+    print("=" * 50)
+    test_aritmetica_dei_mesi()
+    test_creazione_mesi_futuri()
+    test_retention()
+    print("\n🎉 Tutti i test sono passati!")
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Test per verificare la scrittura a blocchi del log chiamate
+"""
+import asyncio
+import logging
+import time
+
+import asyncpg
+
+from database.call_log_writer import CallLogWriter, INSERT_CALLS_SQL, UPDATE_CALL_END_SQL
+from database.statements import STATEMENTS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def transaction(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def executemany(self, sql, args):
+        await asyncio.sleep(self.pool.delay)
+        if self.pool.failures:
+            self.pool.failures -= 1
+            raise ConnectionError("database non raggiungibile")
+        if self.pool.rejected is not None and any(self.pool.rejected in row for row in args):
+            raise asyncpg.DataError("valore non valido")
+        self.pool.calls.append((sql, list(args)))
+
+
+class FakePool:
+    """Pool asyncpg finto che registra le executemany"""
+
+    def __init__(self, delay: float = 0, failures: int = 0, rejected: str = None):
+        self.delay = delay
+        self.failures = failures
+        self.rejected = rejected  # stream_sid con dati rifiutati dal database
+        self.calls = []
+
+    def acquire(self):
+        return FakeConnection(self)
+
+
+class FakeDB:
+    """Stessa interfaccia di DatabaseManager usata dallo scrittore (acquire e run)"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def acquire(self):
+        return self.pool.acquire()
+
+    async def run(self, connection, name, method, rows):
+        assert method == "executemany"
+        await connection.executemany(STATEMENTS[name], rows)
+
+
+def righe(pool, sql):
+    return [row for call_sql, rows in pool.calls if call_sql == sql for row in rows]
+
+
+def test_inizio_e_fine_uniti_in_un_insert():
+    """Inizio e fine della stessa chiamata ancora in coda diventano un solo INSERT"""
+    async def main():
+        pool = FakePool()
+        writer = CallLogWriter(FakeDB(pool), flush_interval=60)
+        writer.log_start(1, "MZ-1", "CA-1", "+39021111111")
+        writer.log_end("MZ-1", 42, "completed")
+        writer.log_start(1, "MZ-2", "CA-2", "+39021111111")
+        await writer.flush()
+        writer.log_end("MZ-2", 10, "disconnected")
+        await writer.flush()
+        return pool
+
+    pool = asyncio.run(main())
+    inserts = righe(pool, INSERT_CALLS_SQL)
+    assert len(inserts) == 2
+    assert inserts[0][1] == "MZ-1" and inserts[0][5] == 42 and inserts[0][7] == "completed"
+    assert inserts[1][1] == "MZ-2" and inserts[1][6] is None
+    updates = righe(pool, UPDATE_CALL_END_SQL)
+    assert len(updates) == 1 and updates[0][0] == "MZ-2" and updates[0][3] == "disconnected"
+    print("✅ Un INSERT per chiamata conclusa, UPDATE solo per quelle già scritte")
+
+
+def test_scrittura_per_soglia_e_per_intervallo():
+    """Si scrive appena si raggiunge batch_size, altrimenti allo scadere dell'intervallo"""
+    async def main():
+        pool = FakePool()
+        writer = CallLogWriter(FakeDB(pool), batch_size=10, flush_interval=0.2)
+        writer.start()
+        for i in range(25):
+            writer.log_start(1, f"MZ-{i}", "CA", "+39021111111")
+        await asyncio.sleep(0.05)
+        scritti_subito = writer.written
+        await asyncio.sleep(0.3)
+        await writer.close()
+        return pool, scritti_subito, writer
+
+    pool, scritti_subito, writer = asyncio.run(main())
+    assert scritti_subito >= 20
+    assert writer.written == 25 and all(len(rows) <= 10 for _, rows in pool.calls)
+    print(f"✅ {scritti_subito} eventi scritti subito per soglia, il resto allo scadere dell'intervallo")
+
+
+def test_coda_limitata():
+    """A coda piena gli eventi nuovi vengono scartati senza attendere"""
+    writer = CallLogWriter(FakeDB(FakePool()), max_queue=3)
+    accettati = [writer.log_start(1, f"MZ-{i}", "CA", "+39") for i in range(5)]
+    assert accettati == [True, True, True, False, False]
+    assert writer.log_end("MZ-0", 5) is True  # la fine di una chiamata in coda non occupa posto
+    assert writer.stats()['dropped'] == 2
+    print("✅ Coda limitata, eventi in eccesso scartati")
+
+
+def test_nessuna_attesa_durante_scrittura_lenta():
+    """Mentre il database è lento, registrare una chiamata resta immediato"""
+    async def main():
+        pool = FakePool(delay=0.3)
+        writer = CallLogWriter(FakeDB(pool), flush_interval=0.01)
+        writer.start()
+        writer.log_start(1, "MZ-lento", "CA", "+39")
+        await asyncio.sleep(0.05)  # scrittura in corso
+        inizio = time.perf_counter()
+        writer.log_end("MZ-lento", 3)
+        writer.log_start(1, "MZ-nuovo", "CA", "+39")
+        durata = time.perf_counter() - inizio
+        await writer.close()
+        return pool, durata
+
+    pool, durata = asyncio.run(main())
+    assert durata < 0.005
+    assert len(righe(pool, INSERT_CALLS_SQL)) == 2 and len(righe(pool, UPDATE_CALL_END_SQL)) == 1
+    print(f"✅ Registrazione in {durata * 1e6:.0f}µs durante una scrittura da 300ms")
+
+
+def test_errore_e_nuovo_tentativo():
+    """Un blocco non scritto torna in coda e si unisce agli eventi arrivati nel frattempo"""
+    async def main():
+        pool = FakePool(failures=1)
+        writer = CallLogWriter(FakeDB(pool), flush_interval=0.01)
+        writer.log_start(1, "MZ-1", "CA", "+39")
+        try:
+            await writer.flush()
+        except ConnectionError:
+            pass
+        writer.log_end("MZ-1", 7, "completed")
+        await writer.flush()
+        return pool, writer
+
+    pool, writer = asyncio.run(main())
+    inserts = righe(pool, INSERT_CALLS_SQL)
+    assert len(inserts) == 1 and inserts[0][5] == 7
+    assert writer.failed_flushes == 1 and writer.pending() == 0
+    print("✅ Nuovo tentativo dopo un errore, senza perdere la fine chiamata")
+
+
+def test_evento_non_valido_scartato_da_solo():
+    """Un evento con dati non validi viene scartato senza perdere gli altri del blocco"""
+    async def main():
+        pool = FakePool(rejected="MZ-2")
+        writer = CallLogWriter(FakeDB(pool), flush_interval=60)
+        for i in range(1, 5):
+            writer.log_start(1, f"MZ-{i}", "CA", "+39")
+        await writer.flush()
+        return pool, writer
+
+    pool, writer = asyncio.run(main())
+    assert [row[1] for row in righe(pool, INSERT_CALLS_SQL)] == ["MZ-1", "MZ-3", "MZ-4"]
+    stats = writer.stats()
+    assert stats['written'] == 3 and stats['rejected'] == 1 and stats['pending'] == 0
+    assert stats['failed_flushes'] == 0
+    print("✅ Evento non valido scartato, il resto del blocco scritto")
+
+
+def test_svuotamento_alla_chiusura():
+    """close() scrive tutto ciò che è ancora in coda"""
+    async def main():
+        pool = FakePool()
+        writer = CallLogWriter(FakeDB(pool), flush_interval=60)
+        writer.start()
+        for i in range(5):
+            writer.log_start(1, f"MZ-{i}", "CA", "+39")
+        await writer.close()
+        return pool, writer
+
+    pool, writer = asyncio.run(main())
+    assert len(righe(pool, INSERT_CALLS_SQL)) == 5 and writer.pending() == 0
+    print("✅ Coda svuotata alla chiusura")
+
+
+if __name__ == "__main__":
+    print("🧪 Test log chiamate a blocchi")
+    print("=" * 50)
+    test_inizio_e_fine_uniti_in_un_insert()
+    test_scrittura_per_soglia_e_per_intervallo()
+    test_coda_limitata()
+    test_nessuna_attesa_durante_scrittura_lenta()
+    test_errore_e_nuovo_tentativo()
+    test_evento_non_valido_scartato_da_solo()
+    test_svuotamento_alla_chiusura()
+    print("\n🎉 Tutti i test sono passati!")
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Test per verificare che il lavoro AI di una chiamata venga annullato quando il chiamante riattacca
+"""
+import asyncio
+import base64
+import logging
+import time
+
+from fastapi.testclient import TestClient
+
+from ai.local_provider import LocalLatency, create_local_providers
+from call.tasks import CallTaskGroup
+from test_pipeline import genera_frame
+from testutils import main_isolato
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MARIO = {"id": 1, "nome_ristorante": "Trattoria da Mario", "numero_twilio": "+39021111111",
+         "system_prompt": "Sei l'assistente della Trattoria da Mario."}
+
+
+def test_gruppo_annulla_i_task():
+    """cancel() annulla i task in corso e impedisce di avviarne altri"""
+    async def main():
+        gruppo = CallTaskGroup("test")
+        finiti = []
+
+        async def lavoro(secondi):
+            await asyncio.sleep(secondi)
+            finiti.append(secondi)
+
+        gruppo.spawn(lavoro(0))
+        gruppo.spawn(lavoro(10))
+        gruppo.spawn(lavoro(10))
+        servizio = gruppo.spawn(lavoro(10), long_lived=True)  # es. il loop del VAD
+        await asyncio.sleep(0.01)
+        assert len(gruppo) == 3
+
+        annullati = await gruppo.cancel()
+        try:
+            gruppo.spawn(lavoro(0))
+            raise AssertionError("Task avviato dopo la chiusura")
+        except RuntimeError:
+            pass
+        assert servizio.cancelled()
+        return gruppo, annullati, finiti
+
+    gruppo, annullati, finiti = asyncio.run(main())
+    # Anche il task long_lived viene fermato, ma non conta come lavoro interrotto
+    assert annullati == 2 and gruppo.cancelled == 2 and gruppo.abandoned == 0
+    assert finiti == [0] and len(gruppo) == 0
+    print("✅ Task della chiamata annullati insieme")
+
+
+def test_timeout_di_chiusura():
+    """Un task che non si ferma non blocca la chiusura oltre il timeout"""
+    async def ostinato():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            await asyncio.sleep(1)  # es. una chiusura di connessione lenta
+
+    async def main():
+        gruppo = CallTaskGroup("test")
+        task = gruppo.spawn(ostinato())
+        await asyncio.sleep(0.01)
+        inizio = time.perf_counter()
+        await gruppo.cancel(timeout=0.1)
+        durata = time.perf_counter() - inizio
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return gruppo, durata
+
+    gruppo, durata = asyncio.run(main())
+    assert gruppo.abandoned == 1 and durata < 0.5
+    print(f"✅ Chiusura limitata dal timeout ({durata * 1000:.0f}ms)")
+
+
+def test_riaggancio_annulla_il_turno():
+    """Se il chiamante riattacca mentre l'LLM sta rispondendo, la richiesta viene annullata subito"""
+    import main
+
+    main.providers = create_local_providers(LocalLatency(stt_ms=20, llm_first_token_ms=5000))
+    main.greetings = None
+    main.db_manager.tenant_cache.set(MARIO["numero_twilio"], MARIO)
+    prima = main.session_registry.stats()
+
+    client = TestClient(main.app)
+    with client.websocket_connect("/ws/%2B39021111111") as websocket:
+        websocket.send_json({"event": "start", "streamSid": "MZ-riaggancio", "start": {"callSid": "CA-1"}})
+        frames = [genera_frame(True, i) for i in range(50)] + [genera_frame(False, i) for i in range(60)]
+        for i, frame in enumerate(frames):
+            websocket.send_json({"event": "media", "streamSid": "MZ-riaggancio",
+                                 "media": {"payload": base64.b64encode(frame).decode()}})
+            if i % 10 == 9:
+                time.sleep(0.02)
+        time.sleep(0.3)  # trascrizione conclusa, LLM in attesa del primo token
+        inizio = time.perf_counter()
+    chiusura = time.perf_counter() - inizio
+
+    dopo = main.session_registry.stats()
+    annullate = main.metrics.ai_requests_cancelled.values[(MARIO["numero_twilio"], "completion")]
+    assert annullate == 1, f"Richieste LLM annullate: {annullate}"
+    # Solo il turno AI: VAD e worker dei turni durano quanto la chiamata e non sono contati
+    assert dopo['tasks_cancelled'] - prima['tasks_cancelled'] == 1
+    assert dopo['active_calls'] == 0
+    assert chiusura < 1, f"Chiusura in {chiusura:.2f}s"
+    print(f"✅ Richiesta LLM annullata al riaggancio, chiamata chiusa in {chiusura * 1000:.0f}ms")
+
+
+def test_riaggancio_annulla_la_trascrizione_speculativa():
+    """Una trascrizione speculativa ancora in corso al riaggancio è contata tra le richieste annullate"""
+    with main_isolato(providers=create_local_providers(LocalLatency(stt_ms=5000))) as main:
+        main.db_manager.tenant_cache.set(MARIO["numero_twilio"], MARIO)
+        chiave = (MARIO["numero_twilio"], "transcription")
+        prima = main.metrics.ai_requests_cancelled.values.get(chiave, 0)
+        task_prima = main.session_registry.stats()['tasks_cancelled']
+
+        client = TestClient(main.app)
+        with client.websocket_connect("/ws/%2B39021111111") as websocket:
+            websocket.send_json({"event": "start", "streamSid": "MZ-speculativa", "start": {"callSid": "CA-2"}})
+            # Pausa oltre la soglia speculativa ma sotto la fine del turno: trascrizione avviata
+            frames = [genera_frame(True, i) for i in range(50)] + [genera_frame(False, i) for i in range(20)]
+            for i, frame in enumerate(frames):
+                websocket.send_json({"event": "media", "streamSid": "MZ-speculativa",
+                                     "media": {"payload": base64.b64encode(frame).decode()}})
+                if i % 10 == 9:
+                    time.sleep(0.02)
+            time.sleep(0.2)
+
+        annullate = main.metrics.ai_requests_cancelled.values.get(chiave, 0) - prima
+        task_annullati = main.session_registry.stats()['tasks_cancelled'] - task_prima
+    assert annullate == 1, f"Trascrizioni annullate: {annullate}"
+    assert task_annullati == 1, f"Task annullati: {task_annullati}"
+    print("✅ Trascrizione speculativa annullata al riaggancio e contata")
+
+
+if __name__ == "__main__":
+    print("🧪 Test annullamento del lavoro delle chiamate")
+    print("=" * 50)
+    test_gruppo_annulla_i_task()
+    test_timeout_di_chiusura()
+    test_riaggancio_annulla_il_turno()
+    test_riaggancio_annulla_la_trascrizione_speculativa()
+    print("\n🎉 Tutti i test sono passati!")
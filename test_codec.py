@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test per verificare il codec µ-law e il framing dell'audio in ingresso
+"""
+import logging
+import os
+
+import numpy as np
+
+from audio.codec import PolyphaseResampler, ulaw_decode, ulaw_encode
+from audio.framing import VadFramer
+
+try:
+    import audioop  # Rimosso in Python 3.13: usato solo come riferimento
+except ImportError:
+    audioop = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def livello_db(pcm: np.ndarray) -> float:
+    return 20 * np.log10(np.sqrt(np.mean(pcm.astype(np.float64) ** 2)) + 1e-9)
+
+
+def tono_24k(frequenza: float, secondi: float = 1.0) -> np.ndarray:
+    t = np.arange(int(24000 * secondi)) / 24000
+    return (10000 * np.sin(2 * np.pi * frequenza * t)).astype(np.int16)
+
+
+def test_decodifica_ulaw_identica_ad_audioop():
+    """La tabella µ-law produce esattamente gli stessi campioni di audioop.ulaw2lin"""
+    if audioop is None:
+        print("⚠️  audioop non disponibile, confronto saltato")
+        return
+    tutti_i_codici = bytes(range(256))
+    assert ulaw_decode(tutti_i_codici).tobytes() == audioop.ulaw2lin(tutti_i_codici, 2)
+    print("✅ Decodifica µ-law identica ad audioop")
+
+
+def test_codifica_ulaw_identica_ad_audioop():
+    """La tabella di codifica produce gli stessi byte di audioop.lin2ulaw per tutti i 65536 campioni"""
+    if audioop is None:
+        print("⚠️  audioop non disponibile, confronto saltato")
+        return
+    tutti_i_campioni = np.arange(65536, dtype=np.uint16).view(np.int16)
+    assert ulaw_encode(tutti_i_campioni) == audioop.lin2ulaw(tutti_i_campioni.tobytes(), 2)
+    print("✅ Codifica µ-law identica ad audioop")
+
+
+def test_codifica_e_decodifica_reversibili():
+    """Decodificare e ricodificare ogni codice µ-law restituisce lo stesso codice"""
+    tutti_i_codici = bytes(range(256))
+    ricodificati = ulaw_encode(ulaw_decode(tutti_i_codici))
+    # 0x7F e 0xFF rappresentano entrambi lo zero
+    assert ricodificati.replace(b"\x7f", b"\xff") == tutti_i_codici.replace(b"\x7f", b"\xff")
+    print("✅ Codifica e decodifica reversibili")
+
+
+def test_ricampionatore_a_blocchi_uguale_al_segnale_intero():
+    """Lo stato tra i blocchi rende il risultato indipendente dalla dimensione dei blocchi"""
+    segnale = (np.random.default_rng(1).standard_normal(24000) * 5000).astype(np.int16)
+    intero = PolyphaseResampler().process(segnale)
+
+    a_blocchi = PolyphaseResampler()
+    parti = [a_blocchi.process(segnale[i:i + 1001]) for i in range(0, len(segnale), 1001)]
+    assert len(intero) == 8000
+    assert np.array_equal(intero, np.concatenate(parti))
+    print("✅ Ricampionamento a blocchi identico")
+
+
+def test_ricampionatore_filtra_aliasing():
+    """La banda vocale passa intatta, le frequenze sopra i 4kHz non rientrano come aliasing"""
+    passa = PolyphaseResampler().process(tono_24k(1000))[200:]
+    alias = PolyphaseResampler().process(tono_24k(5500))[200:]
+    guadagno = livello_db(passa) - livello_db(tono_24k(1000))
+    reiezione = livello_db(tono_24k(5500)) - livello_db(alias)
+    assert abs(guadagno) < 0.5, f"Guadagno in banda {guadagno:.2f} dB"
+    assert reiezione > 50, f"Reiezione aliasing solo {reiezione:.1f} dB"
+    print(f"✅ Banda passante {guadagno:+.2f} dB, aliasing a 5.5kHz -{reiezione:.0f} dB")
+
+
+def test_framer_consegna_frame_contigui():
+    """I frame VAD coprono l'audio senza buchi né sovrapposizioni, anche dopo i compattamenti"""
+    framer = VadFramer(frame_bytes=480, capacity_samples=800)
+    chunk_ulaw = [os.urandom(160) for _ in range(100)]
+    pcm_atteso = ulaw_decode(b"".join(chunk_ulaw)).tobytes()
+
+    pcm_restituito = bytearray()
+    frames = bytearray()
+    for chunk in chunk_ulaw:
+        pcm_restituito.extend(framer.push(chunk))
+        for frame in framer.frames():
+            assert isinstance(frame, memoryview) and len(frame) == 480
+            frames.extend(frame)
+
+    assert bytes(pcm_restituito) == pcm_atteso
+    assert bytes(frames) == pcm_atteso[:len(frames)]
+    assert len(frames) + framer.pending_samples() * 2 == len(pcm_atteso)
+    print(f"✅ {len(frames) // 480} frame VAD contigui")
+
+
+def test_framer_chunk_piu_grandi_della_capacita():
+    """Un chunk più grande del buffer forza una riallocazione senza perdere campioni"""
+    framer = VadFramer(frame_bytes=480, capacity_samples=480)
+    grande = os.urandom(2000)
+    assert bytes(framer.push(grande)) == ulaw_decode(grande).tobytes()
+    assert sum(1 for _ in framer.frames()) == 2000 // 240
+    print("✅ Riallocazione corretta")
+
+
+if __name__ == "__main__":
+    test_decodifica_ulaw_identica_ad_audioop()
+    test_codifica_ulaw_identica_ad_audioop()
+    test_codifica_e_decodifica_reversibili()
+    test_ricampionatore_a_blocchi_uguale_al_segnale_intero()
+    test_ricampionatore_filtra_aliasing()
+    test_framer_consegna_frame_contigui()
+    test_framer_chunk_piu_grandi_della_capacita()
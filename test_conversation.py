@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test per verificare la memoria della conversazione entro il budget di token
+"""
+import logging
+
+from ai.conversation import ConversationMemory, SUMMARY_PREFIX, estimate_tokens
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = "Sei l'assistente virtuale della Pizzeria Da Mario. Rispondi in modo cortese e conciso."
+
+
+def token_messaggi(messages) -> int:
+    return sum(estimate_tokens(m["content"]) for m in messages)
+
+
+def test_cronologia_inviata_all_llm():
+    """La frase precedente del cliente e la risposta restano nel contesto"""
+    memoria = ConversationMemory(token_budget=1000)
+    memoria.add_turn("Vorrei prenotare per quattro persone.", "Certo, per che giorno?")
+    messages = memoria.build_messages(SYSTEM_PROMPT, "Per sabato sera.")
+
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "user"]
+    assert messages[1]["content"] == "Vorrei prenotare per quattro persone."
+    assert messages[-1]["content"] == "Per sabato sera."
+    print("✅ Turni precedenti inclusi nella richiesta")
+
+
+def test_budget_rispettato_su_chiamata_lunga():
+    """Con molti turni la richiesta resta entro il budget e la sua dimensione smette di crescere"""
+    memoria = ConversationMemory(token_budget=400, summary_tokens=80)
+    dimensioni = []
+    for i in range(60):
+        messages = memoria.build_messages(SYSTEM_PROMPT, f"Frase numero {i} del cliente, con qualche dettaglio in più.")
+        dimensioni.append(token_messaggi(messages))
+        memoria.add_turn(messages[-1]["content"], f"Risposta numero {i} dell'assistente, abbastanza lunga da pesare.")
+
+    assert max(dimensioni) <= 400
+    assert max(dimensioni[30:]) - min(dimensioni[30:]) < 40
+    assert estimate_tokens(memoria.summary()) <= 80
+    print(f"✅ Budget rispettato: richiesta stabile a ~{dimensioni[-1]} token dopo 60 turni")
+
+
+def test_ordine_di_compattazione_prevedibile():
+    """Escono per primi i turni più vecchi; il riassunto conserva le frasi del cliente più recenti"""
+    memoria = ConversationMemory(token_budget=150, summary_tokens=40)
+    for i in range(10):
+        memoria.add_turn(f"cliente {i} " + "x" * 40, f"assistente {i} " + "y" * 40)
+    messages = memoria.build_messages(SYSTEM_PROMPT, "Ultima domanda")
+
+    rimasti = [user for user, _ in memoria.turns()]
+    assert rimasti == [f"cliente {i} " + "x" * 40 for i in range(10 - len(rimasti), 10)]
+    riassunto = [m["content"] for m in messages if m["content"].startswith(SUMMARY_PREFIX)]
+    assert riassunto and f"cliente {9 - len(rimasti)}" in riassunto[0]
+    assert "cliente 0 " not in riassunto[0]
+    assert token_messaggi(messages) <= 150
+    print(f"✅ Compattazione dal turno più vecchio ({memoria.compacted_turns} turni nel riassunto)")
+
+
+def test_prompt_piu_grande_del_budget():
+    """Se il solo prompt supera il budget si inviano prompt e frase corrente, senza cronologia"""
+    memoria = ConversationMemory(token_budget=10)
+    memoria.add_turn("Ciao", "Buonasera!")
+    messages = memoria.build_messages(SYSTEM_PROMPT, "Siete aperti?")
+    assert [m["role"] for m in messages] == ["system", "user"]
+    print("✅ Nessuna cronologia quando il budget è esaurito")
+
+
+if __name__ == "__main__":
+    print("🧪 Test memoria della conversazione")
+    print("=" * 50)
+    test_cronologia_inviata_all_llm()
+    test_budget_rispettato_su_chiamata_lunga()
+    test_ordine_di_compattazione_prevedibile()
+    test_prompt_piu_grande_del_budget()
+    print("\n🎉 Tutti i test sono passati!")
@@ -82,6 +82,11 @@ async def test_database():
             # Aggiorna la chiamata
             await db_manager.log_call_end(call_id, 120, 'completed')
             print(f"✅ Chiamata aggiornata con durata: 120 secondi")
+
+            # Le statistiche giornaliere includono subito la chiamata conclusa
+            stats = await db_manager.get_restaurant_stats(ristorante_id, 1)
+            assert stats['totale_chiamate'] >= 1 and stats['per_status'].get('completed', 0) >= 1
+            print(f"✅ Statistiche di oggi: {stats['totale_chiamate']} chiamate, durata media {stats['durata_media']:.0f}s")
         
         print("\n🎉 TEST DATABASE COMPLETATO!")
         print("=" * 50)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Test per verificare il registro delle query preparate e le metriche del database
+"""
+import asyncio
+import logging
+
+import asyncpg
+
+from database.db_manager import DatabaseManager, RESTAURANT_BY_PHONE
+from database.statements import STATEMENTS, prepare_statements, register
+from metrics.registry import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class FakeStatement:
+    def __init__(self, result=None, delay=0.0, error=None):
+        self.result = result
+        self.delay = delay
+        self.error = error
+
+    async def fetchrow(self, *args, timeout=None):
+        await asyncio.wait_for(asyncio.sleep(self.delay), timeout)
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+        return self.result
+
+
+class FakeConnection:
+    """Connessione finta con la stessa interfaccia di PreparedConnection"""
+
+    def __init__(self, statements, fail=()):
+        self.statements = statements
+        self.fail = set(fail)
+        self.prepared = []
+
+    async def statement(self, name):
+        if name in self.fail:
+            raise asyncpg.UndefinedTableError("relation does not exist")
+        self.prepared.append(name)
+        return self.statements.get(name)
+
+    def forget_statement(self, name):
+        self.statements[name] = FakeStatement({'id': 2})
+
+
+def test_registro():
+    """Un nome identifica una sola query"""
+    assert RESTAURANT_BY_PHONE in STATEMENTS
+    assert register(RESTAURANT_BY_PHONE, STATEMENTS[RESTAURANT_BY_PHONE]) == RESTAURANT_BY_PHONE
+    try:
+        register(RESTAURANT_BY_PHONE, "SELECT 1")
+        assert False, "Registrazione duplicata accettata"
+    except ValueError:
+        pass
+    print(f"✅ {len(STATEMENTS)} query registrate")
+
+
+def test_preparazione_tollera_tabelle_mancanti():
+    """Una query che non si può preparare (es. primo avvio) non blocca le altre"""
+    connection = FakeConnection({}, fail={RESTAURANT_BY_PHONE})
+    asyncio.run(prepare_statements(connection))
+    assert RESTAURANT_BY_PHONE not in connection.prepared
+    assert len(connection.prepared) == len(STATEMENTS) - 1
+    print("✅ Query preparate, quella non valida rimandata al primo uso")
+
+
+def test_timeout_e_metriche():
+    """Ogni query ha un timeout; durata ed errori finiscono nelle metriche per query"""
+    db = DatabaseManager()
+    db.query_timeout = 0.05
+    connection = FakeConnection({RESTAURANT_BY_PHONE: FakeStatement({'id': 1}, delay=0.2)})
+    prima = metrics.db_query_seconds.labels(RESTAURANT_BY_PHONE).count
+    try:
+        asyncio.run(db.run(connection, RESTAURANT_BY_PHONE, "fetchrow", "+39021111111"))
+        assert False, "Timeout non applicato"
+    except asyncio.TimeoutError:
+        pass
+    assert metrics.db_query_errors.values[(RESTAURANT_BY_PHONE, "timeout")] >= 1
+    assert metrics.db_query_seconds.labels(RESTAURANT_BY_PHONE).count == prima + 1
+    testo = "\n".join(metrics.render())
+    assert f'receptionist_db_query_seconds_count{{statement="{RESTAURANT_BY_PHONE}"}}' in testo
+    print("✅ Timeout per query e metriche di latenza")
+
+
+def test_ripreparazione_dopo_cambio_schema():
+    """Se il piano salvato non è più valido la query viene ripreparata una volta"""
+    db = DatabaseManager()
+    errore = asyncpg.FeatureNotSupportedError("cached plan must not change result type")
+    connection = FakeConnection({RESTAURANT_BY_PHONE: FakeStatement({'id': 1}, error=errore)})
+    row = asyncio.run(db.run(connection, RESTAURANT_BY_PHONE, "fetchrow", "+39021111111"))
+    assert row == {'id': 2}
+    print("✅ Query ripreparata dopo il cambio di schema")
+
+
+if __name__ == "__main__":
+    print("🧪 Test registro delle query")
+    print("=" * 50)
+    test_registro()
+    test_preparazione_tollera_tabelle_mancanti()
+    test_timeout_e_metriche()
+    test_ripreparazione_dopo_cambio_schema()
+    print("\n🎉 Tutti i test sono passati!")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Test per verificare le risposte rapide a orari e indirizzo senza LLM
+"""
+import asyncio
+import logging
+import time
+
+from ai.faq import FaqMatcher, INTENT_ADDRESS, INTENT_HOURS
+from ai.local_provider import create_local_providers
+from call.session import CallSession
+from metrics.registry import ROUTE_FAQ
+from testutils import FakeWebSocket, main_isolato
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MARIO = {"id": 1, "nome_ristorante": "Trattoria da Mario", "numero_twilio": "+39021111111",
+         "system_prompt": "Sei l'assistente della Trattoria da Mario.",
+         "orari_apertura": "19:00-23:00, chiuso lunedì", "indirizzo": "Via Roma 123, Milano"}
+
+
+def test_riconoscimento_intenti():
+    """Domande su orari e indirizzo riconosciute; tutto il resto va all'LLM"""
+    matcher = FaqMatcher()
+    casi = {
+        "A che ora aprite stasera?": (INTENT_HOURS,),
+        "Siete aperti il lunedì?": (INTENT_HOURS,),
+        "Qual è l'indirizzo?": (INTENT_ADDRESS,),
+        "Dove vi trovate esattamente?": (INTENT_ADDRESS,),
+        "Buonasera, vorrei sapere gli orari di apertura e dove vi trovate.": (INTENT_HOURS, INTENT_ADDRESS),
+        "Vorrei prenotare un tavolo per stasera, a che ora aprite?": None,
+        "Avete piatti senza glutine?": None,
+        "Buongiorno": None,
+        "Mi può passare un operatore?": None,
+    }
+    for frase, atteso in casi.items():
+        risultato = matcher.match(MARIO, frase)
+        assert (risultato.intents if risultato else None) == atteso, frase
+
+    risposta = matcher.match(MARIO, "Dove siete?").answer
+    assert "Via Roma 123, Milano" in risposta
+    print(f"✅ {len(casi)} frasi classificate correttamente")
+
+
+def test_indice_per_ristorante():
+    """Solo gli intenti con dati disponibili; l'indice si aggiorna se i dati cambiano"""
+    matcher = FaqMatcher()
+    senza_indirizzo = dict(MARIO, numero_twilio="+39000000001", indirizzo=None)
+    assert matcher.match(senza_indirizzo, "Dove siete?") is None
+    assert matcher.match(senza_indirizzo, "A che ora aprite?") is not None
+
+    cambiato = dict(MARIO, orari_apertura="12:00-15:00")
+    assert "19:00" in matcher.match(MARIO, "Che orari fate?").answer
+    assert "12:00-15:00" in matcher.match(cambiato, "Che orari fate?").answer
+    print("✅ Indice costruito dai dati del ristorante")
+
+
+def test_riconoscimento_in_microsecondi():
+    """Il riconoscimento costa decine di microsecondi, non millisecondi"""
+    matcher = FaqMatcher()
+    frase = "Buonasera, vorrei sapere gli orari di apertura e dove vi trovate."
+    matcher.match(MARIO, frase)
+    ripetizioni = 5000
+    inizio = time.perf_counter()
+    for _ in range(ripetizioni):
+        matcher.match(MARIO, frase)
+    media_us = (time.perf_counter() - inizio) / ripetizioni * 1e6
+    assert media_us < 500
+    print(f"✅ Riconoscimento in {media_us:.1f}µs")
+
+
+def test_turno_senza_llm():
+    """Una domanda sugli orari viene risolta senza chiamare l'LLM e conteggiata come risposta rapida"""
+    class LLMVietato:
+        async def complete(self, messages):
+            raise AssertionError("LLM chiamato")
+
+        async def stream(self, messages):
+            raise AssertionError("LLM chiamato")
+            yield
+
+    class STTFisso:
+        async def transcribe(self, wav: bytes) -> str:
+            return "A che ora aprite stasera?"
+
+    providers = create_local_providers()
+    providers.stt, providers.llm = STTFisso(), LLMVietato()
+
+    with main_isolato(providers=providers) as main:
+        main.db_manager.tenant_cache.set(MARIO["numero_twilio"], MARIO)
+        # Le metriche sono globali al processo: si confrontano i turni prima e dopo
+        turni = main.metrics.turns_by_route.values
+        prima = dict(turni)
+
+        websocket = FakeWebSocket()
+        session = CallSession(websocket=websocket, numero_chiamato=MARIO["numero_twilio"])
+        session.start("MZ-faq")
+        asyncio.run(main.process_user_speech(session, b"\x00\x00" * 8000))
+
+    *audio, marker = websocket.messaggi
+    assert audio and all(m["event"] == "media" for m in audio)
+    # Il marker finale permette di seguire la riproduzione per il barge-in
+    assert marker["event"] == "mark" and marker["mark"]["name"] in session.pending_marks
+    assert session.conversation.turns()[0][1].startswith("I nostri orari sono: 19:00-23:00")
+    nuovi = {route: turni[route] - prima.get(route, 0) for route in turni if turni[route] != prima.get(route, 0)}
+    assert nuovi == {(MARIO["numero_twilio"], ROUTE_FAQ): 1}, nuovi
+    print(f"✅ Risposta rapida inviata ({len(audio)} frame) senza LLM")
+
+
+if __name__ == "__main__":
+    print("🧪 Test risposte rapide")
+    print("=" * 50)
+    test_riconoscimento_intenti()
+    test_indice_per_ristorante()
+    test_riconoscimento_in_microsecondi()
+    test_turno_senza_llm()
+    print("\n🎉 Tutti i test sono passati!")
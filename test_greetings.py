@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Test per verificare il saluto iniziale pre-sintetizzato per ristorante
+"""
+import asyncio
+import logging
+import time
+
+from fastapi.testclient import TestClient
+
+from config import GREETING_GENERIC
+from ai.local_provider import LocalLatency, LocalTextToSpeech
+from audio.tts_cache import TTSCache
+from call.greetings import GreetingStore, greeting_text
+from testutils import FakeWebSocket
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RISTORANTI = {
+    "+39021111111": {"id": 1, "nome_ristorante": "Trattoria da Mario", "numero_twilio": "+39021111111", "saluto": None},
+    "+39062222222": {"id": 2, "nome_ristorante": "Pizzeria da Gino", "numero_twilio": "+39062222222",
+                     "saluto": "Pizzeria da Gino, ciao! Dimmi pure."},
+}
+
+
+class ContaSintesi(LocalTextToSpeech):
+    """TTS locale lento che conta le sintesi richieste"""
+
+    def __init__(self):
+        super().__init__(LocalLatency(tts_first_byte_ms=300))
+        self.testi = []
+
+    async def synthesize(self, text: str):
+        self.testi.append(text)
+        async for chunk in super().synthesize(text):
+            yield chunk
+
+
+def crea_store(ristoranti=RISTORANTI):
+    async def lookup(numero):
+        return ristoranti.get(numero)
+    tts = ContaSintesi()
+    return GreetingStore(tts, lookup, TTSCache(directory=None)), tts
+
+
+def test_testo_del_saluto():
+    """Saluto da configurazioni, altrimenti dal nome del ristorante, altrimenti generico"""
+    assert greeting_text(RISTORANTI["+39062222222"]) == "Pizzeria da Gino, ciao! Dimmi pure."
+    assert "Trattoria da Mario" in greeting_text(RISTORANTI["+39021111111"])
+    assert greeting_text(None) == GREETING_GENERIC
+    print("✅ Testo del saluto per ristorante")
+
+
+def test_saluto_pronto_inviato_subito():
+    """Dopo il riscaldamento il saluto parte in pochi millisecondi, senza passare dal TTS"""
+    async def main():
+        store, tts = crea_store()
+        await store.warm(RISTORANTI.values())
+        sintesi_riscaldamento = len(tts.testi)
+
+        websocket = FakeWebSocket()
+        inizio = time.perf_counter()
+        frames = await store.play(websocket, "MZ-1", "+39021111111")
+        durata = time.perf_counter() - inizio
+        return store, tts, sintesi_riscaldamento, websocket, frames, durata
+
+    store, tts, sintesi_riscaldamento, websocket, frames, durata = asyncio.run(main())
+    assert sintesi_riscaldamento == 2 and len(tts.testi) == 2
+    assert frames == len(websocket.messaggi) > 0
+    assert durata < 0.1
+    assert store.stats() == {'ready': 2, 'prerendered_plays': 1, 'synthesized_plays': 0}
+    print(f"✅ Saluto di {frames} frame inviato in {durata * 1000:.1f}ms")
+
+
+def test_saluto_rigenerato_quando_il_ristorante_cambia():
+    """Una notifica di modifica rigenera il saluto con i dati nuovi"""
+    ristoranti = {k: dict(v) for k, v in RISTORANTI.items()}
+
+    async def main():
+        store, tts = crea_store(ristoranti)
+        await store.warm(ristoranti.values())
+        ristoranti["+39021111111"]["nome_ristorante"] = "Osteria da Mario"
+        store.on_tenants_changed(["+39021111111"])
+        await asyncio.gather(*store._refresh_tasks)
+        return store, tts
+
+    store, tts = asyncio.run(main())
+    assert "Osteria da Mario" in tts.testi[-1]
+    assert store._texts["+39021111111"] == greeting_text(ristoranti["+39021111111"])
+    assert store.get("+39021111111") is not None
+    print("✅ Saluto rigenerato dopo la modifica del ristorante")
+
+
+def test_numero_sconosciuto_saluto_generico():
+    """Un numero senza ristorante riceve il saluto generico, che non viene fissato in memoria"""
+    async def main():
+        store, tts = crea_store()
+        websocket = FakeWebSocket()
+        frames = await store.play(websocket, "MZ-2", "+39000000000")
+        return store, tts, frames
+
+    store, tts, frames = asyncio.run(main())
+    assert tts.testi == [GREETING_GENERIC] and frames > 0
+    assert store.get("+39000000000") is None and store.synthesized_plays == 1
+    print("✅ Saluto generico per numeri sconosciuti")
+
+
+def test_saluto_all_inizio_dello_stream():
+    """L'evento 'start' di Twilio fa partire subito il saluto già pronto"""
+    import main
+
+    store, tts = crea_store()
+    asyncio.run(store.warm(RISTORANTI.values()))
+    main.greetings = store
+
+    client = TestClient(main.app)
+    with client.websocket_connect("/ws/%2B39062222222") as websocket:
+        websocket.send_json({"event": "connected", "protocol": "Call"})
+        inizio = time.perf_counter()
+        websocket.send_json({"event": "start", "streamSid": "MZ-saluto", "start": {"callSid": "CA-1"}})
+        primo = websocket.receive_json()
+        latenza = time.perf_counter() - inizio
+        websocket.send_json({"event": "stop", "streamSid": "MZ-saluto"})
+
+    assert primo["event"] == "media" and primo["streamSid"] == "MZ-saluto"
+    assert store.prerendered_plays == 1 and len(tts.testi) == 2
+    print(f"✅ Primo audio del saluto ricevuto dopo {latenza * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    print("🧪 Test saluto iniziale")
+    print("=" * 50)
+    test_testo_del_saluto()
+    test_saluto_pronto_inviato_subito()
+    test_saluto_rigenerato_quando_il_ristorante_cambia()
+    test_numero_sconosciuto_saluto_generico()
+    test_saluto_all_inizio_dello_stream()
+    print("\n🎉 Tutti i test sono passati!")
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Test per verificare le metriche di latenza per fase e l'endpoint /metrics
+"""
+import asyncio
+import base64
+import logging
+import time
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from audio.codec import ulaw_encode
+from ai.local_provider import create_local_providers
+from metrics.registry import Histogram, MetricsRegistry, RateMeter, TurnSpans, timed_iter, OTHER_TENANT
+from testutils import main_isolato
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def genera_audio(secondi: float, parlato: bool) -> list:
+    """Frame Twilio da 20ms (160 campioni µ-law): voce sintetica o rumore di fondo"""
+    campioni = int(8000 * secondi)
+    t = np.arange(campioni) / 8000
+    if parlato:
+        segnale = 8000 * (np.sin(2 * np.pi * 220 * t) + 0.5 * np.sin(2 * np.pi * 660 * t))
+        segnale *= 0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)
+    else:
+        segnale = np.random.default_rng(0).integers(-30, 30, campioni)
+    ulaw = ulaw_encode(segnale.astype(np.int16))
+    return [ulaw[i:i + 160] for i in range(0, len(ulaw), 160)]
+
+
+def test_istogramma_cumulativo():
+    """I bucket sono cumulativi e il limite superiore è incluso"""
+    histogram = Histogram([0.1, 0.5, 1.0])
+    for valore in (0.05, 0.1, 0.3, 2.0):
+        histogram.observe(valore)
+    righe = histogram.render("lat", [("tenant", "+39 02")])
+
+    assert 'lat_bucket{tenant="+39 02",le="0.1"} 2' in righe
+    assert 'lat_bucket{tenant="+39 02",le="0.5"} 3' in righe
+    assert 'lat_bucket{tenant="+39 02",le="1.0"} 3' in righe
+    assert 'lat_bucket{tenant="+39 02",le="+Inf"} 4' in righe
+    assert 'lat_count{tenant="+39 02"} 4' in righe
+    print("✅ Istogramma cumulativo in formato Prometheus")
+
+
+def test_fasi_del_turno_e_limite_ristoranti():
+    """Le fasi ripetute si sommano e i ristoranti oltre il limite confluiscono in 'altro'"""
+    async def main():
+        spans = TurnSpans("+39021111111")
+        for _ in range(3):
+            with spans.span("send"):
+                await asyncio.sleep(0.01)
+
+        async def stream():
+            for token in ("a", "b"):
+                await asyncio.sleep(0.02)
+                yield token
+
+        assert [t async for t in timed_iter(stream(), spans, "completion")] == ["a", "b"]
+        spans.mark_first_audio()
+        return spans
+
+    spans = asyncio.run(main())
+    assert spans.durations["send"] >= 0.03 and spans.durations["completion"] >= 0.04
+
+    registry = MetricsRegistry(max_tenants=1)
+    registry.observe_turn(spans)
+    registry.observe_turn(TurnSpans("+39062222222"))
+    testo = "\n".join(registry.render())
+    assert 'receptionist_stage_seconds_count{tenant="+39021111111",stage="send"} 1' in testo
+    assert f'receptionist_turn_seconds_count{{tenant="{OTHER_TENANT}"}} 1' in testo
+    assert 'receptionist_turn_first_audio_seconds_count{tenant="+39021111111"} 1' in testo
+    print("✅ Fasi sommate per turno, etichette dei ristoranti limitate")
+
+
+def test_frame_al_secondo():
+    """Il tasso considera solo i secondi completi della finestra"""
+    meter = RateMeter(window_seconds=2)
+    adesso = int(time.monotonic())
+    meter._buckets.extend([[adesso - 2, 50], [adesso - 1, 50], [adesso, 10]])
+    assert meter.rate() == 50
+    print("✅ Frame al secondo calcolati sulla finestra scorrevole")
+
+
+def test_endpoint_metrics_dopo_una_chiamata():
+    """Dopo un turno completo /metrics espone tutte le fasi per il ristorante chiamato"""
+    # Cache TTS vuota (default di main_isolato): tutte le fasi vengono eseguite
+    with main_isolato(providers=create_local_providers()) as main:
+        client = TestClient(main.app)
+        with client.websocket_connect("/ws/%2B39000000001") as websocket:
+            websocket.send_json({"event": "connected", "streamSid": "MZ-metrics"})
+            for frame in genera_audio(1.0, True) + genera_audio(1.2, False):
+                websocket.send_json({
+                    "event": "media",
+                    "streamSid": "MZ-metrics",
+                    "media": {"payload": base64.b64encode(frame).decode("utf-8")}
+                })
+                time.sleep(0.005)  # la coda dei frame è limitata: si evita di saturarla
+            assert websocket.receive_json()["event"] == "media"
+            testo = client.get("/metrics").text
+            assert "receptionist_active_calls 1" in testo
+            websocket.send_json({"event": "stop", "streamSid": "MZ-metrics"})
+
+        # Il turno viene registrato quando l'ultimo frame è stato inviato
+        for _ in range(50):
+            testo = client.get("/metrics").text
+            if 'receptionist_turn_seconds_count{tenant="+39000000001"}' in testo:
+                break
+            time.sleep(0.1)
+
+    # La trascrizione è partita durante il silenzio finale: il WAV non è sul percorso critico del turno
+    for fase in ("transcription", "tenant_lookup", "completion", "synthesis", "transcode", "send"):
+        assert f'receptionist_stage_seconds_count{{tenant="+39000000001",stage="{fase}"}} 1' in testo, fase
+    assert 'receptionist_speculative_transcriptions_total{outcome="committed"}' in testo
+    assert 'receptionist_turn_first_audio_seconds_count{tenant="+39000000001"} 1' in testo
+    assert "receptionist_inbound_frames_per_second" in testo
+    assert "receptionist_active_calls 0" in testo
+    print("✅ /metrics espone latenze per fase, chiamate attive e frame al secondo")
+
+
+if __name__ == "__main__":
+    print("🧪 Test metriche")
+    print("=" * 50)
+    test_istogramma_cumulativo()
+    test_fasi_del_turno_e_limite_ristoranti()
+    test_frame_al_secondo()
+    test_endpoint_metrics_dopo_una_chiamata()
+    print("\n🎉 Tutti i test sono passati!")
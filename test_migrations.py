@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Test per verificare il runner delle migrazioni e il controllo della versione all'avvio
+"""
+import asyncio
+import logging
+
+import database.migrations as migrations
+from database.migrations import MIGRATIONS, LATEST_VERSION, Migration, check_schema_version, upgrade
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class FakeTransaction:
+    def __init__(self, connection):
+        self.connection = connection
+
+    async def __aenter__(self):
+        self.snapshot = set(self.connection.versioni)
+
+    async def __aexit__(self, exc_type, *exc):
+        if exc_type is not None:
+            self.connection.versioni = self.snapshot  # rollback
+        return False
+
+
+class FakeConnection:
+    """Connessione finta che conserva solo il contenuto di schema_version"""
+
+    def __init__(self, versioni=None):
+        self.versioni = set(versioni) if versioni is not None else None
+        self.eseguite = []
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    async def execute(self, sql, *args):
+        self.eseguite.append(sql.strip().split()[0])
+        if "CREATE TABLE IF NOT EXISTS schema_version" in sql and self.versioni is None:
+            self.versioni = set()
+        if sql.startswith("INSERT INTO schema_version"):
+            self.versioni.add(args[0])
+
+    async def fetch(self, sql, *args):
+        return [{'versione': v} for v in sorted(self.versioni)]
+
+    async def fetchval(self, sql, *args):
+        if "to_regclass('schema_version')" in sql:
+            return None if self.versioni is None else "schema_version"
+        return max(self.versioni, default=0)
+
+
+def test_versioni_in_ordine():
+    """Le versioni sono consecutive a partire da 1"""
+    assert [m.versione for m in MIGRATIONS] == list(range(1, len(MIGRATIONS) + 1))
+    assert LATEST_VERSION == MIGRATIONS[-1].versione
+    print(f"✅ {len(MIGRATIONS)} migrazioni, ultima versione {LATEST_VERSION}")
+
+
+def test_applica_solo_le_mancanti():
+    """Le migrazioni già registrate vengono saltate, le altre applicate in ordine"""
+    applicate = []
+
+    def passo(versione):
+        async def apply(connection):
+            applicate.append(versione)
+        return apply
+
+    originali = migrations.MIGRATIONS
+    migrations.MIGRATIONS = [Migration(v, f"passo {v}", passo(v)) for v in (1, 2, 3)]
+    try:
+        connection = FakeConnection({1})
+        risultato = asyncio.run(upgrade(connection))
+        assert applicate == [2, 3] and [m.versione for m in risultato] == [2, 3]
+        assert connection.versioni == {1, 2, 3}
+        assert asyncio.run(upgrade(connection)) == []
+    finally:
+        migrations.MIGRATIONS = originali
+    print("✅ Solo le migrazioni mancanti vengono applicate")
+
+
+def test_migrazione_fallita_non_registrata():
+    """Se una migrazione fallisce la sua versione non viene registrata e le successive non partono"""
+    async def rotta(connection):
+        raise RuntimeError("DDL non valida")
+
+    async def dopo(connection):
+        raise AssertionError("Eseguita una migrazione dopo un errore")
+
+    originali = migrations.MIGRATIONS
+    migrations.MIGRATIONS = [Migration(1, "rotta", rotta), Migration(2, "dopo", dopo)]
+    connection = FakeConnection()
+    try:
+        asyncio.run(upgrade(connection))
+        assert False, "Errore non propagato"
+    except RuntimeError:
+        pass
+    finally:
+        migrations.MIGRATIONS = originali
+    assert connection.versioni == set()
+    assert connection.eseguite[-1] == "SELECT"  # lock consultivo rilasciato
+    print("✅ Migrazione fallita non registrata, lock rilasciato")
+
+
+def test_controllo_all_avvio():
+    """All'avvio si legge solo la versione, senza DDL"""
+    nuovo = FakeConnection()
+    assert asyncio.run(check_schema_version(nuovo)) == 0
+    aggiornato = FakeConnection(set(range(1, LATEST_VERSION + 1)))
+    assert asyncio.run(check_schema_version(aggiornato)) == LATEST_VERSION
+    assert nuovo.eseguite == [] and aggiornato.eseguite == []
+    print("✅ Controllo della versione senza DDL")
+
+
+if __name__ == "__main__":
+    print("🧪 Test migrazioni")
+    print("=" * 50)
+    test_versioni_in_ordine()
+    test_applica_solo_le_mancanti()
+    test_migrazione_fallita_non_registrata()
+    test_controllo_all_avvio()
+    print("\n🎉 Tutti i test sono passati!")
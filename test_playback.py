@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Test per verificare la riproduzione TTS in streaming verso Twilio
+"""
+import logging
+import math
+
+import numpy as np
+
+from audio.codec import PolyphaseResampler, ulaw_encode
+from audio.playback import StreamingTranscoder
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def genera_pcm_24k(secondi: float) -> bytes:
+    """Tono a 440Hz, PCM 16-bit a 24kHz come quello di OpenAI TTS"""
+    campioni = int(24000 * secondi)
+    return b"".join(
+        int(10000 * math.sin(2 * math.pi * 440 * n / 24000)).to_bytes(2, "little", signed=True)
+        for n in range(campioni)
+    )
+
+
+def test_transcoder_a_blocchi_uguale_a_conversione_intera():
+    """Il ricampionamento a blocchi (anche dispari) produce lo stesso audio della conversione intera"""
+    pcm = genera_pcm_24k(1.0)
+    atteso = ulaw_encode(PolyphaseResampler().process(np.frombuffer(pcm, dtype=np.int16)))
+
+    transcoder = StreamingTranscoder()
+    frames = []
+    for i in range(0, len(pcm), 4801):  # blocchi dispari: tagliano a metà i campioni
+        frames.extend(transcoder.feed(pcm[i:i + 4801]))
+    frames.extend(transcoder.flush())
+
+    assert all(len(f) == 160 for f in frames)
+    assert b"".join(frames)[:len(atteso)] == atteso
+    print(f"✅ {len(frames)} frame da 20ms identici alla conversione intera")
+
+
+if __name__ == "__main__":
+    test_transcoder_a_blocchi_uguale_a_conversione_intera()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Test per verificare la modalità realtime: stream Twilio collegato a una sessione speech-to-speech
+(il sostituto locale di openai_standin.py) con audio µ-law in entrambe le direzioni
+"""
+import asyncio
+import base64
+import logging
+import time
+from contextlib import ExitStack
+
+from fastapi.testclient import TestClient
+
+import openai_standin
+from ai.local_provider import LocalLatency, create_local_providers
+from ai.realtime import RealtimeClient, realtime_url
+from call.realtime import RealtimeBridge
+from call.session import CallSession
+from config import TWILIO_BYTES_PER_FRAME
+from database.tenant_settings import compile_settings
+from load_test import ServerThread
+from test_pipeline import genera_frame
+from testutils import FakeWebSocket, main_isolato
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PORTA_STANDIN = 8767
+MARIO = {"id": 1, "nome_ristorante": "Trattoria da Mario", "numero_twilio": "+39021111111",
+         "system_prompt": "Sei l'assistente della Trattoria da Mario.",
+         "settings": compile_settings({"modalita": "realtime", "silenzio_fine_turno_ms": "300"})}
+
+risorse = ExitStack()
+
+
+def setup_module(module=None):
+    """Avvia il sostituto locale della sessione realtime (openai_standin.py) e isola i globali di main"""
+    risorse.enter_context(main_isolato())
+    standin = ServerThread(openai_standin.app, PORTA_STANDIN)
+    standin.start()
+    risorse.callback(standin.stop)
+    standin.wait_started()
+
+
+def teardown_module(module=None):
+    risorse.close()
+
+
+def prepara(url: str = f"ws://127.0.0.1:{PORTA_STANDIN}/v1/realtime"):
+    import main
+
+    main.realtime = RealtimeClient(url, "sk-local")
+    main.providers = create_local_providers(LocalLatency())
+    main.greetings = None
+    main.db_manager.tenant_cache.set(MARIO["numero_twilio"], MARIO)
+    return main
+
+
+def invia(websocket, parlato: bool, quanti: int):
+    for i in range(quanti):
+        websocket.send_json({"event": "media", "streamSid": "MZ-realtime",
+                             "media": {"payload": base64.b64encode(genera_frame(parlato, i)).decode()}})
+        if i % 10 == 9:
+            time.sleep(0.02)
+
+
+def avvia_chiamata(websocket):
+    websocket.send_json({"event": "start", "streamSid": "MZ-realtime", "start": {"callSid": "CA-1"}})
+    time.sleep(0.1)  # sessione realtime aperta
+    invia(websocket, True, 50)
+    invia(websocket, False, 25)
+
+
+def test_risposta_in_ulaw_nativo():
+    """La risposta della sessione arriva a Twilio byte per byte, senza transcodifica, seguita da un marker"""
+    main = prepara()
+    openai_standin.latency = LocalLatency(llm_first_token_ms=50, tts_realtime_factor=20)
+    prima = main.metrics.turns_by_route.values.get((MARIO["numero_twilio"], "realtime"), 0)
+
+    client = TestClient(main.app)
+    with client.websocket_connect("/ws/%2B39021111111") as websocket:
+        avvia_chiamata(websocket)
+        audio = bytearray()
+        inizio = time.perf_counter()
+        while True:
+            message = websocket.receive_json()
+            if message["event"] == "media":
+                if not audio:
+                    latenza = time.perf_counter() - inizio
+                audio.extend(base64.b64decode(message["media"]["payload"]))
+            elif message["event"] == "mark":
+                break
+        websocket.send_json({"event": "mark", "streamSid": "MZ-realtime", "mark": message["mark"]})
+
+    assert bytes(audio) == openai_standin.realtime_audio()
+    dopo = main.metrics.turns_by_route.values[(MARIO["numero_twilio"], "realtime")]
+    assert dopo - prima == 1
+    assert openai_standin.realtime_events["session.update"] >= 1
+    print(f"✅ Risposta realtime inoltrata senza transcodifica ({len(audio)} byte, primo audio dopo {latenza * 1000:.0f}ms)")
+
+
+def test_barge_in_realtime():
+    """Se il chiamante parla sopra la risposta: 'clear' a Twilio e item troncato nella sessione"""
+    main = prepara()
+    openai_standin.latency = LocalLatency(llm_first_token_ms=50, tts_realtime_factor=1)
+    troncati = openai_standin.realtime_events["conversation.item.truncate"]
+    prima = main.session_registry.stats()['barge_ins']
+
+    client = TestClient(main.app)
+    with client.websocket_connect("/ws/%2B39021111111") as websocket:
+        avvia_chiamata(websocket)
+        while websocket.receive_json()["event"] != "media":
+            pass
+        invia(websocket, True, 20)  # il chiamante interrompe
+        while websocket.receive_json()["event"] != "clear":
+            pass
+        time.sleep(0.1)
+
+    assert openai_standin.realtime_events["conversation.item.truncate"] - troncati == 1
+    assert main.session_registry.stats()['barge_ins'] - prima == 1
+    print("✅ Barge-in: audio scartato da Twilio e risposta troncata nella sessione")
+
+
+def test_eventi_non_bloccati_dal_saluto():
+    """L'audio della risposta attende il saluto in un task a parte: gli eventi della sessione no"""
+    async def main():
+        websocket = FakeWebSocket()
+        session = CallSession(websocket=websocket, numero_chiamato=MARIO["numero_twilio"])
+        session.start("MZ-saluto")
+        session.greeting_task = asyncio.create_task(asyncio.sleep(0.2))  # saluto in riproduzione
+        bridge = RealtimeBridge(session, None, MARIO["settings"], "prompt")
+        session.tasks.spawn(bridge._play_loop())
+
+        delta = base64.b64encode(bytes(TWILIO_BYTES_PER_FRAME)).decode()
+        for event in ({"type": "response.created", "response": {"id": "resp-1"}},
+                      {"type": "response.audio.delta", "response_id": "resp-1", "item_id": "item-1", "delta": delta},
+                      {"type": "response.done", "response": {"id": "resp-1", "status": "completed"}}):
+            await asyncio.wait_for(bridge._handle(event), timeout=0.05)
+        await asyncio.sleep(0.05)
+        durante = list(websocket.messaggi)
+        await asyncio.sleep(0.3)
+        await session.tasks.cancel(1)
+        return durante, websocket
+
+    durante, websocket = asyncio.run(main())
+    assert durante == []
+    assert [m["event"] for m in websocket.messaggi] == ["media", "mark"]
+    print("✅ Risposta inoltrata dopo il saluto, senza fermare gli eventi della sessione")
+
+
+def test_ritorno_alla_pipeline():
+    """Se la sessione realtime non si apre la chiamata prosegue con STT → LLM → TTS"""
+    main = prepara("ws://127.0.0.1:9/v1/realtime")
+    client = TestClient(main.app)
+    with client.websocket_connect("/ws/%2B39021111111") as websocket:
+        avvia_chiamata(websocket)
+        invia(websocket, False, 40)
+        while websocket.receive_json()["event"] != "media":
+            pass
+    print("✅ Sessione realtime non disponibile: risposta dalla pipeline")
+
+
+def test_configurazione_della_sessione():
+    """µ-law in entrambe le direzioni, fine del turno e voce del ristorante"""
+    settings = compile_settings({"modalita": "realtime", "voce": "echo", "silenzio_fine_turno_ms": "600"})
+    config = RealtimeClient.session_config(settings, "prompt")
+    assert config["input_audio_format"] == config["output_audio_format"] == "g711_ulaw"
+    assert config["turn_detection"]["type"] == "server_vad"
+    assert config["turn_detection"]["silence_duration_ms"] == 600
+    assert config["voice"] == "echo"
+    # Voce TTS che non esiste in realtime: si usa quella di default
+    assert RealtimeClient.session_config(compile_settings({"voce": "nova"}), "prompt")["voice"] == "alloy"
+    assert compile_settings({"modalita": "streaming"}).call_mode == "pipeline"
+
+    assert realtime_url("http://127.0.0.1:8001/v1") == "ws://127.0.0.1:8001/v1/realtime"
+    assert realtime_url("https://api.openai.com/v1/") == "wss://api.openai.com/v1/realtime"
+    print("✅ Sessione g711_ulaw con VAD lato server e voce del ristorante")
+
+
+if __name__ == "__main__":
+    print("🧪 Test modalità realtime")
+    print("=" * 50)
+    setup_module()
+    try:
+        test_configurazione_della_sessione()
+        test_risposta_in_ulaw_nativo()
+        test_barge_in_realtime()
+        test_eventi_non_bloccati_dal_saluto()
+        test_ritorno_alla_pipeline()
+    finally:
+        teardown_module()
+    print("\n🎉 Tutti i test sono passati!")
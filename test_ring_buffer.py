@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Test per verificare il buffer circolare dell'audio del chiamante
+"""
+import logging
+
+from audio.ring_buffer import SpeechRingBuffer, BYTES_PER_MS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FRAME = 30 * BYTES_PER_MS  # un frame VAD da 30ms
+
+
+def scrivi_frame(buffer: SpeechRingBuffer, valore: int, parlato: bool):
+    buffer.write(bytes([valore]) * FRAME)
+    if parlato:
+        buffer.mark_speech(buffer.written, FRAME)
+
+
+def test_solo_intervallo_di_parlato():
+    """Il turno contiene pre-roll, parlato e silenzio finale limitato, non il silenzio iniziale"""
+    buffer = SpeechRingBuffer(max_turn_ms=10_000, preroll_ms=60, trailing_ms=30)
+    for _ in range(100):           # 3 secondi di silenzio iniziale
+        scrivi_frame(buffer, 0, parlato=False)
+    for _ in range(10):            # 300ms di parlato
+        scrivi_frame(buffer, 1, parlato=True)
+    for _ in range(25):            # 750ms di silenzio che chiude il turno
+        scrivi_frame(buffer, 2, parlato=False)
+
+    turno = buffer.take_speech()
+    assert turno == bytes([0]) * 2 * FRAME + bytes([1]) * 10 * FRAME + bytes([2]) * FRAME
+    assert not buffer.has_speech
+    print(f"✅ Turno ridotto a {len(turno)} byte invece di {buffer.written}")
+
+
+def test_memoria_limitata():
+    """Il buffer non cresce oltre la capacità e segnala quando il turno è troppo lungo"""
+    buffer = SpeechRingBuffer(max_turn_ms=330, preroll_ms=30, trailing_ms=30)
+    for _ in range(1000):
+        scrivi_frame(buffer, 0, parlato=False)
+    assert len(buffer._buffer) == buffer.capacity
+    assert not buffer.is_full()
+
+    for i in range(10):
+        assert not buffer.is_full()
+        scrivi_frame(buffer, i, parlato=True)
+    assert buffer.is_full()
+    turno = buffer.take_speech()
+    assert turno[-FRAME:] == bytes([9]) * FRAME
+    assert len(turno) == 11 * FRAME
+    print("✅ Memoria limitata e turno massimo rispettato")
+
+
+if __name__ == "__main__":
+    test_solo_intervallo_di_parlato()
+    test_memoria_limitata()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Test per verificare la pipeline LLM → TTS frase per frase
+"""
+import asyncio
+import base64
+import logging
+
+import numpy as np
+
+from audio.codec import ulaw_decode
+from ai.sentences import SentenceSplitter, split_sentences
+from audio.playback import stream_segments_to_twilio
+from testutils import FakeWebSocket
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RISPOSTA = ("Certo! Siamo aperti dal martedì alla domenica, dalle 19:00 alle 23:00. "
+            "Il lunedì siamo chiusi. Ci trovi in Via Roma 123, Milano: vicino al Duomo. Ti aspettiamo!")
+
+
+async def token_stream(testo: str, passo: int = 4):
+    for i in range(0, len(testo), passo):
+        await asyncio.sleep(0)
+        yield testo[i:i + passo]
+
+
+def test_suddivisione_frasi():
+    """Le frasi vengono spezzate alla punteggiatura, senza rompere orari e numeri"""
+    splitter = SentenceSplitter(min_chars=20, max_chars=200)
+    segmenti = []
+    for i in range(0, len(RISPOSTA), 3):
+        segmenti.extend(splitter.feed(RISPOSTA[i:i + 3]))
+    segmenti.extend(splitter.flush())
+
+    assert segmenti[0] == "Certo! Siamo aperti dal martedì alla domenica, dalle 19:00 alle 23:00."
+    assert segmenti[1] == "Il lunedì siamo chiusi."
+    assert " ".join(segmenti) == RISPOSTA
+    print(f"✅ {len(segmenti)} segmenti: {segmenti}")
+
+
+def test_testo_lungo_senza_punteggiatura():
+    """Un testo senza punteggiatura viene comunque spezzato entro max_chars"""
+    splitter = SentenceSplitter(min_chars=20, max_chars=50)
+    segmenti = splitter.feed("parola " * 30) + splitter.flush()
+    assert len(segmenti) > 1
+    assert all(len(s) <= 50 for s in segmenti)
+    print("✅ Testo lungo spezzato")
+
+
+def test_audio_in_ordine_anche_se_la_sintesi_finisce_prima():
+    """Il secondo segmento, sintetizzato più velocemente, viene riprodotto dopo il primo"""
+    websocket = FakeWebSocket()
+    segmenti_sintetizzati = []
+
+    async def sintesi_finta(testo: str):
+        indice = len(segmenti_sintetizzati) + 1
+        segmenti_sintetizzati.append(testo)
+        # Il primo segmento è lento, i successivi veloci
+        await asyncio.sleep(0.05 if indice == 1 else 0)
+        # 100ms di PCM costante: il livello identifica il segmento
+        yield (indice * 2000).to_bytes(2, "little", signed=True) * 2400
+
+    async def main():
+        segmenti = split_sentences(token_stream(RISPOSTA))
+        return await stream_segments_to_twilio(websocket, "stream-test", segmenti, sintesi_finta)
+
+    frames = asyncio.run(main())
+    assert len(segmenti_sintetizzati) == 4
+    assert frames == len(websocket.messaggi)
+
+    livelli = []
+    for messaggio in websocket.messaggi:
+        pcm = ulaw_decode(base64.b64decode(messaggio["media"]["payload"]))
+        livelli.append(round(int(np.abs(pcm).max()) / 2000))
+    assert livelli == sorted(livelli), f"Segmenti fuori ordine: {livelli}"
+    assert livelli[0] == 1 and livelli[-1] == 4
+    print(f"✅ {frames} frame riprodotti in ordine")
+
+
+if __name__ == "__main__":
+    test_suddivisione_frasi()
+    test_testo_lungo_senza_punteggiatura()
+    test_audio_in_ordine_anche_se_la_sintesi_finisce_prima()
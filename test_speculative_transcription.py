@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Test per verificare la trascrizione speculativa e le soglie di fine turno configurabili
+"""
+import asyncio
+import logging
+
+from call.session import CallSession
+from call.pipeline import CallPipeline, DROP_OLDEST
+from metrics.registry import metrics, SPECULATION_COMMITTED, SPECULATION_DISCARDED
+from test_pipeline import genera_frame
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Trascrittore:
+    """STT finto che registra l'audio ricevuto e quante trascrizioni sono state annullate"""
+
+    def __init__(self, latenza: float = 0.05):
+        self.latenza = latenza
+        self.audio = []
+        self.annullate = 0
+
+    async def __call__(self, audio: bytes) -> str:
+        self.audio.append(audio)
+        try:
+            await asyncio.sleep(self.latenza)
+        except asyncio.CancelledError:
+            self.annullate += 1
+            raise
+        return f"trascrizione {len(self.audio)}"
+
+
+def esiti():
+    valori = metrics.speculative_transcriptions.values
+    return valori.get((SPECULATION_COMMITTED,), 0), valori.get((SPECULATION_DISCARDED,), 0)
+
+
+async def invia(pipeline: CallPipeline, parlato: bool, quanti: int):
+    """Invia frame da 20ms alla pipeline e lascia lavorare il VAD"""
+    for i in range(quanti):
+        pipeline.push_frame(genera_frame(parlato, i))
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.02)
+
+
+def esegui(sequenza, trascrittore=None, **soglie):
+    """Esegue una sequenza di (parlato, frame) e ritorna i turni ricevuti dal gestore"""
+    turni = []
+
+    async def gestore(session, audio, transcription=None):
+        testo = await transcription if transcription is not None else None
+        turni.append((audio, testo))
+
+    async def main():
+        session = CallSession(websocket=None, numero_chiamato="+39021111111")
+        pipeline = CallPipeline(session, gestore, transcribe=trascrittore, **soglie)
+        pipeline.start()
+        for parlato, quanti in sequenza:
+            await invia(pipeline, parlato, quanti)
+        await asyncio.sleep(0.2)
+        await pipeline.stop()
+        return pipeline
+
+    pipeline = asyncio.run(main())
+    return turni, pipeline
+
+
+def test_trascrizione_usata_a_fine_turno():
+    """Il silenzio continua fino alla fine del turno: il turno riceve la trascrizione già avviata"""
+    trascrittore = Trascrittore()
+    prima = esiti()
+    turni, _ = esegui([(True, 50), (False, 60)], trascrittore)
+    usate, scartate = esiti()
+
+    assert len(turni) == 1 and len(trascrittore.audio) == 1
+    audio, testo = turni[0]
+    assert testo == "trascrizione 1"
+    # La trascrizione speculativa copre esattamente l'audio del turno
+    assert trascrittore.audio[0] == audio
+    assert (usate - prima[0], scartate - prima[1]) == (1, 0)
+    print(f"✅ Trascrizione speculativa usata ({len(audio)} byte di audio)")
+
+
+def test_trascrizione_scartata_se_il_chiamante_riprende():
+    """Una pausa breve avvia la trascrizione, che viene annullata quando il chiamante riprende"""
+    trascrittore = Trascrittore(latenza=0.1)
+    prima = esiti()
+    turni, _ = esegui([(True, 50), (False, 20), (True, 40), (False, 60)], trascrittore)
+    usate, scartate = esiti()
+
+    assert len(turni) == 1, f"Turni: {len(turni)}"
+    audio, testo = turni[0]
+    assert len(trascrittore.audio) == 2 and trascrittore.annullate == 1
+    assert trascrittore.audio[1] == audio and len(audio) > len(trascrittore.audio[0])
+    assert testo == "trascrizione 2"
+    assert (usate - prima[0], scartate - prima[1]) == (1, 1)
+    print("✅ Trascrizione scartata quando il chiamante riprende a parlare")
+
+
+def test_trascrizione_scartata_con_il_turno():
+    """Un turno scartato dalla coda (AI occupata) scarta anche la sua trascrizione speculativa"""
+    trascrittore = Trascrittore()
+    turni = []
+
+    async def gestore_lento(session, audio, transcription=None):
+        turni.append(await transcription)
+        if len(turni) == 1:
+            await asyncio.sleep(0.5)  # i due turni successivi arrivano mentre l'AI è occupata
+
+    async def main():
+        session = CallSession(websocket=None, numero_chiamato="+39021111111")
+        pipeline = CallPipeline(session, gestore_lento, transcribe=trascrittore)
+        pipeline.turns.policy = DROP_OLDEST
+        pipeline.barge_in_frames = 0  # come con BARGE_IN_ENABLED=false: il chiamante non interrompe
+        pipeline.start()
+        for _ in range(3):
+            await invia(pipeline, True, 50)
+            await invia(pipeline, False, 60)
+        await asyncio.sleep(0.7)
+        await pipeline.stop()
+        return pipeline
+
+    prima = esiti()
+    pipeline = asyncio.run(main())
+    usate, scartate = esiti()
+
+    # Con la coda da un turno il secondo viene sostituito dal terzo
+    assert pipeline.turns_dropped == 1 and turni == ["trascrizione 1", "trascrizione 3"]
+    assert (usate - prima[0], scartate - prima[1]) == (2, 1)
+    print("✅ Trascrizione del turno scartato contata come scartata, non come usata")
+
+
+def test_soglie_configurabili():
+    """La fine del turno segue ENDPOINT_SILENCE_MS; senza trascrittore non c'è speculazione"""
+    turni, pipeline = esegui([(True, 50), (False, 30), (True, 40), (False, 60)], endpoint_silence_ms=300)
+    assert pipeline.endpoint_frames == 10 and pipeline.speculative_frames == 0
+    assert len(turni) == 2 and all(testo is None for _, testo in turni)
+
+    # Soglia speculativa non inferiore a quella di fine turno: speculazione disattivata
+    _, pipeline = esegui([], Trascrittore(), endpoint_silence_ms=300, speculative_silence_ms=300)
+    assert pipeline.speculative_frames == 0
+    print("✅ Soglie di fine turno e di speculazione configurabili")
+
+
+if __name__ == "__main__":
+    print("🧪 Test trascrizione speculativa")
+    print("=" * 50)
+    test_trascrizione_usata_a_fine_turno()
+    test_trascrizione_scartata_se_il_chiamante_riprende()
+    test_trascrizione_scartata_con_il_turno()
+    test_soglie_configurabili()
+    print("\n🎉 Tutti i test sono passati!")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test per verificare la cache dei ristoranti e la sua invalidazione
+"""
+import asyncio
+import json
+import logging
+import time
+
+from database.db_manager import DatabaseManager
+from database.tenant_cache import TenantCache
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MARIO = {"id": 1, "nome_ristorante": "Trattoria da Mario", "numero_twilio": "+39021111111",
+         "system_prompt": "Sei l'assistente della Trattoria da Mario."}
+
+
+def test_ttl_e_dimensione_massima():
+    """Le voci scadono dopo il TTL e la cache non supera la dimensione massima"""
+    cache = TenantCache(ttl_seconds=0.05, max_size=2)
+    cache.set("a", MARIO)
+    cache.set("b", None)
+    cache.set("c", MARIO)
+
+    assert len(cache) == 2 and cache.evictions == 1
+    assert cache.get("a") == (False, None)
+    assert cache.get("b") == (True, None)  # numero sconosciuto memorizzato
+    time.sleep(0.06)
+    assert cache.get("c") == (False, None)
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+    print(f"✅ TTL e LRU rispettati: {stats}")
+
+
+def test_notifica_invalida_e_query_condivise():
+    """Le letture concorrenti condividono una query e una NOTIFY forza la rilettura"""
+    async def main():
+        db = DatabaseManager()
+        letture = []
+
+        async def fetch_finto(numero):
+            letture.append(numero)
+            await asyncio.sleep(0.01)
+            return dict(MARIO)
+
+        db._fetch_restaurant_by_phone = fetch_finto
+
+        risultati = await asyncio.gather(*(db.get_restaurant_by_phone("+39021111111") for _ in range(10)))
+        assert all(r["nome_ristorante"] == "Trattoria da Mario" for r in risultati)
+        assert len(letture) == 1
+
+        await db.get_restaurant_by_phone("+39021111111")
+        assert len(letture) == 1
+
+        payload = json.dumps({"op": "UPDATE", "numeri": ["+39021111111"]})
+        db._on_tenant_notify(None, 0, "ristoranti_changed", payload)
+        await db.get_restaurant_by_phone("+39021111111")
+        assert len(letture) == 2
+        return db.tenant_cache.stats()
+
+    stats = asyncio.run(main())
+    assert stats["hits"] == 1 and stats["invalidations"] == 1
+    print(f"✅ Invalidazione via NOTIFY: {stats}")
+
+
+def test_notifica_durante_la_lettura_non_lascia_dati_vecchi():
+    """Una NOTIFY arrivata mentre la query è in corso impedisce di memorizzarne il risultato"""
+    async def main():
+        db = DatabaseManager()
+
+        async def fetch_lento(numero):
+            await asyncio.sleep(0.01)
+            return dict(MARIO)
+
+        db._fetch_restaurant_by_phone = fetch_lento
+        lettura = asyncio.create_task(db.get_restaurant_by_phone("+39021111111"))
+        await asyncio.sleep(0)
+        db._on_tenant_notify(None, 0, "ristoranti_changed", "non-json")
+        await lettura
+        return db.tenant_cache.get("+39021111111")
+
+    assert asyncio.run(main()) == (False, None)
+    print("✅ Nessun dato vecchio in cache")
+
+
+def test_lettura_annullata_non_blocca_le_altre():
+    """Se la chiamata che esegue la query viene annullata, chi attendeva la stessa query riprova"""
+    async def main():
+        db = DatabaseManager()
+        letture = []
+
+        async def fetch_lento(numero):
+            letture.append(numero)
+            await asyncio.sleep(0.05)
+            return dict(MARIO)
+
+        db._fetch_restaurant_by_phone = fetch_lento
+        prima = asyncio.create_task(db.get_restaurant_by_phone("+39021111111"))
+        await asyncio.sleep(0)
+        seconda = asyncio.create_task(db.get_restaurant_by_phone("+39021111111"))
+        await asyncio.sleep(0.01)
+        prima.cancel()  # es. barge-in durante il lookup
+        restaurant = await asyncio.wait_for(seconda, timeout=1)
+        assert prima.cancelled()
+        return restaurant, letture
+
+    restaurant, letture = asyncio.run(main())
+    assert restaurant["nome_ristorante"] == "Trattoria da Mario" and len(letture) == 2
+    print("✅ Lookup annullato: la chiamata in attesa rilegge il ristorante")
+
+
+if __name__ == "__main__":
+    test_ttl_e_dimensione_massima()
+    test_notifica_invalida_e_query_condivise()
+    test_notifica_durante_la_lettura_non_lascia_dati_vecchi()
+    test_lettura_annullata_non_blocca_le_altre()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Test per verificare le impostazioni per ristorante compilate dalla tabella configurazioni
+"""
+import dataclasses
+import json
+import logging
+
+from openai import AsyncOpenAI
+
+from ai.openai_provider import OpenAILanguageModel, OpenAISpeechToText, OpenAITextToSpeech
+from ai.providers import AIProviders
+from call.pipeline import CallPipeline
+from call.session import CallSession
+from database.db_manager import restaurant_record
+from database.tenant_settings import DEFAULT_SETTINGS, TenantSettings, compile_settings, settings_for
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def test_compilazione_e_validazione():
+    """Le chiavi valide diventano campi tipizzati, quelle non valide mantengono il default"""
+    settings = compile_settings({
+        "modello_llm": "gpt-4o",
+        "temperatura": "0.2",
+        "voce": "alloy",
+        "vad_aggressivita": "2",
+        "silenzio_fine_turno_ms": "600",
+        "barge_in_parlato_ms": "abc",    # non numerico
+        "modello_stt": "   ",            # vuoto
+        "silenzio_speculativo_ms": "10",  # sotto il minimo
+        "saluto": "Buonasera!",          # letto altrove
+    }, "+39021111111")
+
+    assert settings.llm_model == "gpt-4o" and settings.llm_temperature == 0.2
+    assert settings.tts_voice == "alloy" and settings.vad_aggressiveness == 2
+    assert settings.endpoint_silence_ms == 600
+    assert settings.barge_in_min_speech_ms == DEFAULT_SETTINGS.barge_in_min_speech_ms
+    assert settings.stt_model == DEFAULT_SETTINGS.stt_model
+    assert settings.speculative_silence_ms == DEFAULT_SETTINGS.speculative_silence_ms
+
+    assert compile_settings({"voce": "robot"}) is DEFAULT_SETTINGS
+    assert compile_settings({}) is DEFAULT_SETTINGS
+    try:
+        settings.llm_model = "altro"
+        raise AssertionError("Impostazioni modificabili")
+    except dataclasses.FrozenInstanceError:
+        pass
+    print("✅ Configurazioni compilate e validate in impostazioni immutabili")
+
+
+def test_record_del_ristorante():
+    """Il record in cache contiene le impostazioni già compilate al posto delle righe grezze"""
+    row = {"id": 1, "nome_ristorante": "Trattoria da Mario", "numero_twilio": "+39021111111",
+           "saluto": None, "configurazioni": json.dumps({"voce": "echo", "temperatura": "0.3"})}
+    restaurant = restaurant_record(row)
+    assert "configurazioni" not in restaurant
+    assert isinstance(restaurant["settings"], TenantSettings)
+    assert restaurant["settings"].tts_voice == "echo" and restaurant["settings"].llm_temperature == 0.3
+
+    senza = restaurant_record({**row, "configurazioni": None})
+    assert senza["settings"] is DEFAULT_SETTINGS
+    assert settings_for(None) is DEFAULT_SETTINGS and settings_for({"id": 2}) is DEFAULT_SETTINGS
+    print("✅ Impostazioni compilate una volta con il record del ristorante")
+
+
+def test_provider_per_ristorante():
+    """Modelli, voce e temperatura del ristorante arrivano ai provider, senza ricrearli a ogni turno"""
+    client = AsyncOpenAI(api_key="sk-test", base_url="http://127.0.0.1:9")
+    providers = AIProviders("openai", OpenAISpeechToText(client), OpenAILanguageModel(client),
+                            OpenAITextToSpeech(client))
+
+    assert providers.with_settings(None) is providers
+    default = providers.with_settings(DEFAULT_SETTINGS)
+    assert default.stt is providers.stt and default.llm is providers.llm and default.tts is providers.tts
+
+    settings = compile_settings({"modello_llm": "gpt-4o", "temperatura": "0.1", "voce": "onyx"})
+    tenant = providers.with_settings(settings)
+    assert tenant.llm.model == "gpt-4o" and tenant.llm.temperature == 0.1
+    assert tenant.tts.voice == "onyx" and tenant.tts.cache_namespace != providers.tts.cache_namespace
+    assert tenant.stt is providers.stt and tenant.llm.client is client
+    assert providers.with_settings(compile_settings({"modello_llm": "gpt-4o", "temperatura": "0.1",
+                                                     "voce": "onyx"})) is tenant
+    print("✅ Provider con modelli e voce del ristorante")
+
+
+def test_soglie_della_chiamata():
+    """La pipeline applica VAD e soglie del ristorante chiamato"""
+    session = CallSession(websocket=None, numero_chiamato="+39021111111")
+
+    async def turno(session, audio, transcription=None):
+        pass
+
+    async def trascrivi(audio):
+        return ""
+
+    pipeline = CallPipeline(session, turno, transcribe=trascrivi)
+    settings = compile_settings({"vad_aggressivita": "1", "silenzio_fine_turno_ms": "900",
+                                 "silenzio_speculativo_ms": "450", "barge_in_parlato_ms": "600"})
+    pipeline.configure(settings)
+    assert session.settings is settings
+    assert (pipeline.endpoint_frames, pipeline.speculative_frames, pipeline.barge_in_frames) == (30, 15, 20)
+
+    # Soglia speculativa oltre la fine del turno: nessuna speculazione
+    pipeline.configure(compile_settings({"silenzio_fine_turno_ms": "300", "silenzio_speculativo_ms": "450"}))
+    assert pipeline.endpoint_frames == 10 and pipeline.speculative_frames == 0
+    print("✅ VAD e soglie di fine turno per ristorante")
+
+
+if __name__ == "__main__":
+    print("🧪 Test impostazioni per ristorante")
+    print("=" * 50)
+    test_compilazione_e_validazione()
+    test_record_del_ristorante()
+    test_provider_per_ristorante()
+    test_soglie_della_chiamata()
+    print("\n🎉 Tutti i test sono passati!")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Test per verificare la cache dell'audio TTS (memoria LRU e archivio su disco)
+"""
+import asyncio
+import logging
+import os
+import tempfile
+
+from audio.tts_cache import TTSCache, cache_key, normalize_text
+from audio.playback import synthesize_ulaw
+from metrics.registry import TurnSpans
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def test_chiave_di_contenuto():
+    """Spazi e forma Unicode non cambiano la chiave; voce e modello sì"""
+    assert normalize_text("  Un attimo,\n  per favore ") == "Un attimo, per favore"
+    assert cache_key("openai:tts-1:nova", "Ciao  Mario") == cache_key("openai:tts-1:nova", " Ciao Mario")
+    assert cache_key("openai:tts-1:nova", "perch\u00e9") == cache_key("openai:tts-1:nova", "perche\u0301")
+    assert cache_key("openai:tts-1:nova", "Ciao") != cache_key("openai:tts-1:alloy", "Ciao")
+    print("✅ Chiave indipendente dalla formattazione del testo")
+
+
+def test_lru_con_budget_in_byte():
+    """Oltre il budget escono le voci usate meno di recente"""
+    async def main():
+        cache = TTSCache(max_bytes=1000, directory=None)
+        await cache.put("a", b"\x01" * 400)
+        await cache.put("b", b"\x02" * 400)
+        assert await cache.get("a") is not None  # "a" diventa la più recente
+        await cache.put("c", b"\x03" * 400)
+        return cache
+
+    cache = asyncio.run(main())
+    assert cache.bytes <= 1000 and cache.evictions == 1
+    stats = cache.stats()
+    assert stats['hits'] == 1 and "b" not in cache._entries
+    print(f"✅ LRU entro il budget: {cache.bytes} byte, {cache.evictions} voce rimossa")
+
+
+def test_archivio_su_disco_sopravvive_al_riavvio():
+    """Una nuova istanza (riavvio) trova l'audio su disco e lo riporta in memoria"""
+    with tempfile.TemporaryDirectory() as cartella:
+        async def main():
+            key = cache_key("ns", "Siamo in Via Roma 123.")
+            await TTSCache(directory=cartella).put(key, b"\x7f" * 1600)
+
+            riavviata = TTSCache(directory=cartella)
+            audio = await riavviata.get(key)
+            di_nuovo = await riavviata.get(key)
+            return riavviata, audio, di_nuovo
+
+        cache, audio, di_nuovo = asyncio.run(main())
+        assert audio == di_nuovo == b"\x7f" * 1600
+        assert cache.disk_hits == 1 and cache.hits == 1
+        file_salvati = [f for _, _, files in os.walk(cartella) for f in files]
+        assert len(file_salvati) == 1 and file_salvati[0].endswith(".ulaw")
+    print("✅ Audio ritrovato su disco dopo il riavvio")
+
+
+def test_pulizia_del_disco():
+    """Oltre il budget su disco vengono rimossi i file usati meno di recente"""
+    with tempfile.TemporaryDirectory() as cartella:
+        async def main():
+            cache = TTSCache(directory=cartella, disk_max_bytes=3000)
+            for i in range(5):
+                await cache.put(f"{i:064x}", bytes([i]) * 1000)
+                os.utime(cache._path(f"{i:064x}"), (i, i))  # ordine di utilizzo esplicito
+            return cache
+
+        cache = asyncio.run(main())
+        rimasti = sorted(f for _, _, files in os.walk(cartella) for f in files)
+        assert sum(os.path.getsize(cache._path(f[:-5])) for f in rimasti) <= 3000
+        assert rimasti[-1].startswith(f"{4:064x}")
+    print(f"✅ Disco entro il budget: {len(rimasti)} file rimasti")
+
+
+def test_scritture_concorrenti_su_disco():
+    """Scritture in parallelo (thread diversi) non perdono byte nel totale su disco"""
+    with tempfile.TemporaryDirectory() as cartella:
+        async def main():
+            cache = TTSCache(directory=cartella, disk_max_bytes=10 ** 9)
+            await cache.put(f"{0:064x}", b"\x01" * 100)
+            await asyncio.gather(*(cache.put(f"{i:064x}", b"\x01" * 100) for i in range(1, 200)))
+            return cache
+
+        cache = asyncio.run(main())
+        assert cache._disk_bytes == 200 * 100
+    print("✅ Totale su disco esatto con scritture concorrenti")
+
+
+def test_seconda_sintesi_dalla_cache():
+    """Il secondo uso dello stesso testo non chiama il TTS e produce gli stessi frame"""
+    chiamate = []
+
+    async def sintesi(testo: str):
+        chiamate.append(testo)
+        for _ in range(3):
+            yield (3000).to_bytes(2, "little", signed=True) * 2400
+            await asyncio.sleep(0)
+
+    async def main():
+        cache = TTSCache(directory=None)
+        spans = TurnSpans(None)
+        prima = [f async for f in synthesize_ulaw("Un attimo per favore.", sintesi, spans, cache, "ns")]
+        seconda = [f async for f in synthesize_ulaw("Un attimo  per favore.", sintesi, spans, cache, "ns")]
+        return cache, prima, seconda
+
+    cache, prima, seconda = asyncio.run(main())
+    assert len(chiamate) == 1
+    assert prima == seconda and all(len(f) == 160 for f in seconda)
+    assert cache.stats()['hit_rate'] == 0.5
+    print(f"✅ Seconda riproduzione dalla cache ({len(seconda)} frame, TTS chiamato una volta)")
+
+
+def test_sintesi_interrotta_non_salvata():
+    """Un errore a metà sintesi non lascia audio parziale in cache"""
+    async def sintesi_rotta(testo: str):
+        yield b"\x00\x10" * 2400
+        raise RuntimeError("connessione persa")
+
+    async def main():
+        cache = TTSCache(directory=None)
+        try:
+            async for _ in synthesize_ulaw("Buonasera!", sintesi_rotta, TurnSpans(None), cache, "ns"):
+                pass
+        except RuntimeError:
+            pass
+        return cache
+
+    assert len(asyncio.run(main())) == 0
+    print("✅ Audio parziale non salvato")
+
+
+if __name__ == "__main__":
+    print("🧪 Test cache TTS")
+    print("=" * 50)
+    test_chiave_di_contenuto()
+    test_lru_con_budget_in_byte()
+    test_archivio_su_disco_sopravvive_al_riavvio()
+    test_pulizia_del_disco()
+    test_scritture_concorrenti_su_disco()
+    test_seconda_sintesi_dalla_cache()
+    test_sintesi_interrotta_non_salvata()
+    print("\n🎉 Tutti i test sono passati!")
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Supporto condiviso dai test: WebSocket finto verso Twilio e isolamento dei globali di main
+"""
+from contextlib import contextmanager
+
+from audio.tts_cache import TTSCache
+
+
+class FakeWebSocket:
+    """Raccoglie i messaggi che sarebbero inviati a Twilio"""
+
+    def __init__(self):
+        self.messaggi = []
+
+    async def send_json(self, message):
+        self.messaggi.append(message)
+
+    def eventi(self, nome):
+        return [m for m in self.messaggi if m["event"] == nome]
+
+
+@contextmanager
+def main_isolato(**globali):
+    """
+    Imposta i globali di main usati da un test e ripristina i precedenti alla fine.
+    Saluti, sessioni realtime e cache TTS partono vuoti se il test non li imposta.
+    """
+    import main
+
+    globali = {"greetings": None, "realtime": None, "tts_cache": TTSCache(directory=None), **globali}
+    precedenti = {nome: getattr(main, nome) for nome in globali}
+    for nome, valore in globali.items():
+        setattr(main, nome, valore)
+    try:
+        yield main
+    finally:
+        for nome, valore in precedenti.items():
+            setattr(main, nome, valore)